@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# aiobot.py
+# Modo asyncio del bot (BOT_ENGINE=asyncio) sobre AsyncTeleBot:
+# - Un event loop en su propio hilo hace el polling y todas las llamadas HTTP a
+#   Telegram (aiohttp): miles de envíos/descargas en vuelo sin un hilo por llamada
+# - Los handlers siguen siendo las mismas funciones síncronas de main.py: corren
+#   en un ThreadPoolExecutor (SQLite, OCR, lógica), no bloquean el loop
+# - SyncBot: la misma interfaz que TeleBot para ese código síncrono (y el
+#   outbox); cada llamada se ejecuta en el loop y espera su resultado
+# - prefetch(m): corrutina opcional antes del handler, p. ej. descargar el
+#   comprobante en el loop (descargas concurrentes, ningún hilo esperando)
+# - run_polling() / stop_polling(): el polling es una tarea del loop; pararlo
+#   la cancela aunque haya un getUpdates colgado (AsyncTeleBot no tiene
+#   stop_polling y su _polling solo se mira entre getUpdates)
+# - spawn(coro): programa en el loop sin esperar (updates del webhook)
+#
+# Uso:
+#   rt = AsyncRuntime(workers=32); rt.start()
+#   abot = AsyncTeleBot(TOKEN)
+#   bot = SyncBot(abot, rt)                      # para handlers y outbox
+#   install(abot, rt, handle_message, router.dispatch_callback, prefetch=...)
+#   rt.run_polling(abot, timeout=20)              # bloquea el hilo que llama
+#   rt.stop_polling()                             # desde otro hilo (supervisor)
+
+import asyncio
+import inspect
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class AsyncRuntime:
+    """Event loop en un hilo propio + executor para el código síncrono."""
+
+    def __init__(self, workers=32):
+        self.workers = workers
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="aio-handler")
+        self._thread = None
+        self._polling_task = None
+        self.restarts = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_loop, name="aio-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop(self):
+        return threading.current_thread() is self._thread
+
+    def run(self, coro, timeout=None):
+        """Ejecuta la corrutina en el loop desde otro hilo y espera el resultado."""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("run() desde el propio loop bloquearía: usar await")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def spawn(self, coro):
+        """Programa la corrutina en el loop y vuelve sin esperarla; sus errores van al log."""
+        fut = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        fut.add_done_callback(_log_failure)
+        return fut
+
+    def run_polling(self, abot, **kwargs):
+        """
+        abot.infinity_polling(**kwargs) en el loop; bloquea hasta que termine o
+        hasta que stop_polling() la cancele.
+        """
+        async def polling():
+            self._polling_task = asyncio.current_task()
+            try:
+                await abot.infinity_polling(**kwargs)
+            finally:
+                self._polling_task = None
+        try:
+            self.run(polling())
+        except (CancelledError, asyncio.CancelledError):
+            pass
+
+    def stop_polling(self):
+        """
+        Cancela la tarea de polling (también un getUpdates colgado); AsyncTeleBot
+        cierra su sesión al salir y run_polling() vuelve. False si no hay polling.
+        """
+        task = self._polling_task
+        if task is None:
+            return False
+        self.loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def call(self, fn, *args):
+        """Awaitable: fn(*args) en el executor (código síncrono, SQLite)."""
+        return self.loop.run_in_executor(self.executor, fn, *args)
+
+    def restart_executor(self):
+        """
+        Executor nuevo para los handlers (lo usa el supervisor). Los hilos
+        colgados del anterior se abandonan; lo que ya estaba en su cola termina allí.
+        """
+        old, self.executor = self.executor, ThreadPoolExecutor(self.workers, thread_name_prefix="aio-handler")
+        self.restarts += 1
+        old.shutdown(wait=False)
+        return True
+
+
+def _log_failure(fut):
+    e = None if fut.cancelled() else fut.exception()
+    if e is not None:
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+
+class SyncBot:
+    """
+    Interfaz síncrona de un AsyncTeleBot: bot.send_message(...) desde un hilo
+    del executor o del outbox corre la corrutina en el loop y devuelve su
+    resultado (las excepciones de la API llegan igual, con error_code).
+    """
+
+    def __init__(self, abot, runtime, timeout=120):
+        self.abot = abot
+        self.runtime = runtime
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        attr = getattr(self.abot, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self.runtime.run(attr(*args, **kwargs), self.timeout)
+        call.__name__ = name
+        return call
+
+
+def install(abot, runtime, on_message, on_callback, prefetch=None, content_types=("text", "photo", "document")):
+    """
+    Registra en abot un handler async de mensajes y uno de callbacks que pasan
+    el update a on_message / on_callback (síncronos) en el executor.
+    """
+    async def message_entry(m):
+        if prefetch is not None:
+            try:
+                await prefetch(m)
+            except Exception:
+                # sin prefetch el handler descarga por su cuenta (SyncBot)
+                traceback.print_exc()
+        await runtime.call(on_message, m)
+
+    async def callback_entry(c):
+        await runtime.call(on_callback, c)
+
+    abot.message_handler(func=lambda m: True, content_types=list(content_types))(message_entry)
+    abot.callback_query_handler(func=lambda c: True)(callback_entry)
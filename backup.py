@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# backup.py
+# Backups incrementales de InversionesCT:
+# - Instantánea de la base con la API de backup en línea (export.open_snapshot),
+#   sin bloquear a los escritores
+# - La instantánea se parte en trozos fijos alineados a páginas; cada trozo se
+#   guarda comprimido y direccionado por su sha256 (chunks/ab/abcd...). Un backup
+#   diario solo escribe los trozos que cambiaron.
+# - comprobantes/ se respalda igual; los archivos con el mismo tamaño/mtime que
+#   en el backup anterior no se vuelven a leer
+# - Retención diaria/semanal/mensual + recolección de trozos sin referencias
+# - Verificación: cada backup se restaura a un temporal y se comprueba hash +
+#   PRAGMA integrity_check
+# - run() y prune() toman un lock de archivo del almacén: el backup diario del
+#   bot y la CLI pueden compartir el mismo directorio
+# - El almacén vive en el mismo disco que la base: la copia fuera del servidor
+#   la hace main.py (BACKUP_OFFSITE=telegram manda la instantánea al admin)
+#
+# CLI:
+#   python backup.py run | list | verify <id> | prune
+#   python backup.py restore <id> <destino.db> [dir_comprobantes]
+
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows: el lock solo vale dentro del proceso
+    fcntl = None
+
+import export
+
+CHUNK_SIZE = 64 * 1024   # múltiplo del tamaño de página de SQLite (4096)
+_LOCK = threading.RLock()   # sin fcntl
+
+
+class BackupStore:
+    def __init__(self, root, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.chunks_dir = os.path.join(root, "chunks")
+        self.manifests_dir = os.path.join(root, "manifests")
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    @contextmanager
+    def lock(self):
+        """
+        Lock exclusivo del almacén (<raíz>/lock, flock): run() y prune() no se
+        cruzan, tampoco entre procesos (backup_task del bot y la CLI). Sin él,
+        prune() borraría los trozos de un run() que aún no guardó su manifiesto.
+        """
+        with open(os.path.join(self.root, "lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                _LOCK.acquire()
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    _LOCK.release()
+
+    # ---------------- trozos ----------------
+    def _chunk_path(self, h):
+        return os.path.join(self.chunks_dir, h[:2], h)
+
+    def put_chunk(self, data):
+        """Guarda el trozo si no existe. Devuelve (hash, bytes_escritos)."""
+        h = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(h)
+        if os.path.exists(path):
+            return h, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        comp = zlib.compress(data, 6)
+        # temporal propio de cada llamada: otro proceso (CLI) puede estar escribiendo el mismo trozo
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(comp)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        return h, len(comp)
+
+    def get_chunk(self, h):
+        with open(self._chunk_path(h), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != h:
+            raise ValueError(f"Trozo corrupto: {h}")
+        return data
+
+    def _put_stream(self, f, m):
+        """Trocea un archivo abierto; acumula métricas en m. Devuelve (hashes, tamaño, sha256)."""
+        hashes, size, full = [], 0, hashlib.sha256()
+        while True:
+            data = f.read(self.chunk_size)
+            if not data:
+                break
+            full.update(data)
+            size += len(data)
+            h, written = self.put_chunk(data)
+            hashes.append(h)
+            if written:
+                m["chunks_new"] += 1
+                m["bytes_written"] += written
+            else:
+                m["chunks_reused"] += 1
+        return hashes, size, full.hexdigest()
+
+    # ---------------- manifiestos ----------------
+    def list_ids(self):
+        return sorted(fn[:-5] for fn in os.listdir(self.manifests_dir) if fn.endswith(".json"))
+
+    def load(self, backup_id):
+        with open(os.path.join(self.manifests_dir, backup_id + ".json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, manifest):
+        path = os.path.join(self.manifests_dir, manifest["id"] + ".json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+
+    # ---------------- backup ----------------
+    def run(self, db_path, files_dir=None, verify=True):
+        """Hace un backup y devuelve su manifiesto (incluye "metrics")."""
+        with self.lock():
+            t0 = time.monotonic()
+            now = datetime.datetime.now()
+            m = {"chunks_new": 0, "chunks_reused": 0, "bytes_written": 0, "files_hashed": 0, "files_reused": 0}
+            manifest = {"id": now.strftime("%Y%m%d_%H%M%S"), "ts": now.isoformat(timespec="seconds"),
+                        "chunk_size": self.chunk_size}
+
+            with export.open_snapshot(db_path, tmp_dir=self.root) as snap:
+                hashes, size, digest = self._put_stream(snap, m)
+            manifest["db"] = {"name": os.path.basename(db_path), "size": size, "sha256": digest, "chunks": hashes}
+
+            if files_dir and os.path.isdir(files_dir):
+                manifest["files"] = self._backup_files(files_dir, m)
+
+            m["db_size"] = size
+            m["duration_s"] = round(time.monotonic() - t0, 3)
+            manifest["metrics"] = m
+            if verify:
+                manifest["verified"] = self.verify(manifest)
+                m["total_s"] = round(time.monotonic() - t0, 3)
+            self._save(manifest)
+            return manifest
+
+    def _backup_files(self, files_dir, m):
+        prev = {}
+        ids = self.list_ids()
+        if ids:
+            prev = self.load(ids[-1]).get("files", {})
+        out = {}
+        for dirpath, _, names in os.walk(files_dir):
+            for name in names:
+                full = os.path.join(dirpath, name)
+                rel = os.path.relpath(full, files_dir)
+                st = os.stat(full)
+                p = prev.get(rel)
+                if p and p["size"] == st.st_size and p["mtime"] == int(st.st_mtime):
+                    out[rel] = p   # sin cambios: no se vuelve a leer
+                    m["files_reused"] += 1
+                    continue
+                with open(full, "rb") as f:
+                    hashes, size, _ = self._put_stream(f, m)
+                out[rel] = {"size": size, "mtime": int(st.st_mtime), "chunks": hashes}
+                m["files_hashed"] += 1
+        return out
+
+    # ---------------- restauración / verificación ----------------
+    def restore_db(self, manifest, dest_path):
+        h = hashlib.sha256()
+        with open(dest_path, "wb") as f:
+            for c in manifest["db"]["chunks"]:
+                data = self.get_chunk(c)
+                h.update(data)
+                f.write(data)
+        if h.hexdigest() != manifest["db"]["sha256"]:
+            raise ValueError("El hash de la base restaurada no coincide")
+
+    def restore_files(self, manifest, dest_dir):
+        for rel, info in manifest.get("files", {}).items():
+            path = os.path.join(dest_dir, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                for c in info["chunks"]:
+                    f.write(self.get_chunk(c))
+
+    def verify(self, manifest):
+        """Restaura la base a un temporal y corre integrity_check. True si está bien."""
+        fd, tmp = tempfile.mkstemp(suffix=".db", dir=self.root)
+        os.close(fd)
+        try:
+            self.restore_db(manifest, tmp)
+            conn = sqlite3.connect(tmp)
+            try:
+                ok = conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+            finally:
+                conn.close()
+            for info in manifest.get("files", {}).values():
+                for c in info["chunks"]:
+                    if not os.path.exists(self._chunk_path(c)):
+                        return False
+            return ok
+        except Exception:
+            return False
+        finally:
+            os.unlink(tmp)
+
+    # ---------------- retención ----------------
+    def prune(self, keep_daily=7, keep_weekly=4, keep_monthly=6):
+        """
+        Conserva el último backup de cada uno de los últimos keep_daily días,
+        keep_weekly semanas y keep_monthly meses; borra el resto y los trozos
+        que ya nadie referencia. Devuelve (manifiestos_borrados, trozos_borrados).
+        """
+        with self.lock():
+            ids = self.list_ids()
+            keep, days, weeks, months = set(ids[-1:]), set(), set(), set()
+            for bid in reversed(ids):
+                dt = datetime.datetime.strptime(bid, "%Y%m%d_%H%M%S")
+                d, w, mo = dt.date(), dt.isocalendar()[:2], (dt.year, dt.month)
+                if d not in days and len(days) < keep_daily:
+                    days.add(d); keep.add(bid)
+                if w not in weeks and len(weeks) < keep_weekly:
+                    weeks.add(w); keep.add(bid)
+                if mo not in months and len(months) < keep_monthly:
+                    months.add(mo); keep.add(bid)
+            removed = [bid for bid in ids if bid not in keep]
+            for bid in removed:
+                os.unlink(os.path.join(self.manifests_dir, bid + ".json"))
+
+            live = set()
+            for bid in keep:
+                man = self.load(bid)
+                live.update(man["db"]["chunks"])
+                for info in man.get("files", {}).values():
+                    live.update(info["chunks"])
+            swept = 0
+            for dirpath, _, names in os.walk(self.chunks_dir):
+                for name in names:
+                    if name not in live:
+                        os.unlink(os.path.join(dirpath, name))
+                        swept += 1
+            return len(removed), swept
+
+    def usage_bytes(self):
+        total = 0
+        for dirpath, _, names in os.walk(self.chunks_dir):
+            for name in names:
+                total += os.path.getsize(os.path.join(dirpath, name))
+        return total
+
+
+# ---------------- CLI ----------------
+def main(argv):
+    root = os.environ.get("BACKUP_DIR", os.path.join(os.getcwd(), "backups"))
+    db_file = os.path.join(os.getcwd(), "inversionesct.db")
+    files_dir = os.path.join(os.getcwd(), "comprobantes")
+    store = BackupStore(root)
+    cmd = argv[1] if len(argv) > 1 else "list"
+    if cmd == "run":
+        man = store.run(db_file, files_dir)
+        print(json.dumps({"id": man["id"], "verified": man.get("verified"), **man["metrics"]}, indent=2))
+    elif cmd == "list":
+        for bid in store.list_ids():
+            man = store.load(bid)
+            mt = man.get("metrics", {})
+            print(f"{bid}  db={man['db']['size']:>12,}  nuevos={mt.get('bytes_written', 0):>12,}  "
+                  f"archivos={len(man.get('files', {})):>6}  verificado={man.get('verified')}")
+        print(f"uso total: {store.usage_bytes():,} bytes")
+    elif cmd == "verify":
+        print("OK" if store.verify(store.load(argv[2])) else "FALLÓ")
+    elif cmd == "restore":
+        man = store.load(argv[2])
+        store.restore_db(man, argv[3])
+        if len(argv) > 4:
+            store.restore_files(man, argv[4])
+        print("Restaurado.")
+    elif cmd == "prune":
+        print("manifiestos borrados=%d trozos borrados=%d" % store.prune())
+    else:
+        sys.exit("uso: backup.py run|list|verify <id>|restore <id> <destino.db> [dir]|prune")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
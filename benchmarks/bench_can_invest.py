@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# benchmarks/bench_can_invest.py
+# Latencia de can_user_invest según el tamaño de la tabla inversiones:
+#   - N+1 original sin índices (antes)
+#   - N+1 original con los índices de la migración 3
+#   - consulta única (CAN_INVEST_SQL) con índices (después)
+#
+# Uso:
+#   python benchmarks/bench_can_invest.py --sizes 10000,100000,1000000 --samples 200
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+from database import ConnectionPool  # noqa: E402
+from repository import CAN_INVEST_SQL  # noqa: E402
+
+
+def can_invest_old(db, user_id):
+    # implementación anterior (consulta por referido)
+    cur = db.connection().cursor()
+    cur.execute("SELECT COUNT(*), MAX(fecha_inversion) FROM inversiones WHERE user_id=?", (user_id,))
+    row = cur.fetchone()
+    if not row or row[0] == 0:
+        return True
+    last_date = row[1]
+    cur.execute("SELECT user_id FROM usuarios WHERE referido_por=?", (user_id,))
+    for (rid,) in cur.fetchall():
+        cur.execute("SELECT MIN(fecha_inversion) FROM inversiones WHERE user_id=?", (rid,))
+        first = cur.fetchone()[0]
+        if not first:
+            continue
+        if last_date and first <= last_date:
+            continue
+        cur.execute("SELECT COUNT(*) FROM inversiones WHERE user_id=? AND estado IN ('Pendiente','Aprobado')", (rid,))
+        if cur.fetchone()[0] > 0:
+            return True
+    return False
+
+
+def can_invest_new(db, user_id):
+    return bool(db.scalar(CAN_INVEST_SQL, {"uid": user_id}, default=0))
+
+
+def seed(db, n_inv, rnd):
+    n_users = max(10, n_inv // 5)
+    start = datetime.date(2024, 1, 1)
+    with db.transaction() as cur:
+        cur.executemany(
+            "INSERT INTO usuarios (user_id, nombre, referido_por) VALUES (?, ?, ?)",
+            ((u, f"user{u}", rnd.randint(1, u - 1) if u > 1 and rnd.random() < 0.6 else None)
+             for u in range(1, n_users + 1)))
+        cur.executemany(
+            "INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado) VALUES (?, ?, ?, '', ?)",
+            ((rnd.randint(1, n_users), rnd.choice((100000, 300000, 500000)),
+              (start + datetime.timedelta(days=rnd.randint(0, 600))).isoformat(),
+              rnd.choice(("Pendiente", "Aprobado", "Aprobado", "Rechazado")))
+             for _ in range(n_inv)))
+    return n_users
+
+
+def measure(label, fn, db, uids):
+    lat = []
+    for uid in uids:
+        t0 = time.perf_counter()
+        fn(db, uid)
+        lat.append((time.perf_counter() - t0) * 1000)
+    lat.sort()
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+    print(f"  {label:<22} p50={statistics.median(lat):9.3f} ms  p99={p99:9.3f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--samples", type=int, default=200)
+    ap.add_argument("--samples-noindex", type=int, default=30, help="muestras para la variante sin índices (lenta)")
+    args = ap.parse_args()
+
+    for size in [int(x) for x in args.sizes.split(",")]:
+        rnd = random.Random(size)
+        with tempfile.TemporaryDirectory() as d:
+            db = ConnectionPool(os.path.join(d, "bench.db"))
+            migrations.migrate(db, migrations.MIGRATIONS[:2], verbose=False)  # sin índices
+            t0 = time.perf_counter()
+            n_users = seed(db, size, rnd)
+            print(f"inversiones={size:,} usuarios={n_users:,} (seed {time.perf_counter() - t0:.1f}s)")
+            uids = [rnd.randint(1, n_users) for _ in range(args.samples)]
+
+            # ambas implementaciones deben dar lo mismo
+            for uid in uids[:50]:
+                assert can_invest_old(db, uid) == can_invest_new(db, uid), uid
+
+            measure("N+1 sin índices", can_invest_old, db, uids[:args.samples_noindex])
+            migrations.migrate(db, verbose=False)
+            db.connection().execute("ANALYZE")
+            measure("N+1 con índices", can_invest_old, db, uids)
+            measure("consulta única", can_invest_new, db, uids)
+            db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# benchmarks/bench_db_pool.py
+# Compara el patrón antiguo get_conn() (abrir/consultar/cerrar, journal por
+# defecto) contra database.ConnectionPool (conexión por hilo + WAL) con una
+# mezcla de consultas equivalente a la de los handlers del bot.
+#
+# Uso:
+#   python benchmarks/bench_db_pool.py --threads 8 --ops 2000 --users 5000
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionPool  # noqa: E402
+
+# mismo esquema que init_db() en main.py
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS usuarios (
+        user_id INTEGER PRIMARY KEY, nombre TEXT, telefono TEXT, nequi TEXT,
+        cedula TEXT, referido_por INTEGER, referidos INTEGER DEFAULT 0,
+        total_invertido INTEGER DEFAULT 0, ganancia_total INTEGER DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS inversiones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, monto INTEGER,
+        fecha_inversion TEXT, fecha_pago TEXT, estado TEXT,
+        comprobante_path TEXT, ocr_text TEXT)""",
+]
+
+
+def seed(path, users):
+    conn = sqlite3.connect(path)
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    conn.executemany("INSERT INTO usuarios (user_id, nombre) VALUES (?, ?)",
+                     [(i, f"user{i}") for i in range(1, users + 1)])
+    conn.commit(); conn.close()
+
+
+# ---------------- handlers simulados ----------------
+# Cada "handler" es una lista de (sql, es_escritura). Reproduce las consultas
+# de handle_start, handler_perfil, step_* y procesar_comprobante.
+def handler_ops(uid):
+    return random.choice([
+        [("SELECT user_id FROM usuarios WHERE user_id=?", False, (uid,)),
+         ("INSERT OR IGNORE INTO usuarios (user_id, referido_por) VALUES (?, NULL)", True, (uid,))],
+        [("SELECT nombre, telefono, nequi, cedula, total_invertido, ganancia_total, referidos FROM usuarios WHERE user_id=?", False, (uid,))],
+        [("UPDATE usuarios SET telefono=? WHERE user_id=?", True, ("300" + str(uid), uid))],
+        [("INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado) VALUES (?, 100000, '2025-01-01', '04/01/2025', 'Pendiente')", True, (uid,))],
+    ])
+
+
+def run_old(path, uid):
+    for sql, write, params in handler_ops(uid):
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        if write:
+            conn.commit()
+        else:
+            cur.fetchall()
+        conn.close()
+
+
+def make_run_pool(pool):
+    def run(path, uid):
+        for sql, write, params in handler_ops(uid):
+            if write:
+                pool.execute(sql, params)
+            else:
+                pool.fetchall(sql, params)
+    return run
+
+
+def bench(label, path, run, threads, ops, users):
+    errors = [0]
+
+    def worker():
+        rnd = random.Random()
+        for _ in range(ops):
+            try:
+                run(path, rnd.randint(1, users))
+            except sqlite3.OperationalError:
+                errors[0] += 1
+
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    dt = time.perf_counter() - t0
+    total = threads * ops
+    print(f"{label:<10} {total:>8} handlers  {dt:7.2f}s  {total / dt:9.0f} handlers/s  errores={errors[0]}")
+    return total / dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--ops", type=int, default=1000, help="handlers por hilo")
+    ap.add_argument("--users", type=int, default=5000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        old_path = os.path.join(d, "old.db")
+        seed(old_path, args.users)
+        before = bench("get_conn", old_path, run_old, args.threads, args.ops, args.users)
+
+        new_path = os.path.join(d, "pool.db")
+        seed(new_path, args.users)
+        pool = ConnectionPool(new_path)
+        after = bench("pool+WAL", new_path, make_run_pool(pool), args.threads, args.ops, args.users)
+        pool.close_all()
+
+    print(f"speedup: x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# benchmarks/bench_engines.py
+# Conversaciones concurrentes por proceso: BOT_ENGINE=threads contra asyncio.
+# Para cada motor y nivel N lanza benchmarks/bench_load.py (main.py real contra
+# la Bot API falsa con latencia de red) con N usuarios que llegan casi a la vez
+# y recorren registro → perfil → invertir → comprobante.
+# - Por nivel: p99 de primera respuesta, p99 del comprobante (descarga + OCR),
+#   updates sin respuesta y updates/s
+# - Resumen: mayor N que cumple el SLO (p99 de primera respuesta <= --slo-ms y
+#   ninguna sin respuesta) para cada motor
+#
+# Uso:
+#   python benchmarks/bench_engines.py --levels 25,50,100,200,400 --latency-ms 100
+#   python benchmarks/bench_engines.py --engines asyncio --levels 400,800 --slo-ms 2000
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_level(engine, n, args, out):
+    cmd = [sys.executable, os.path.join(HERE, "bench_load.py"), "--engine", engine,
+           "--users", str(n), "--rate", str(max(1.0, n / args.ramp)), "--think", str(args.think),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.latency_ms / 4),
+           "--drain", str(args.drain), "--seed", str(args.seed), "--out", out]
+    r = subprocess.run(cmd, capture_output=True, text=True)
+    if r.returncode != 0 or not os.path.exists(out):
+        print(r.stdout[-1500:], r.stderr[-1500:], file=sys.stderr)
+        return None
+    with open(out, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--engines", default="threads,asyncio")
+    ap.add_argument("--levels", default="25,50,100,200,400")
+    ap.add_argument("--ramp", type=float, default=2.0, help="segundos en los que llegan los N usuarios")
+    ap.add_argument("--think", type=float, default=1.0, help="pausa media entre pasos (s)")
+    ap.add_argument("--latency-ms", type=float, default=100, help="latencia de la Bot API falsa")
+    ap.add_argument("--slo-ms", type=float, default=1000, help="p99 máximo de primera respuesta")
+    ap.add_argument("--drain", type=float, default=60)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--keep-going", action="store_true", help="seguir subiendo aunque un nivel no cumpla el SLO")
+    ap.add_argument("--out", help="guardar todos los resultados en JSON")
+    args = ap.parse_args()
+
+    levels = [int(x) for x in args.levels.split(",")]
+    results, best = {}, {}
+    print(f"{'motor':<8} {'N':>5}  {'1ª p50':>9} {'1ª p99':>9}  {'compr. p99':>10}  {'sin resp':>8} {'upd/s':>7}  SLO")
+    with tempfile.TemporaryDirectory() as d:
+        for engine in args.engines.split(","):
+            results[engine] = {}
+            best[engine] = 0
+            for n in levels:
+                res = run_level(engine, n, args, os.path.join(d, f"{engine}_{n}.json"))
+                if res is None:
+                    print(f"{engine:<8} {n:>5}  error (ver salida de bench_load)")
+                    break
+                results[engine][n] = res
+                t = res["total"]
+                rx = res["kinds"].get("comprobante", {})
+                ok = t["unreplied"] == 0 and t["first_p99_ms"] <= args.slo_ms
+                print(f"{engine:<8} {n:>5}  {t['first_p50_ms']:>7.0f}ms {t['first_p99_ms']:>7.0f}ms  "
+                      f"{rx.get('last_p99_ms', float('nan')):>8.0f}ms  {t['unreplied']:>8} "
+                      f"{res['updates_per_s']:>7.1f}  {'✔' if ok else '✘'}")
+                if ok:
+                    best[engine] = n
+                elif not args.keep_going:
+                    break
+
+    print(f"\nconversaciones concurrentes dentro del SLO (p99 1ª respuesta <= {args.slo_ms:.0f} ms, "
+          f"API a {args.latency_ms:.0f} ms):")
+    for engine, n in best.items():
+        print(f"  {engine:<8} {n}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "best": best, "results": results}, f, indent=2, default=str)
+        print(f"resultados en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# benchmarks/bench_handlers.py
+# Suite de benchmarks offline de los handlers reales de main.py:
+# - Base SQLite sembrada (usuarios, inversiones, referidos, pendientes) del tamaño pedido
+# - Message / CallbackQuery sintéticos (telebot.types.*.de_json, sin red)
+# - Bot y outbox falsos que solo registran los envíos
+# - p50 / p99 / media / throughput por handler, salida JSON comparable entre commits
+# - --backend memory: los mismos datos en repository.MemoryRepository y
+#   conversaciones en memoria; mide los handlers sin el coste de SQLite
+# - Los envíos serializan reply_markup como telebot (to_json) para contar el
+#   coste de los teclados; *_active repite botones de --active usuarios (caché
+#   de perfiles caliente); --profile-cache 0 la desactiva para comparar
+#
+# Necesita pyTelegramBotAPI instalado (solo sus tipos; no se conecta a nada).
+#
+# Uso:
+#   python benchmarks/bench_handlers.py --users 20000 --investments 100000 --iters 500
+#   python benchmarks/bench_handlers.py --out antes.json
+#   python benchmarks/bench_handlers.py --out despues.json --compare antes.json
+#   python benchmarks/bench_handlers.py --backend memory --compare antes.json
+#   python benchmarks/bench_handlers.py --profile-cache 0 --out sin_cache.json
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ADMIN_ID = 999000001
+NEQUI = "3053706109"
+
+
+# ---------------- dobles de prueba ----------------
+class FakeFile:
+    def __init__(self, file_id):
+        self.file_path = f"photos/{file_id}.jpg"
+
+
+class FakeBot:
+    """Lo que los handlers usan de TeleBot; cada llamada queda en self.calls."""
+
+    def __init__(self, rnd):
+        self.rnd = rnd
+        self.calls = []
+
+    def _rec(self, method, *args):
+        self.calls.append((method, args[0] if args else None))
+
+    def send_message(self, chat_id, text, **kw):
+        self._rec("send_message", chat_id)
+
+    def reply_to(self, message, text, **kw):
+        self._rec("reply_to", message.chat.id)
+
+    def answer_callback_query(self, callback_id, text=None, **kw):
+        self._rec("answer_callback_query", callback_id)
+
+    def send_document(self, chat_id, doc, **kw):
+        self._rec("send_document", chat_id)
+
+    def get_file(self, file_id):
+        self._rec("get_file", file_id)
+        return FakeFile(file_id)
+
+    def download_file(self, file_path):
+        self._rec("download_file", file_path)
+        # bytes distintos por archivo: cada comprobante es nuevo (sin dedup por sha)
+        return file_path.encode() + self.rnd.randbytes(30000)
+
+
+def _markup(kw):
+    # lo que hace telebot.apihelper._convert_markup al enviar
+    m = kw.get("reply_markup")
+    return m.to_json() if hasattr(m, "to_json") else m
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.calls = []
+
+    def send_message(self, chat_id, text, **kw):
+        _markup(kw)
+        self.calls.append(("send_message", chat_id))
+
+    def enqueue(self, method, chat_id, *args, on_sent=None, **kw):
+        _markup(kw)
+        self.calls.append((method, chat_id))
+
+    def stats(self):
+        return {"sent": 0, "failed": 0, "queued": 0, "rate_limited": 0, "latency_avg": 0.0}
+
+    def depth(self):
+        return 0
+
+
+class InlineOcr:
+    """OCR síncrono con un texto fijo: mide el camino de procesar_comprobante sin tesseract."""
+
+    def __init__(self, on_result):
+        self.on_result = on_result
+
+    def submit(self, job):
+        self.on_result(job, f"Envío exitoso\nPara {NEQUI}\n$ {job['monto']:,}".replace(",", "."), None)
+        return True
+
+    def stats(self):
+        return {"queued": 0, "max_queue": 0, "in_flight": 0, "workers": 0}
+
+
+# ---------------- updates sintéticos ----------------
+_seq = [0]
+
+def _next():
+    _seq[0] += 1
+    return _seq[0]
+
+def _user(uid):
+    return {"id": uid, "is_bot": False, "first_name": f"U{uid}", "language_code": "es"}
+
+def message(types, uid, text=None, photo=False):
+    d = {"message_id": _next(), "from": _user(uid), "chat": {"id": uid, "type": "private"},
+         "date": int(time.time())}
+    if text is not None:
+        d["text"] = text
+        if text.startswith("/"):
+            d["entities"] = [{"offset": 0, "length": len(text.split()[0]), "type": "bot_command"}]
+    if photo:
+        fid = f"AgAC{_next()}"
+        d["photo"] = [{"file_id": fid, "file_unique_id": fid + "u", "width": 1280, "height": 2560, "file_size": 30000}]
+    return types.Message.de_json(d)
+
+def callback(types, uid, data):
+    return types.CallbackQuery.de_json({
+        "id": str(_next()), "from": _user(uid), "chat_instance": "bench", "data": data,
+        "message": {"message_id": _next(), "from": _user(1), "chat": {"id": uid, "type": "private"},
+                    "date": int(time.time()), "text": "menú"},
+    })
+
+
+# ---------------- base sembrada ----------------
+def seed(db, users, investments, pending, rnd):
+    hoy = datetime.date.today()
+    with db.transaction() as cur:
+        cur.executemany(
+            "INSERT INTO usuarios (user_id, nombre, telefono, nequi, cedula, referido_por) VALUES (?, ?, ?, ?, ?, ?)",
+            ((uid, f"Usuario {uid}", f"300{uid:07d}", f"300{uid:07d}", str(10 ** 9 + uid),
+              rnd.randint(1, uid - 1) if uid > 1 and rnd.random() < 0.3 else None) for uid in range(1, users + 1)))
+        cur.execute("INSERT INTO usuarios (user_id, nombre) VALUES (?, 'Admin')", (ADMIN_ID,))
+        cur.execute("UPDATE usuarios SET referidos = (SELECT COUNT(*) FROM usuarios r WHERE r.referido_por = usuarios.user_id)")
+        rows = []
+        for i in range(investments):
+            estado = "Pendiente" if i >= investments - pending else rnd.choice(["Aprobado", "Aprobado", "Rechazado"])
+            f = hoy - datetime.timedelta(days=rnd.randint(0, 365))
+            rows.append((rnd.randint(1, users), rnd.choice([100000, 300000, 500000]), f.isoformat(),
+                         (f + datetime.timedelta(days=3)).strftime("%d/%m/%Y"), estado,
+                         f"AgAC{i}", "photo", 1 if rnd.random() < 0.7 else 0))
+        cur.executemany(
+            "INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado, comprobante_file_id, "
+            "comprobante_tipo, ocr_ok, ocr_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, '')", rows)
+    import stats
+    stats.rebuild(db)
+
+
+# ---------------- medición ----------------
+def measure(name, fn, setups, sink):
+    """setups: lista de argumentos ya construidos (fuera del tiempo medido)."""
+    lat = []
+    before = len(sink.calls)
+    t_all = time.perf_counter()
+    for arg in setups:
+        t0 = time.perf_counter()
+        fn(arg)
+        lat.append(time.perf_counter() - t0)
+    total = time.perf_counter() - t_all
+    lat.sort()
+    n = len(lat)
+    return name, {
+        "n": n,
+        "p50_ms": round(lat[n // 2] * 1000, 4),
+        "p99_ms": round(lat[min(n - 1, int(n * 0.99))] * 1000, 4),
+        "mean_ms": round(statistics.fmean(lat) * 1000, 4),
+        "ops_s": round(n / total, 1),
+        "sends_per_op": round((len(sink.calls) - before) / n, 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=20000)
+    ap.add_argument("--investments", type=int, default=100000)
+    ap.add_argument("--pending", type=int, default=2000)
+    ap.add_argument("--iters", type=int, default=300)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--backend", choices=("sqlite", "memory"), default="sqlite")
+    ap.add_argument("--profile-cache", type=int, help="PROFILE_CACHE_SIZE (0 = sin caché de perfiles)")
+    ap.add_argument("--active", type=int, default=100, help="usuarios activos en los *_active")
+    ap.add_argument("--metrics", action="store_true", help="dejar activa la instrumentación de metrics.py")
+    ap.add_argument("--out", help="archivo JSON de resultados")
+    ap.add_argument("--compare", help="JSON anterior para comparar p50/p99")
+    args = ap.parse_args()
+    rnd = random.Random(args.seed)
+
+    work = tempfile.TemporaryDirectory()
+    os.chdir(work.name)   # main.py ubica la base y comprobantes/ en el cwd
+    os.environ.update({"BOT_TOKEN": "0:bench", "ADMIN_ID": str(ADMIN_ID), "NEQUI_DESTINO": NEQUI,
+                       "METRICS_ENABLED": "1" if args.metrics else "0"})
+    if args.profile_cache is not None:
+        os.environ["PROFILE_CACHE_SIZE"] = str(args.profile_cache)
+    import main
+    from telebot import types
+
+    main.init_storage()
+    t0 = time.perf_counter()
+    seed(main.db, args.users, args.investments, args.pending, rnd)
+    print(f"base sembrada en {time.perf_counter() - t0:.1f}s: {args.users} usuarios, "
+          f"{args.investments} inversiones ({args.pending} pendientes)")
+    if args.backend == "memory":
+        from conversations import MemoryStateStore
+        from repository import MemoryRepository
+        mem = MemoryRepository().load(main.db)
+        if hasattr(main.repo, "inner"):   # CachedRepository
+            main.repo.inner = mem
+        else:
+            main.repo = mem
+        main.conv.store = MemoryStateStore()
+
+    # dobles: nada sale a la red
+    bot = FakeBot(rnd)
+    main.bot = bot
+    main.outbox = FakeOutbox()
+    main.ocr.available = lambda: True
+    main.ocr_pipeline = InlineOcr(main.on_ocr_result)
+
+    class Sink:   # envíos del bot + del outbox
+        @property
+        def calls(self):
+            return bot.calls + main.outbox.calls
+    sink = Sink()
+
+    it = args.iters
+    users = list(range(1, args.users + 1))
+    pend = [r[0] for r in main.db.fetchall("SELECT id FROM inversiones WHERE estado='Pendiente' ORDER BY id")]
+    results = {}
+
+    def run(name, fn, setups):
+        k, v = measure(name, fn, setups, sink)
+        results[k] = v
+        print(f"{k:<26} p50 {v['p50_ms']:8.3f} ms  p99 {v['p99_ms']:8.3f} ms  {v['ops_s']:>9.0f} ops/s  "
+              f"envíos/op {v['sends_per_op']}")
+
+    new_ids = range(args.users + 10, args.users + 10 + it)
+    run("handle_start_new", main.router.dispatch_message, [message(types, u, "/start") for u in new_ids])
+    run("handle_start_existing", main.router.dispatch_message,
+        [message(types, rnd.choice(users), "/start") for _ in range(it)])
+    run("can_user_invest", main.can_user_invest, [rnd.choice(users) for _ in range(it)])
+    run("handler_perfil", main.router.dispatch_message, [message(types, rnd.choice(users), "📊 Mi perfil") for _ in range(it)])
+    active = rnd.sample(users, min(args.active, len(users)))
+    run("handler_perfil_active", main.router.dispatch_message,
+        [message(types, rnd.choice(active), "📊 Mi perfil") for _ in range(it)])
+    run("mis_referidos_active", main.router.dispatch_message,
+        [message(types, rnd.choice(active), "👥 Mis referidos") for _ in range(it)])
+    run("fallback", main.fallback, [message(types, rnd.choice(users), "hola") for _ in range(it)])
+    run("callback_inv", main.router.dispatch_callback, [callback(types, u, "INV|100000") for u in new_ids])
+
+    # procesar_comprobante: cada usuario nuevo ya está en el estado "comprobante" por callback_inv
+    photos = []
+    for u in new_ids:
+        main.conv.goto(u, "comprobante", {"monto": 100000})
+        photos.append(message(types, u, photo=True))
+    run("procesar_comprobante", main.conversation_step, photos)
+
+    run("admin_revisar_pendientes", main.router.dispatch_message,
+        [message(types, ADMIN_ID, "🔎 Revisar pendientes") for _ in range(max(1, it // 10))])
+    run("admin_process_callback", main.router.dispatch_callback,
+        [callback(types, ADMIN_ID, f"{'APP' if i % 2 else 'REJ'}|{pid}") for i, pid in enumerate(pend[:it])])
+    run("admin_stats", main.router.dispatch_message,
+        [message(types, ADMIN_ID, "📊 Estadísticas") for _ in range(max(1, it // 10))])
+
+    cs = getattr(main, "repo_cache_stats", dict)()   # commits anteriores: sin caché
+    if cs:
+        print("caché: " + " · ".join(f"{k} {v['hit_rate'] * 100:.0f}% aciertos ({v['size']} entradas)" for k, v in cs.items()))
+    out = {
+        "meta": {"ts": datetime.datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                 "python": sys.version.split()[0], "sqlite": sqlite3.sqlite_version,
+                 "users": args.users, "investments": args.investments, "pending": args.pending,
+                 "iters": it, "seed": args.seed, "metrics": args.metrics, "backend": args.backend,
+                 "profile_cache": getattr(main, "PROFILE_CACHE_SIZE", 0), "active": args.active},
+        "results": results,
+        "cache": cs,
+    }
+    if args.out:
+        with open(os.path.join(ROOT, args.out) if not os.path.isabs(args.out) else args.out, "w") as f:
+            json.dump(out, f, indent=2)
+        print(f"resultados en {args.out}")
+    if args.compare:
+        with open(os.path.join(ROOT, args.compare) if not os.path.isabs(args.compare) else args.compare) as f:
+            old = json.load(f)["results"]
+        print(f"\n{'handler':<26} {'p50 antes':>10} {'p50 ahora':>10} {'Δ':>7}   {'p99 antes':>10} {'p99 ahora':>10} {'Δ':>7}")
+        for k, v in results.items():
+            o = old.get(k)
+            if not o:
+                continue
+            d50 = (v["p50_ms"] / o["p50_ms"] - 1) * 100 if o["p50_ms"] else 0
+            d99 = (v["p99_ms"] / o["p99_ms"] - 1) * 100 if o["p99_ms"] else 0
+            print(f"{k:<26} {o['p50_ms']:>10.3f} {v['p50_ms']:>10.3f} {d50:>+6.0f}%   "
+                  f"{o['p99_ms']:>10.3f} {v['p99_ms']:>10.3f} {d99:>+6.0f}%")
+    main.db.close_all()
+    os.chdir(ROOT)
+    work.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# benchmarks/bench_load.py
+# Prueba de carga de extremo a extremo: el proceso real (python main.py) contra
+# una Bot API falsa local (scripts/fake_bot_api.py). Entran en juego a la vez
+# el bucle de polling, los hilos de handlers, el OCR, los bloqueos de SQLite y
+# la cola de envío.
+# - Flujo generado (registro, perfil, invertir, comprobante por usuario) o
+#   updates grabados (JSON/JSONL, como scripts/updates/) reproducidos a N× velocidad
+# - Latencia de update -> primera respuesta y -> última respuesta al chat
+#   (la última incluye el OCR del comprobante), por tipo de update
+# - Tasa de error: updates sin respuesta, 429 inyectados, excepciones del bot
+#   (trazas en su log) y contadores *_errors_total de /metrics
+#
+# Uso:
+#   python benchmarks/bench_load.py --users 200 --rate 5 --speed 4
+#   python benchmarks/bench_load.py --latency-ms 80 --jitter-ms 40 --p429 0.05
+#   python benchmarks/bench_load.py --replay scripts/updates/*.json --speed 10
+#   python benchmarks/bench_load.py --no-spawn --port 8081   # bot ya lanzado aparte
+#   python benchmarks/bench_load.py --engine asyncio          # BOT_ENGINE del bot (ver bench_engines.py)
+#
+# Con --no-spawn el bot debe correr con TELEGRAM_API_URL=http://127.0.0.1:<puerto>.
+
+import argparse
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+from fake_bot_api import FakeBotApi, SEND_METHODS  # noqa: E402
+
+ADMIN_ID = 999000001
+USER_BASE = 700000000
+
+
+# ---------------- flujos de updates ----------------
+def _msg(uid, n, **fields):
+    user = {"id": uid, "is_bot": False, "first_name": f"Carga{uid - USER_BASE}"}
+    return dict({"message_id": n, "from": user, "chat": dict(user, type="private"), "date": 0}, **fields)
+
+def _text(uid, n, text):
+    m = _msg(uid, n, text=text)
+    if text.startswith("/"):
+        m["entities"] = [{"offset": 0, "length": len(text.split()[0]), "type": "bot_command"}]
+    return {"message": m}
+
+def _callback(uid, n, data):
+    user = {"id": uid, "is_bot": False, "first_name": f"Carga{uid - USER_BASE}"}
+    return {"callback_query": {"id": f"cb{uid}-{n}", "from": user, "chat_instance": str(uid), "data": data,
+                               "message": _msg(uid, n, text="Selecciona el monto a invertir:")}}
+
+def _photo(uid, n):
+    fid = f"rx{uid}-{n}"
+    return {"message": _msg(uid, n, photo=[{"file_id": fid, "file_unique_id": fid, "width": 720,
+                                            "height": 1280, "file_size": 90000}])}
+
+def generate(users, rate, think, rnd):
+    """
+    Un guion por usuario (registro completo, perfil, invertir, comprobante);
+    llegadas de Poisson a `rate` usuarios/s y pausas exponenciales de `think` s
+    entre pasos. Devuelve [(offset_s, update)] a velocidad 1×.
+    """
+    out, t0 = [], 0.0
+    for i in range(users):
+        uid = USER_BASE + i + 1
+        t0 += rnd.expovariate(rate)
+        steps = [
+            lambda n: _text(uid, n, "/start"),
+            lambda n: _text(uid, n, f"Usuario Carga {i}"),
+            lambda n: _text(uid, n, f"300{rnd.randint(1000000, 9999999)}"),
+            lambda n: _text(uid, n, str(rnd.randint(10 ** 7, 10 ** 10))),
+            lambda n: _text(uid, n, f"301{rnd.randint(1000000, 9999999)}"),
+            lambda n: _text(uid, n, "📊 Mi perfil"),
+            lambda n: _text(uid, n, "💰 Invertir"),
+            lambda n: _callback(uid, n, f"INV|{rnd.choice([100000, 300000, 500000])}"),
+            lambda n: _photo(uid, n),
+        ]
+        t = t0
+        for n, make in enumerate(steps, 1):
+            out.append((t, make(n)))
+            t += max(0.2, rnd.expovariate(1.0 / think))
+    return out
+
+def _update_time(upd):
+    m = upd.get("message") or upd.get("edited_message") or (upd.get("callback_query") or {}).get("message") or {}
+    return m.get("date")
+
+def load_recorded(paths):
+    """Updates grabados (objeto, lista o JSONL); los tiempos salen de message.date."""
+    ups = []
+    for fn in paths:
+        with open(fn, encoding="utf-8") as f:
+            raw = f.read()
+        try:
+            data = json.loads(raw)
+            ups.extend(data if isinstance(data, list) else [data])
+        except ValueError:
+            ups.extend(json.loads(line) for line in raw.splitlines() if line.strip())
+    ups.sort(key=lambda u: u.get("update_id", 0))
+    out, first, last = [], None, 0.0
+    for u in ups:
+        d = _update_time(u)
+        if d is not None:
+            first = d if first is None else first
+            last = max(last, float(d - first))
+        out.append((last, {k: v for k, v in u.items() if k != "update_id"}))
+    return out
+
+def kind_of(upd):
+    if "callback_query" in upd:
+        return "callback:" + upd["callback_query"].get("data", "").partition("|")[0]
+    m = upd.get("message") or {}
+    if m.get("photo") or m.get("document"):
+        return "comprobante"
+    text = m.get("text") or ""
+    return text.split()[0] if text.startswith("/") else "texto"
+
+def chat_of(upd):
+    if "callback_query" in upd:
+        cq = upd["callback_query"]
+        return ((cq.get("message") or {}).get("chat") or {}).get("id") or cq["from"]["id"]
+    return ((upd.get("message") or {}).get("chat") or {}).get("id")
+
+
+# ---------------- análisis ----------------
+def attribute(released, calls):
+    """
+    Asigna cada envío a un chat al último update de ese chat liberado antes
+    del envío; si la cola unió mensajes, los updates anteriores sin respuesta
+    del mismo chat se dan por respondidos en ese instante.
+    Devuelve [{kind, first, last, sends}] con latencias en segundos.
+    """
+    per_chat, by_cb, res = {}, {}, []
+    for t, upd in released:
+        r = {"kind": kind_of(upd), "t": t, "first": None, "last": None, "sends": 0}
+        res.append(r)
+        per_chat.setdefault(chat_of(upd), []).append(r)
+        if "callback_query" in upd:
+            by_cb[upd["callback_query"]["id"]] = chat_of(upd)
+    for t, method, chat_id, status, extra in calls:
+        if status != 200:
+            continue
+        if method.lower() == "answercallbackquery":
+            chat_id = by_cb.get(extra)
+        elif method.lower() not in SEND_METHODS:
+            continue
+        items = per_chat.get(chat_id)
+        if not items:
+            continue
+        idx = None
+        for i, r in enumerate(items):
+            if r["t"] <= t:
+                idx = i
+        if idx is None:
+            continue
+        for r in items[:idx + 1]:
+            if r["first"] is None:
+                r["first"] = t - r["t"]
+        items[idx]["last"] = t - items[idx]["t"]
+        items[idx]["sends"] += 1
+    return res
+
+def pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+def summarize(rows):
+    first = [r["first"] for r in rows if r["first"] is not None]
+    last = [r["last"] if r["last"] is not None else r["first"] for r in rows if r["first"] is not None]
+    return {
+        "n": len(rows), "replied": len(first), "unreplied": len(rows) - len(first),
+        "first_p50_ms": pct(first, 50) * 1000, "first_p99_ms": pct(first, 99) * 1000,
+        "last_p50_ms": pct(last, 50) * 1000, "last_p99_ms": pct(last, 99) * 1000,
+        "first_max_ms": (max(first) * 1000) if first else float("nan"),
+    }
+
+def scrape_errors(port):
+    """Suma de los *_errors_total de /metrics del bot (None si no responde)."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+            text = r.read().decode("utf-8")
+    except Exception:
+        return None
+    out = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "_errors_total" not in line:
+            continue
+        name = line.split("{")[0].split()[0]
+        out[name] = out.get(name, 0) + float(line.rsplit(None, 1)[1])
+    return out
+
+
+# ---------------- bot ----------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn_bot(api_url, workdir, port, log, engine=None):
+    env = dict(os.environ, BOT_TOKEN="123456:LOADTEST", TELEGRAM_API_URL=api_url, ADMIN_ID=str(ADMIN_ID),
+               PORT=str(port), BOT_MODE="polling", METRICS_ENABLED="1", METRICS_TOKEN="", PYTHONUNBUFFERED="1")
+    if engine:
+        env["BOT_ENGINE"] = engine
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py")], cwd=workdir, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--replay", nargs="*", help="updates grabados (JSON/JSONL); si no, flujo generado")
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=2.0, help="usuarios nuevos por segundo (a 1×)")
+    ap.add_argument("--think", type=float, default=4.0, help="pausa media entre pasos de un usuario (s, a 1×)")
+    ap.add_argument("--speed", type=float, default=1.0, help="N× velocidad de reproducción")
+    ap.add_argument("--latency-ms", type=float, default=30)
+    ap.add_argument("--jitter-ms", type=float, default=10)
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--photo", help="imagen a servir como comprobante (por defecto un PNG en blanco)")
+    ap.add_argument("--port", type=int, default=0, help="puerto de la API falsa (0 = libre)")
+    ap.add_argument("--no-spawn", action="store_true", help="no lanzar main.py (ya corre aparte)")
+    ap.add_argument("--engine", choices=("threads", "asyncio"), help="BOT_ENGINE del bot lanzado")
+    ap.add_argument("--startup-timeout", type=float, default=60)
+    ap.add_argument("--drain", type=float, default=30, help="espera máxima de respuestas tras el último update (s)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="guardar resultados en JSON")
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    stream = load_recorded(args.replay) if args.replay else generate(args.users, args.rate, args.think, rnd)
+    stream = [(off / args.speed, upd) for off, upd in stream]
+    data = None
+    if args.photo:
+        with open(args.photo, "rb") as f:
+            data = f.read()
+
+    api = FakeBotApi(args.latency_ms, args.jitter_ms, args.p429, args.retry_after, data, seed=args.seed)
+    api_url = api.serve(port=args.port)
+    print(f"Bot API falsa en {api_url}; {len(stream)} updates en {stream[-1][0] if stream else 0:.1f}s "
+          f"(velocidad {args.speed:g}×)")
+
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    bot_port = free_port()
+    log_path = os.path.join(workdir, "bot.log")
+    proc = None
+    try:
+        if not args.no_spawn:
+            log = open(log_path, "w", encoding="utf-8")
+            proc = spawn_bot(api_url, workdir, bot_port, log, args.engine)
+        if not api.first_poll.wait(args.startup_timeout):
+            sys.exit(f"el bot no llegó a getUpdates en {args.startup_timeout:.0f}s; log: {log_path}")
+        time.sleep(0.5)   # que termine el arranque (mensaje al admin, etc.)
+        n_before = len(api.calls)
+
+        t_start = time.monotonic()
+        released = api.schedule(stream)
+        end_release = released[-1][0] if released else t_start
+        while time.monotonic() < end_release or api.pending_updates():
+            if proc is not None and proc.poll() is not None:
+                sys.exit(f"el bot terminó (código {proc.returncode}); log: {log_path}")
+            time.sleep(0.2)
+        # drenaje: hasta que todos tengan respuesta y no haya envíos nuevos, o --drain
+        deadline = time.monotonic() + args.drain
+        last_n = -1
+        while time.monotonic() < deadline:
+            time.sleep(0.5)
+            rows = attribute(released, api.calls[n_before:])
+            if all(r["first"] is not None for r in rows) and len(api.calls) == last_n:
+                break
+            last_n = len(api.calls)
+        wall = time.monotonic() - t_start
+        calls = api.calls[n_before:]
+        rows = attribute(released, calls)
+        bot_errors = scrape_errors(bot_port) if proc is not None else None
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        api.shutdown()
+
+    tracebacks = 0
+    if os.path.exists(log_path):
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            tracebacks = f.read().count("Traceback (most recent call last)")
+
+    kinds = sorted({r["kind"] for r in rows})
+    print(f"\n{'tipo':<16} {'n':>6} {'sin resp':>8}  {'1ª p50':>9} {'1ª p99':>9}  {'últ p50':>9} {'últ p99':>9}")
+    result = {"total": summarize(rows), "kinds": {}}
+    for k in kinds + ["total"]:
+        s = summarize([r for r in rows if k == "total" or r["kind"] == k])
+        if k != "total":
+            result["kinds"][k] = s
+        print(f"{k:<16} {s['n']:>6} {s['unreplied']:>8}  {s['first_p50_ms']:>7.1f}ms {s['first_p99_ms']:>7.1f}ms  "
+              f"{s['last_p50_ms']:>7.1f}ms {s['last_p99_ms']:>7.1f}ms")
+
+    sends = sum(1 for c in calls if c[1].lower() in SEND_METHODS and c[3] == 200)
+    total = result["total"]
+    result.update({
+        "wall_s": wall, "updates_per_s": len(rows) / wall if wall else 0.0, "sends": sends,
+        "api_calls": dict(sorted(api.stats()["calls"].items())), "injected_429": api.injected_429,
+        "bot_tracebacks": tracebacks, "bot_errors": bot_errors,
+    })
+    print(f"\n{len(rows)} updates en {wall:.1f}s ({result['updates_per_s']:.1f}/s), {sends} envíos "
+          f"({sends / max(1, len(rows)):.2f} por update)")
+    print(f"sin respuesta: {total['unreplied']} ({100.0 * total['unreplied'] / max(1, total['n']):.2f}%)  "
+          f"429 inyectados: {api.injected_429}  trazas en el bot: {tracebacks}")
+    if bot_errors:
+        for name, v in sorted(bot_errors.items()):
+            print(f"  {name}: {v:g}")
+    print("llamadas a la API:", ", ".join(f"{k}={v}" for k, v in result["api_calls"].items()))
+    print(f"log del bot: {log_path}")
+
+    if args.out:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip()
+        except Exception:
+            commit = ""
+        result["meta"] = {"ts": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+                          "python": sys.version.split()[0], "args": vars(args)}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"resultados en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
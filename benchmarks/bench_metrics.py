@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# benchmarks/bench_metrics.py
+# Coste de la instrumentación de metrics.py:
+# - observe() de un histograma, en 1 hilo y en N hilos a la vez
+# - un handler trivial con y sin el envoltorio de instrument_handlers()
+# - db.fetchone con y sin ConnectionPool.observer
+# - render() de /metrics con un registro del tamaño del de main.py
+#
+# Uso:
+#   python benchmarks/bench_metrics.py --n 200000 --threads 8
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+from database import ConnectionPool  # noqa: E402
+
+
+def per_call(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n
+
+
+def threaded(fn, n, threads):
+    def worker():
+        for _ in range(n):
+            fn()
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return (time.perf_counter() - t0) / (n * threads)
+
+
+class FakeBot:
+    def __init__(self):
+        self.message_handlers = []
+        self.callback_query_handlers = []
+
+
+def handler(m):
+    # lo mínimo que hace un handler real antes de encolar la respuesta
+    return m["text"] == "📊 Estadísticas"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200000)
+    ap.add_argument("--threads", type=int, default=8)
+    args = ap.parse_args()
+    n = args.n
+
+    reg = metrics.Registry()
+    h = reg.histogram("bench_seconds", "bench", ("handler",))
+    child = h.labels("x")
+    print(f"observe() 1 hilo:        {per_call(lambda: child.observe(0.003), n) * 1e9:8.0f} ns")
+    print(f"observe() {args.threads} hilos:       {threaded(lambda: child.observe(0.003), n // args.threads, args.threads) * 1e9:8.0f} ns")
+
+    bot = FakeBot()
+    bot.message_handlers.append({"function": handler, "filters": {}})
+    msg = {"text": "hola"}
+    base = per_call(lambda: handler(msg), n)
+    metrics.instrument_handlers(bot, reg.histogram("h_seconds", "h", ("kind", "handler")),
+                                reg.counter("h_errors_total", "h", ("kind", "handler")))
+    wrapped = bot.message_handlers[0]["function"]
+    inst = per_call(lambda: wrapped(msg), n)
+    print(f"handler sin métricas:    {base * 1e9:8.0f} ns")
+    print(f"handler con métricas:    {inst * 1e9:8.0f} ns  (+{(inst - base) * 1e9:.0f} ns por update)")
+
+    with tempfile.TemporaryDirectory() as d:
+        pool = ConnectionPool(os.path.join(d, "b.db"))
+        pool.execute("CREATE TABLE usuarios (user_id INTEGER PRIMARY KEY, nombre TEXT)")
+        pool.execute("INSERT INTO usuarios VALUES (1, 'a')")
+        q = lambda: pool.fetchone("SELECT nombre FROM usuarios WHERE user_id=?", (1,))
+        base = per_call(q, n // 4)
+        dbh = reg.histogram("db_seconds", "db", ("op",))
+        pool.observer = lambda op, s, err: dbh.labels(op).observe(s)
+        inst = per_call(q, n // 4)
+        pool.close_all()
+    print(f"fetchone sin métricas:   {base * 1e9:8.0f} ns")
+    print(f"fetchone con métricas:   {inst * 1e9:8.0f} ns  (+{(inst - base) / base * 100:.1f}%)")
+
+    # registro parecido al de producción: ~40 handlers + db + api
+    big = metrics.Registry()
+    hh = big.histogram("handler_seconds", "h", ("kind", "handler"))
+    for i in range(40):
+        hh.labels("message", f"h{i}").observe(0.01)
+    for op in ("fetchone", "fetchall", "transaction"):
+        big.histogram(f"db_{op}_seconds", "d").observe(0.001)
+    t = per_call(big.render, 200)
+    print(f"render() /metrics:       {t * 1e3:8.2f} ms ({len(big.render())} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# benchmarks/bench_ocr_preprocess.py
+# Tiempo de OCR y tasa de acierto (monto / número destino) con imagen cruda
+# frente a imagen preprocesada (ver ocr.preprocess_image).
+#
+# Corpus: un directorio con imágenes y un labels.csv con columnas
+#   archivo,monto,destino
+# Sin corpus real se puede generar uno sintético:
+#   python benchmarks/bench_ocr_preprocess.py --synthetic 20
+#   python benchmarks/bench_ocr_preprocess.py --corpus ./corpus_comprobantes
+# Requiere Pillow, pytesseract y el binario tesseract con el idioma spa.
+
+import argparse
+import csv
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr  # noqa: E402
+
+
+def load_corpus(d):
+    items = []
+    with open(os.path.join(d, "labels.csv"), newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            items.append((os.path.join(d, row["archivo"]), int(row["monto"]), row["destino"]))
+    return items
+
+
+def make_synthetic(d, n):
+    # capturas "tipo Nequi" grandes (1440 px de ancho, como photo[-1] de Telegram)
+    from PIL import Image, ImageDraw, ImageFont
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 56)
+    except Exception:
+        font = ImageFont.load_default()
+    rows = []
+    for i in range(n):
+        monto = random.choice([100000, 300000, 500000])
+        destino = "30" + "".join(random.choice("0123456789") for _ in range(8))
+        img = Image.new("RGB", (1440, 2560), (245, 245, 250))
+        dr = ImageDraw.Draw(img)
+        lines = [
+            "Nequi", "¡Listo! Envío exitoso", "",
+            "Para", "Nombre Apellido", "",
+            "Número Nequi", destino[:3] + " " + destino[3:6] + " " + destino[6:], "",
+            "¿Cuánto?", "$ " + f"{monto:,}".replace(",", ".") + ",00", "",
+            "Fecha", "12 de marzo de 2025 a las 10:15 a. m.", "",
+            "Referencia", "M" + str(random.randint(10 ** 7, 10 ** 8)),
+        ]
+        y = 300
+        for line in lines:
+            dr.text((120, y), line, fill=(30, 30, 40), font=font)
+            y += 90
+        name = f"synthetic_{i}.jpg"
+        img.save(os.path.join(d, name), quality=90)
+        rows.append((name, monto, destino))
+    with open(os.path.join(d, "labels.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["archivo", "monto", "destino"])
+        w.writerows(rows)
+
+
+def score(text, monto, destino, tolerancia=2000):
+    cleaned = text.replace(" ", "").replace("\n", "")
+    dest_ok = destino in cleaned
+    nums = [int(n) for n in re.findall(r"\d{3,}", text.replace(".", "").replace(",", ""))]
+    # el monto puede venir con ",00" pegado: aceptar también n // 100
+    amount_ok = any(abs(n - monto) <= tolerancia or abs(n // 100 - monto) <= tolerancia for n in nums)
+    return amount_ok, dest_ok
+
+
+def run(items, label, preprocess):
+    times, amount_hits, dest_hits = [], 0, 0
+    for path, monto, destino in items:
+        t0 = time.perf_counter()
+        text = ocr.run_ocr(path, "spa", preprocess)
+        times.append(time.perf_counter() - t0)
+        a, d = score(text, monto, destino)
+        amount_hits += a
+        dest_hits += d
+    n = len(items)
+    times.sort()
+    print(f"{label:<14} n={n:<4} p50={statistics.median(times) * 1000:7.0f} ms  "
+          f"p90={times[int(n * 0.9) - 1 if n > 1 else 0] * 1000:7.0f} ms  total={sum(times):6.1f}s  "
+          f"monto={amount_hits / n:6.1%}  destino={dest_hits / n:6.1%}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", help="directorio con imágenes + labels.csv")
+    ap.add_argument("--synthetic", type=int, default=0, help="generar N comprobantes sintéticos")
+    ap.add_argument("--regions", default="", help='ej. "0,0.3,1,0.5;0,0.5,1,0.7"')
+    args = ap.parse_args()
+    if not ocr.available():
+        sys.exit("Pillow/pytesseract no disponibles.")
+
+    tmp = None
+    corpus = args.corpus
+    if not corpus:
+        tmp = tempfile.TemporaryDirectory()
+        corpus = tmp.name
+        make_synthetic(corpus, args.synthetic or 10)
+    items = load_corpus(corpus)
+
+    run(items, "crudo", None)
+    run(items, "preprocesado", dict(ocr.DEFAULT_PREPROCESS))
+    if args.regions:
+        run(items, "regiones", dict(ocr.DEFAULT_PREPROCESS, regions=ocr.parse_regions(args.regions)))
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
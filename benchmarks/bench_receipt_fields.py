@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# benchmarks/bench_receipt_fields.py
+# Lectura de comprobantes por campos (receipt.parse_file: primera pasada con
+# cajas + relectura de las líneas de valor) frente al camino anterior (OCR de
+# la imagen completa + "la cifra más larga" del texto).
+# - Tiempo por comprobante (p50 / p90 / total)
+# - Acierto por campo: monto, número destino, fecha, referencia
+# - verify: comprobantes correctos aceptados; falso OK: aceptados contra un
+#   monto distinto (el usuario dice 500.000 y el comprobante es de 100.000)
+#
+# Corpus: imágenes + labels.csv con columnas archivo,monto,destino[,fecha,referencia]
+# (fecha en AAAA-MM-DD). Sin corpus se genera uno sintético con distractores
+# (celular del remitente, saldo, referencia larga, etiquetas de monto variadas).
+#
+# Uso:
+#   python benchmarks/bench_receipt_fields.py --synthetic 30
+#   python benchmarks/bench_receipt_fields.py --corpus ./corpus_comprobantes --out fields.json
+# Requiere Pillow, pytesseract y el binario tesseract con el idioma spa.
+
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr  # noqa: E402
+import receipt  # noqa: E402
+
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
+         "septiembre", "octubre", "noviembre", "diciembre"]
+FAST_WIDTH = receipt.FAST_WIDTH   # --fast-width
+
+# etiquetas de monto de distintas apps/versiones; el valor va debajo o en la misma línea
+AMOUNT_LABELS = ["¿Cuánto?", "Valor del envío", "Total a pagar"]
+
+# textos fijos (sin tesseract): etiqueta con letras "o" junto al monto, O leída por 0
+TEXT_CASES = [
+    ("Valor del envío $ 100.000", 100000),
+    ("del envío $ 100.000", 100000),
+    ("Total a pagar 100000", 100000),
+    ("Monto total $ 5OO.OOO,00", 500000),
+    ("¿Cuánto?\n$ 1OO.000,00", 100000),
+]
+
+
+def load_corpus(d):
+    items = []
+    with open(os.path.join(d, "labels.csv"), newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            items.append({"path": os.path.join(d, row["archivo"]), "amount": int(row["monto"]),
+                          "destination": row["destino"], "date": row.get("fecha") or None,
+                          "reference": row.get("referencia") or None})
+    return items
+
+
+def make_synthetic(d, n):
+    # capturas "tipo Nequi" de 1440 px con los números que confunden a la heurística vieja
+    from PIL import Image, ImageDraw, ImageFont
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 56)
+    except Exception:
+        font = ImageFont.load_default()
+    rows = []
+    for i in range(n):
+        monto = random.choice([100000, 300000, 500000, 1000000])
+        destino = "3" + "".join(random.choice("0123456789") for _ in range(9))
+        remitente = "3" + "".join(random.choice("0123456789") for _ in range(9))
+        dia, mes = random.randint(1, 28), random.randint(1, 12)
+        ref = "M" + str(random.randint(10 ** 7, 10 ** 8 - 1))
+        label = random.choice(AMOUNT_LABELS)
+        valor = "$ " + f"{monto:,}".replace(",", ".") + ",00"
+        cuanto = [label, valor] if label.startswith("¿") else [f"{label} {valor}"]
+        img = Image.new("RGB", (1440, 2560), (245, 245, 250))
+        dr = ImageDraw.Draw(img)
+        lines = [
+            "Nequi", "¡Listo! Envío exitoso", "",
+            "De", remitente[:3] + " " + remitente[3:6] + " " + remitente[6:], "",
+            "Para", "Nombre Apellido", "",
+            "Número Nequi", destino[:3] + " " + destino[3:6] + " " + destino[6:], "",
+            *cuanto, "",
+            "Fecha", f"{dia} de {MESES[mes - 1]} de 2025 a las 10:15 a. m.", "",
+            "Referencia", ref, "",
+            "Saldo disponible", "$ " + f"{random.randint(10 ** 5, 10 ** 7):,}".replace(",", ".") + ",00",
+        ]
+        y = 200
+        for line in lines:
+            dr.text((120, y), line, fill=(30, 30, 40), font=font)
+            y += 90
+        name = f"synthetic_{i}.jpg"
+        img.save(os.path.join(d, name), quality=90)
+        rows.append((name, monto, destino, f"2025-{mes:02d}-{dia:02d}", ref))
+    with open(os.path.join(d, "labels.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["archivo", "monto", "destino", "fecha", "referencia"])
+        w.writerows(rows)
+
+
+# ---------------- caminos a comparar ----------------
+def legacy_verify(ocr_text, monto, nequi_destino, tolerancia=2000):
+    # verify_receipt anterior (ocr.py), tal cual
+    nums = re.findall(r'\d{3,}', ocr_text.replace(".", "").replace(",", ""))
+    monto_detected = int(max(nums, key=len)) if nums else None
+    cleaned_text = ocr_text.replace(" ", "").replace("\n", "")
+    ok = nequi_destino in cleaned_text and monto_detected and abs(monto_detected - monto) <= tolerancia
+    return bool(ok), monto_detected
+
+def path_actual(item, preprocess):
+    text = ocr.run_ocr(item["path"], "spa", preprocess)
+    _, amount = legacy_verify(text, item["amount"], item["destination"])
+    cleaned = text.replace(" ", "").replace("\n", "")
+    fields = {"amount": amount, "destination": item["destination"] if item["destination"] in cleaned else None,
+              "date": None, "reference": None}
+    return text, fields, lambda monto: legacy_verify(text, monto, item["destination"])[0]
+
+def path_texto(item, preprocess):
+    # mismo OCR de imagen completa, reglas por etiqueta de receipt.parse_text
+    text = ocr.run_ocr(item["path"], "spa", preprocess)
+    return text, receipt.parse_text(text), lambda monto: receipt.verify_receipt(text, monto, item["destination"])[0]
+
+def path_campos(item, preprocess):
+    r = receipt.parse_file(item["path"], "spa", preprocess, fast_width=FAST_WIDTH)
+    return r["text"], r["fields"], \
+        lambda monto: receipt.verify_receipt(r["text"], monto, item["destination"], fields=r["fields"])[0]
+
+PATHS = {"actual": path_actual, "texto": path_texto, "campos": path_campos}
+
+
+def check_text_cases():
+    # parse_amount sobre la línea tal cual (la relectura puede incluir la etiqueta) y parse_text
+    bad = []
+    for t, want in TEXT_CASES:
+        got = (receipt.parse_amount(t.splitlines()[-1]), receipt.parse_text(t)["amount"])
+        if got != (want, want):
+            bad.append((t, want, got))
+    print(f"textos fijos: {len(TEXT_CASES) - len(bad)}/{len(TEXT_CASES)} montos correctos")
+    for t, want, got in bad:
+        print(f"  {t!r}: esperado {want}, leído {got[0]} (línea) / {got[1]} (texto)")
+    return not bad
+
+
+def run(items, label, fn, preprocess):
+    times, hits, ok, false_ok = [], {f: 0 for f in receipt.FIELDS}, 0, 0
+    labeled = {f: sum(1 for it in items if it[f] is not None) for f in receipt.FIELDS}
+    for item in items:
+        t0 = time.perf_counter()
+        _, fields, verify = fn(item, preprocess)
+        times.append(time.perf_counter() - t0)
+        for f in receipt.FIELDS:
+            if item[f] is not None and fields.get(f) is not None:
+                hits[f] += (abs(fields[f] - item[f]) <= 2000) if f == "amount" else (str(fields[f]) == str(item[f]))
+        ok += verify(item["amount"])
+        false_ok += verify(item["amount"] + 400000)
+    n = len(items)
+    times.sort()
+    res = {"n": n, "p50_ms": statistics.median(times) * 1000, "p90_ms": times[max(0, int(n * 0.9) - 1)] * 1000,
+           "total_s": sum(times), "verify_ok": ok / n, "false_ok": false_ok / n,
+           "fields": {f: hits[f] / labeled[f] if labeled[f] else None for f in receipt.FIELDS}}
+    acc = "  ".join(f"{f[:4]}={v:6.1%}" if v is not None else f"{f[:4]}=   n/a" for f, v in res["fields"].items())
+    print(f"{label:<8} n={n:<4} p50={res['p50_ms']:7.0f} ms  p90={res['p90_ms']:7.0f} ms  total={res['total_s']:6.1f}s  "
+          f"{acc}  verify={res['verify_ok']:6.1%}  falso_ok={res['false_ok']:6.1%}")
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", help="directorio con imágenes + labels.csv")
+    ap.add_argument("--synthetic", type=int, default=0, help="generar N comprobantes sintéticos")
+    ap.add_argument("--paths", default="actual,texto,campos", help="caminos a medir (actual, texto, campos)")
+    ap.add_argument("--fast-width", type=int, default=receipt.FAST_WIDTH, help="ancho de la primera pasada")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="guardar resultados en JSON")
+    args = ap.parse_args()
+    check_text_cases()
+    if not ocr.available():
+        sys.exit("Pillow/pytesseract no disponibles.")
+    random.seed(args.seed)
+    global FAST_WIDTH
+    FAST_WIDTH = args.fast_width
+
+    tmp = None
+    corpus = args.corpus
+    if not corpus:
+        tmp = tempfile.TemporaryDirectory()
+        corpus = tmp.name
+        make_synthetic(corpus, args.synthetic or 10)
+    items = load_corpus(corpus)
+
+    preprocess = dict(ocr.DEFAULT_PREPROCESS)
+    results = {name: run(items, name, PATHS[name], preprocess) for name in args.paths.split(",")}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"resultados en {args.out}")
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
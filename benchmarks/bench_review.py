@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# benchmarks/bench_review.py
+# Aprobación de inversiones pendientes: el flujo antiguo de admin_process_callback
+# (SELECT + 2 UPDATE + COMMIT por inversión) contra review.decide (un lote en
+# una transacción). Comprueba además que ambos dejan los mismos totales por
+# usuario y que un lote repetido no cambia nada.
+#
+# Uso:
+#   python benchmarks/bench_review.py --sizes 10,100,1000 --users 2000
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+import review  # noqa: E402
+import stats  # noqa: E402
+from database import ConnectionPool  # noqa: E402
+
+
+def seed(path, users, pending):
+    db = ConnectionPool(path)
+    migrations.migrate(db, verbose=False)
+    rnd = random.Random(42)
+    with db.transaction() as cur:
+        cur.executemany("INSERT INTO usuarios (user_id, nombre) VALUES (?, ?)", [(i, f"u{i}") for i in range(1, users + 1)])
+        cur.executemany(
+            "INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado, ocr_ok) VALUES (?, ?, ?, ?, 'Pendiente', 1)",
+            [(rnd.randint(1, users), rnd.choice([100000, 300000, 500000]), f"2025-01-{rnd.randint(1, 28):02d}", "04/01/2025")
+             for _ in range(pending)])
+        stats.rebuild(cur=cur)
+    return db
+
+
+def approve_one_by_one(db, ids):
+    # igual que el admin_process_callback anterior, sin los envíos
+    for inv_id in ids:
+        with db.transaction() as cur:
+            cur.execute("SELECT user_id, monto, fecha_pago, estado, fecha_inversion FROM inversiones WHERE id=?", (inv_id,))
+            uid, monto, _, estado_prev, finv = cur.fetchone()
+            cur.execute("UPDATE inversiones SET estado='Aprobado' WHERE id=?", (inv_id,))
+            cur.execute("UPDATE usuarios SET total_invertido = total_invertido + ?, ganancia_total = ganancia_total + ? WHERE user_id=?",
+                        (monto, int(monto * 0.6), uid))
+            stats.on_investment_state(cur, monto, finv, estado_prev, "Aprobado")
+
+
+def approve_batch(db, ids):
+    with db.transaction() as cur:
+        return review.decide(cur, ids, review.APROBADO)
+
+
+def totals(db):
+    return db.fetchall("SELECT user_id, total_invertido, ganancia_total FROM usuarios ORDER BY user_id")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10,100,1000")
+    ap.add_argument("--users", type=int, default=2000)
+    args = ap.parse_args()
+
+    print(f"{'lote':>6}  {'uno a uno':>12} {'inv/s':>9}  {'lote':>10} {'inv/s':>9}  {'speedup':>8}")
+    for size in [int(x) for x in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as d:
+            a = seed(os.path.join(d, "a.db"), args.users, size)
+            b = seed(os.path.join(d, "b.db"), args.users, size)
+            ids = [r[0] for r in a.fetchall("SELECT id FROM inversiones ORDER BY id")]
+
+            t0 = time.perf_counter()
+            approve_one_by_one(a, ids)
+            t_old = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            changed = approve_batch(b, ids)
+            t_new = time.perf_counter() - t0
+
+            assert len(changed) == size
+            assert totals(a) == totals(b), "los totales por usuario no coinciden"
+            assert not approve_batch(b, ids), "un lote repetido no debe cambiar nada"
+            assert totals(a) == totals(b)
+            assert not stats.verify(b), "deriva en estadísticas"
+            print(f"{size:>6}  {t_old * 1000:>10.1f}ms {size / t_old:>9.0f}  {t_new * 1000:>8.1f}ms {size / t_new:>9.0f}  "
+                  f"x{t_old / t_new:>7.1f}")
+            a.close_all(); b.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# benchmarks/bench_router.py
+# Coste de despacho por update: cadena de handlers al estilo TeleBot (se
+# prueba cada func=lambda m: m.text == "..." en orden hasta que una acierta)
+# contra router.Router (un dict), a medida que crece el número de botones.
+# Se mide el peor caso de la cadena (último botón y texto libre -> fallback)
+# y un callback que va al último prefijo registrado.
+#
+# Uso:
+#   python benchmarks/bench_router.py --n 50000 --sizes 10,50,200,1000
+
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import Router  # noqa: E402
+
+
+def noop(update):
+    pass
+
+
+def build_chain(labels, prefixes):
+    # mismo recorrido que TeleBot._notify_command_handlers: content_type + func de cada handler
+    msg_handlers = [{"content_types": ["text"], "func": (lambda m, t=t: m.text == t), "function": noop} for t in labels]
+    msg_handlers.append({"content_types": ["text"], "func": lambda m: True, "function": noop})
+    cb_handlers = [{"func": (lambda c, p=p: c.data and c.data.startswith(p)), "function": noop} for p in prefixes]
+
+    def dispatch_message(m):
+        for h in msg_handlers:
+            if m.content_type in h["content_types"] and h["func"](m):
+                h["function"](m)
+                return
+
+    def dispatch_callback(c):
+        for h in cb_handlers:
+            if h["func"](c):
+                h["function"](c)
+                return
+    return dispatch_message, dispatch_callback
+
+
+def build_router(labels, prefixes):
+    r = Router(is_admin=lambda uid: uid == 1)
+    for i, t in enumerate(labels):
+        r.text(t, admin=(i % 4 == 0))(noop)
+    for p in prefixes:
+        r.callback(p)(noop)
+    r.default(noop)
+    return r.dispatch_message, r.dispatch_callback
+
+
+def per_call(fn, arg, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(arg)
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=50000)
+    ap.add_argument("--sizes", default="10,50,200,1000")
+    args = ap.parse_args()
+
+    user = SimpleNamespace(id=1)
+    print(f"{'entradas':>8}  {'cadena último':>14} {'router último':>14}  {'cadena libre':>13} {'router libre':>13}  "
+          f"{'cadena cb':>10} {'router cb':>10}   (ns por update)")
+    for size in [int(x) for x in args.sizes.split(",")]:
+        labels = [f"🔘 Opción {i}" for i in range(size)]
+        prefixes = [f"P{i}|" for i in range(max(4, size // 10))]
+        last = SimpleNamespace(text=labels[-1], content_type="text", from_user=user)
+        free = SimpleNamespace(text="hola, ¿cómo invierto?", content_type="text", from_user=user)
+        cb = SimpleNamespace(data=f"{prefixes[-1]}123", from_user=user)
+        row = [size]
+        chain_m, chain_c = build_chain(labels, prefixes)
+        router_m, router_c = build_router(labels, prefixes)
+        row += [per_call(chain_m, last, args.n), per_call(router_m, last, args.n),
+                per_call(chain_m, free, args.n), per_call(router_m, free, args.n),
+                per_call(chain_c, cb, args.n), per_call(router_c, cb, args.n)]
+        print("{:>8}  {:>14.0f} {:>14.0f}  {:>13.0f} {:>13.0f}  {:>10.0f} {:>10.0f}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
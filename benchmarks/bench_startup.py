@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# benchmarks/bench_startup.py
+# Tiempo de arranque en frío de main.py, en procesos nuevos:
+# - import main (con python -X importtime): total y módulos más caros
+# - create_application(start=False): migraciones + bot + app Flask
+# - lo que se dejó de importar al arrancar (PIL, pytesseract, flask) medido aparte
+#
+# --record añade una línea JSON (fecha, commit, medianas) a un archivo para
+# seguir la evolución entre versiones.
+#
+# Uso:
+#   python benchmarks/bench_startup.py --runs 5 --top 15
+#   python benchmarks/bench_startup.py --record benchmarks/startup_history.jsonl
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FACTORY = """
+import time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+main.create_application(start=False)
+t2 = time.perf_counter()
+print(f"{(t1 - t0) * 1000:.3f} {(t2 - t1) * 1000:.3f}")
+"""
+
+
+def run(args, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def parse_importtime(stderr):
+    """Líneas 'import time: self | cumulative | módulo' -> {módulo: (self_us, cum_us)}."""
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+            out[name.strip()] = (int(self_us), int(cum_us))
+        except ValueError:
+            pass
+    return out
+
+
+def import_cost(module, cwd):
+    r = run(["-X", "importtime", "-c", f"import {module}"], cwd)
+    if r.returncode != 0:
+        return None
+    return parse_importtime(r.stderr).get(module, (0, 0))[1] / 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--record", help="archivo .jsonl donde añadir el resultado")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        imports, factory, last = [], [], {}
+        for i in range(args.runs):
+            r = run(["-X", "importtime", "-c", "import main"], d)
+            if r.returncode != 0:
+                sys.exit(r.stderr[-2000:])
+            last = parse_importtime(r.stderr)
+            imports.append(last.get("main", (0, 0))[1] / 1000)
+            # cada corrida en un directorio nuevo: incluye crear la base y migrar
+            with tempfile.TemporaryDirectory() as d2:
+                r = run(["-c", FACTORY], d2)
+                if r.returncode != 0:
+                    sys.exit(r.stderr[-2000:])
+                factory.append(float(r.stdout.strip().splitlines()[-1].split()[1]))
+        if not os.listdir(d):
+            print("import main: sin efectos secundarios en el directorio de trabajo ✔")
+        else:
+            print("⚠️ import main creó:", os.listdir(d))
+
+        print(f"import main              mediana {statistics.median(imports):8.1f} ms  (min {min(imports):.1f})")
+        print(f"create_application()     mediana {statistics.median(factory):8.1f} ms")
+        print("\nmódulos más caros (acumulado, última corrida):")
+        for name, (s, c) in sorted(last.items(), key=lambda kv: -kv[1][1])[:args.top]:
+            print(f"  {c / 1000:8.1f} ms  {name}")
+
+        deferred = {m: import_cost(m, d) for m in ("PIL.Image", "pytesseract", "flask")}
+        print("\ndiferido hasta el primer uso:")
+        for m, ms in deferred.items():
+            print(f"  {m:<12} " + (f"{ms:8.1f} ms" if ms is not None else "   no instalado"))
+
+    if args.record:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip()
+        except Exception:
+            commit = ""
+        rec = {"ts": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+               "python": sys.version.split()[0], "import_ms": round(statistics.median(imports), 1),
+               "factory_ms": round(statistics.median(factory), 1),
+               "deferred_ms": {m: (round(v, 1) if v is not None else None) for m, v in deferred.items()}}
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+        print(f"\nregistrado en {args.record}")
+
+
+if __name__ == "__main__":
+    main()
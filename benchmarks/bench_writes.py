@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# benchmarks/bench_writes.py
+# Registro de usuarios bajo concurrencia: COMMITs y throughput.
+# - antes: cada paso (nombre, teléfono, cédula, nequi) hace su UPDATE en
+#   usuarios y guarda el estado de la conversación, cada uno con su COMMIT
+# - ahora: los campos viajan en el estado de la conversación, el estado va por
+#   el GroupCommitWriter y al final hay un solo UPDATE
+# Comprueba que ambos dejan los mismos datos en usuarios.
+#
+# Uso:
+#   python benchmarks/bench_writes.py --users 2000 --threads 8
+#   python benchmarks/bench_writes.py --synchronous FULL --delay-ms 20
+
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+from conversations import ConversationEngine, SqliteStateStore  # noqa: E402
+from database import ConnectionPool  # noqa: E402
+from writer import GroupCommitWriter  # noqa: E402
+
+FIELDS = ("nombre", "telefono", "cedula", "nequi")
+
+
+class Msg:
+    def __init__(self, uid, text):
+        self.chat = self.from_user = self
+        self.id = uid
+        self.text = text
+
+
+def setup(path, users, synchronous):
+    db = ConnectionPool(path, synchronous=synchronous)
+    migrations.migrate(db, verbose=False)
+    with db.transaction() as cur:
+        cur.executemany("INSERT INTO usuarios (user_id) VALUES (?)", [(u,) for u in range(1, users + 1)])
+    commits = [0]
+    lock = threading.Lock()
+
+    def observer(op, seconds, error):
+        if op == "transaction":
+            with lock:
+                commits[0] += 1
+    db.observer = observer
+    return db, commits
+
+
+def engine_old(db):
+    conv = ConversationEngine(SqliteStateStore(db))
+    for i, field in enumerate(FIELDS):
+        nxt = FIELDS[i + 1] if i + 1 < len(FIELDS) else None
+
+        def step(m, data, field=field, nxt=nxt):
+            db.execute(f"UPDATE usuarios SET {field}=? WHERE user_id=?", (m.text, m.id))
+            if nxt:
+                conv.goto(m.id, nxt)
+            else:
+                conv.finish(m.id)
+        conv.state(field)(step)
+    return conv
+
+
+def engine_new(db, writer):
+    conv = ConversationEngine(SqliteStateStore(db, writer=writer))
+    for i, field in enumerate(FIELDS):
+        nxt = FIELDS[i + 1] if i + 1 < len(FIELDS) else None
+
+        def step(m, data, field=field, nxt=nxt):
+            if nxt:
+                conv.goto(m.id, nxt, dict(data, **{field: m.text}))
+                return
+            db.execute("UPDATE usuarios SET nombre=COALESCE(?, nombre), telefono=COALESCE(?, telefono), "
+                       "cedula=COALESCE(?, cedula), nequi=? WHERE user_id=?",
+                       (data.get("nombre"), data.get("telefono"), data.get("cedula"), m.text, m.id))
+            conv.finish(m.id)
+        conv.state(field)(step)
+    return conv
+
+
+def run(conv, users, threads):
+    """Cada usuario: goto(nombre) + 4 mensajes; los usuarios se reparten entre los hilos."""
+    q = queue.Queue()
+    for u in range(1, users + 1):
+        q.put(u)
+    lat = []
+    lock = threading.Lock()
+
+    def worker():
+        mine = []
+        while True:
+            try:
+                u = q.get_nowait()
+            except queue.Empty:
+                break
+            conv.goto(u, "nombre")
+            for field in FIELDS:
+                t0 = time.perf_counter()
+                conv.dispatch(Msg(u, f"{field}-{u}"))
+                mine.append(time.perf_counter() - t0)
+        with lock:
+            lat.extend(mine)
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return time.perf_counter() - t0, sorted(lat)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--delay-ms", type=float, default=50)
+    ap.add_argument("--synchronous", default="NORMAL")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        db_a, commits_a = setup(os.path.join(d, "a.db"), args.users, args.synchronous)
+        wall_a, lat_a = run(engine_old(db_a), args.users, args.threads)
+
+        db_b, commits_b = setup(os.path.join(d, "b.db"), args.users, args.synchronous)
+        writer = GroupCommitWriter(db_b, max_delay=args.delay_ms / 1000.0)
+        writer.start()
+        wall_b, lat_b = run(engine_new(db_b, writer), args.users, args.threads)
+        writer.flush()
+
+        q = "SELECT user_id, nombre, telefono, cedula, nequi FROM usuarios ORDER BY user_id"
+        assert db_a.fetchall(q) == db_b.fetchall(q), "los usuarios no coinciden"
+        assert db_b.scalar("SELECT COUNT(*) FROM conversaciones") == 0, "quedaron conversaciones abiertas"
+        ws = writer.stats()
+
+        print(f"{args.users} registros, {args.threads} hilos, synchronous={args.synchronous}")
+        print(f"{'':8} {'COMMITs':>8} {'por registro':>13} {'registros/s':>12} {'paso p50':>10} {'paso p99':>10}")
+        for name, wall, lat, commits in (("antes", wall_a, lat_a, commits_a[0]), ("ahora", wall_b, lat_b, commits_b[0])):
+            print(f"{name:8} {commits:>8} {commits / args.users:>13.2f} {args.users / wall:>12.0f} "
+                  f"{lat[len(lat) // 2] * 1000:>8.3f}ms {lat[int(len(lat) * 0.99)] * 1000:>8.3f}ms")
+        print(f"writer: {ws['writes']} escrituras en {ws['batches']} lotes (media {ws['batch_avg']:.1f}, "
+              f"máx {ws['batch_max']}), retraso máx {ws['delay_max'] * 1000:.1f} ms")
+        db_a.close_all(); db_b.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# cache.py
+# Caché LRU con expiración (TTL) para lecturas repetidas de la base:
+# - Acotada a maxsize entradas; al llenarse sale la menos usada
+# - Cada entrada vence a los ttl segundos aunque nadie la invalide (red de
+#   seguridad si alguna escritura se escapa de la invalidación)
+# - get_or_load(): lectura a través de la caché. Si hubo una invalidación
+#   mientras se cargaba, el valor se devuelve pero no se guarda (podría ser
+#   anterior a esa escritura)
+# - stats(): aciertos, fallos, desalojos y tamaño para /metrics
+#
+# Uso:
+#   profiles = TTLCache(maxsize=10000, ttl=300)
+#   row = profiles.get_or_load(uid, repo.profile)
+#   profiles.invalidate(uid)      # después de escribir
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, maxsize=10000, ttl=300.0, clock=time.monotonic):
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._data = OrderedDict()   # clave -> (vence, valor), de menos a más reciente
+        self._epoch = 0              # +1 en cada invalidación (ver get_or_load)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader):
+        """Valor de la caché o loader(key), que se guarda para las siguientes lecturas."""
+        now = self.clock()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+            epoch = self._epoch
+        value = loader(key)
+        with self._lock:
+            if epoch == self._epoch and self.maxsize > 0:
+                self._data[key] = (now + self.ttl, value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            n = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": len(self._data), "hit_rate": self.hits / n if n else 0.0}
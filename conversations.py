@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# conversations.py
+# Máquina de estados para las conversaciones de varios pasos (registro,
+# actualización de perfil, envío de comprobante). Reemplaza a
+# register_next_step_handler y a _pending_updates:
+# - El estado vive en un store enchufable (SQLite por defecto, memoria para pruebas)
+# - Búsqueda O(1) por chat_id en cada update
+# - Expiración por TTL: las conversaciones abandonadas no ocupan memoria ni filas
+# - Sobrevive a reinicios del proceso (store SQLite)
+# - Con un GroupCommitWriter (writer.py) los cambios de estado se agrupan en
+#   pocos COMMIT; mientras tanto se leen de memoria (cada chat ve lo último suyo)
+
+import heapq
+import itertools
+import json
+import threading
+import time
+import traceback
+
+
+# ---------------- Stores ----------------
+class SqliteStateStore:
+    """
+    Tabla conversaciones (migración 6) sobre un database.ConnectionPool. Con
+    writer, set/delete se encolan y get lee lo aún no confirmado de memoria.
+    """
+
+    def __init__(self, db, writer=None):
+        self.db = db
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._unsaved = {}    # chat_id -> (seq, (estado, datos, expira) o None si se borró)
+        self._seq = itertools.count()
+
+    def _write(self, chat_id, value, sql, params):
+        if self.writer is None:
+            self.db.execute(sql, params)
+            return
+        with self._lock:
+            seq = next(self._seq)
+            self._unsaved[chat_id] = (seq, value)
+        self.writer.submit(sql, params, on_done=lambda error: self._saved(chat_id, seq))
+
+    def _saved(self, chat_id, seq):
+        with self._lock:
+            cur = self._unsaved.get(chat_id)
+            if cur is not None and cur[0] == seq:
+                del self._unsaved[chat_id]
+
+    def get(self, chat_id):
+        with self._lock:
+            pending = self._unsaved.get(chat_id)
+        if pending is not None:
+            if pending[1] is None:
+                return None
+            estado, datos, expira = pending[1]
+            if expira is not None and expira < time.time():
+                return None
+            return estado, dict(datos)
+        row = self.db.fetchone("SELECT estado, datos, expira FROM conversaciones WHERE chat_id=?", (chat_id,))
+        if not row:
+            return None
+        estado, datos, expira = row
+        if expira is not None and expira < time.time():
+            self.db.execute("DELETE FROM conversaciones WHERE chat_id=? AND expira=?", (chat_id, expira))
+            return None
+        return estado, (json.loads(datos) if datos else {})
+
+    def set(self, chat_id, estado, datos, expira):
+        self._write(
+            chat_id, (estado, dict(datos or {}), expira),
+            "INSERT INTO conversaciones (chat_id, estado, datos, expira) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET estado=excluded.estado, datos=excluded.datos, expira=excluded.expira",
+            (chat_id, estado, json.dumps(datos, separators=(",", ":")) if datos else None, expira))
+
+    def delete(self, chat_id):
+        self._write(chat_id, None, "DELETE FROM conversaciones WHERE chat_id=?", (chat_id,))
+
+    def sweep(self, now=None):
+        n, _ = self.db.execute("DELETE FROM conversaciones WHERE expira < ?", (now or time.time(),))
+        return n
+
+    def count(self):
+        return self.db.scalar("SELECT COUNT(*) FROM conversaciones", default=0)
+
+
+class MemoryStateStore:
+    """Misma interfaz en memoria (benchmarks/pruebas). No sobrevive a reinicios."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}    # chat_id -> (estado, datos, expira)
+        self._heap = []    # (expira, chat_id) para sweep()
+
+    def get(self, chat_id):
+        with self._lock:
+            v = self._data.get(chat_id)
+            if v is None:
+                return None
+            if v[2] is not None and v[2] < time.time():
+                del self._data[chat_id]
+                return None
+            return v[0], dict(v[1] or {})
+
+    def set(self, chat_id, estado, datos, expira):
+        with self._lock:
+            self._data[chat_id] = (estado, dict(datos or {}), expira)
+            if expira is not None:
+                heapq.heappush(self._heap, (expira, chat_id))
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._data.pop(chat_id, None)
+
+    def sweep(self, now=None):
+        now = now or time.time()
+        n = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] < now:
+                expira, chat_id = heapq.heappop(self._heap)
+                v = self._data.get(chat_id)
+                if v is not None and v[2] == expira:
+                    del self._data[chat_id]
+                    n += 1
+        return n
+
+    def count(self):
+        with self._lock:
+            return len(self._data)
+
+
+# ---------------- Motor ----------------
+class ConversationEngine:
+    """
+    Uso:
+        conv = ConversationEngine(SqliteStateStore(db), default_ttl=3600)
+
+        @conv.state("reg_nombre")
+        def step_nombre(message, data):
+            ...
+            conv.goto(message.chat.id, "reg_telefono", data)
+
+        conv.goto(chat_id, "reg_nombre")   # iniciar
+        conv.dispatch(message)             # en el handler de mensajes
+    """
+
+    def __init__(self, store, default_ttl=86400):
+        self.store = store
+        self.default_ttl = default_ttl
+        self._handlers = {}
+        self._ttls = {}
+
+    def state(self, name, ttl=None):
+        def deco(fn):
+            self._handlers[name] = fn
+            if ttl is not None:
+                self._ttls[name] = ttl
+            return fn
+        return deco
+
+    def goto(self, chat_id, name, data=None, ttl=None):
+        if name not in self._handlers:
+            raise KeyError(f"Estado desconocido: {name}")
+        ttl = ttl or self._ttls.get(name, self.default_ttl)
+        self.store.set(chat_id, name, data or {}, time.time() + ttl if ttl else None)
+
+    def finish(self, chat_id):
+        self.store.delete(chat_id)
+
+    def current(self, chat_id):
+        return self.store.get(chat_id)
+
+    def active(self, chat_id):
+        return self.store.get(chat_id) is not None
+
+    def dispatch(self, message):
+        """Ejecuta el handler del estado actual del chat. False si no hay conversación."""
+        cur = self.store.get(message.chat.id)
+        if cur is None:
+            return False
+        name, data = cur
+        fn = self._handlers.get(name)
+        if fn is None:
+            self.store.delete(message.chat.id)
+            return False
+        fn(message, data)
+        return True
+
+    def start_sweeper(self, interval=600):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.store.sweep()
+                except Exception:
+                    traceback.print_exc()
+        t = threading.Thread(target=loop, name="conv-sweeper", daemon=True)
+        t.start()
+        return t
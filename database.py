@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# database.py
+# Pool de conexiones SQLite para InversionesCT:
+# - Una conexión persistente por hilo (Flask, backup, workers de polling)
+# - Journal WAL + pragmas afinados (synchronous, cache_size, mmap_size)
+# - busy_timeout + reintentos cuando la base está bloqueada
+# - Transacciones con context manager (BEGIN IMMEDIATE / COMMIT / ROLLBACK)
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_CACHE_KB = 16 * 1024        # 16 MB de page cache por conexión
+DEFAULT_MMAP_MB = 128
+LOCK_RETRIES = 5
+
+
+def _is_locked_error(e):
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+
+class ConnectionPool:
+    """
+    Conexiones SQLite thread-local. Cada hilo reutiliza su propia conexión
+    en lugar de abrir/cerrar una por consulta; las conexiones de hilos que
+    ya terminaron se cierran en el siguiente acceso de un hilo nuevo.
+    """
+
+    def __init__(self, path, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS,
+                 cache_kb=DEFAULT_CACHE_KB, mmap_mb=DEFAULT_MMAP_MB,
+                 synchronous="NORMAL"):
+        self.path = path
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.cache_kb = int(cache_kb)
+        self.mmap_mb = int(mmap_mb)
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = {}  # thread -> conexión
+        # observer(op, segundos, error): métricas (ver metrics.py); None = sin coste
+        self.observer = None
+
+    # ---------------- conexiones ----------------
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0,
+                               check_same_thread=False, isolation_level=None)
+        cur = conn.cursor()
+        cur.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA synchronous={self.synchronous}")
+        cur.execute(f"PRAGMA cache_size=-{self.cache_kb}")
+        cur.execute(f"PRAGMA mmap_size={self.mmap_mb * 1024 * 1024}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+        return conn
+
+    def _reap_dead(self):
+        # llamado con self._lock tomado
+        for t in [t for t in self._conns if not t.is_alive()]:
+            try:
+                self._conns.pop(t).close()
+            except Exception:
+                pass
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._reap_dead()
+                self._conns[threading.current_thread()] = conn
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._conns.values():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._conns.clear()
+        self._local = threading.local()
+
+    def checkpoint(self):
+        """
+        Vuelca el WAL al archivo principal. Necesario antes de copiar el
+        .db a mano (zip, /dumpdb), si no la copia puede quedar sin los
+        últimos cambios.
+        """
+        try:
+            self.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError:
+            pass
+
+    def open_connections(self):
+        with self._lock:
+            return len(self._conns)
+
+    # ---------------- transacciones ----------------
+    def _begin(self, conn, immediate):
+        stmt = "BEGIN IMMEDIATE" if immediate else "BEGIN"
+        delay = 0.05
+        for attempt in range(LOCK_RETRIES):
+            try:
+                conn.execute(stmt)
+                return
+            except sqlite3.OperationalError as e:
+                if not _is_locked_error(e) or attempt == LOCK_RETRIES - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """
+        Uso:
+            with db.transaction() as cur:
+                cur.execute("UPDATE ...")
+        Hace COMMIT al salir o ROLLBACK si hay excepción. Las transacciones
+        anidadas en el mismo hilo se unen a la exterior.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+            return
+        obs = self.observer
+        t0 = time.perf_counter() if obs else 0
+        ok = False
+        self._begin(conn, immediate)
+        cur = conn.cursor()
+        try:
+            yield cur
+            conn.execute("COMMIT")
+            ok = True
+        except BaseException:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            raise
+        finally:
+            cur.close()
+            if obs:
+                obs("transaction", time.perf_counter() - t0, not ok)
+
+    # ---------------- atajos ----------------
+    def execute(self, sql, params=()):
+        """Escritura en su propia transacción. Devuelve (rowcount, lastrowid)."""
+        with self.transaction() as cur:
+            cur.execute(sql, params)
+            return cur.rowcount, cur.lastrowid
+
+    def _observed(self, op, fn, sql, params):
+        obs = self.observer
+        if not obs:
+            return fn(self.connection().execute(sql, params))
+        t0 = time.perf_counter()
+        try:
+            r = fn(self.connection().execute(sql, params))
+        except BaseException:
+            obs(op, time.perf_counter() - t0, True)
+            raise
+        obs(op, time.perf_counter() - t0, False)
+        return r
+
+    def fetchone(self, sql, params=()):
+        return self._observed("fetchone", sqlite3.Cursor.fetchone, sql, params)
+
+    def fetchall(self, sql, params=()):
+        return self._observed("fetchall", sqlite3.Cursor.fetchall, sql, params)
+
+    def scalar(self, sql, params=(), default=None):
+        row = self.fetchone(sql, params)
+        if not row or row[0] is None:
+            return default
+        return row[0]
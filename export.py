@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# export.py
+# Exportación de la base de datos para /download-db y /dumpdb:
+# - Instantánea consistente con la API de backup en línea de SQLite (en WAL no
+#   bloquea a los escritores y no depende de que el .db esté al día)
+# - La instantánea es un archivo temporal privado de cada petición (se borra
+#   del directorio apenas se abre), así varias descargas no se pisan
+# - El zip se genera por trozos mientras se envía: memoria constante aunque la
+#   base crezca a varios GB
+# - Exportación de filas (CSV/JSONL) desde un cursor propio, fila a fila,
+#   con memoria constante (history.py / /exportar)
+
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import zipfile
+
+CHUNK = 1024 * 1024
+
+
+def snapshot(src_path, dest_path):
+    """Copia consistente de src_path en dest_path (API de backup, un solo paso)."""
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(dest_path)
+    try:
+        # un solo paso = una sola transacción de lectura: la copia es un punto en el tiempo
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+def open_snapshot(src_path, tmp_dir=None):
+    """
+    Devuelve un archivo abierto (rb) con una instantánea de src_path. El archivo
+    ya no tiene nombre en disco: se libera al cerrarlo.
+    """
+    fd, path = tempfile.mkstemp(prefix="inversionesct_snap_", suffix=".db", dir=tmp_dir)
+    os.close(fd)
+    try:
+        snapshot(src_path, path)
+        f = open(path, "rb")
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return f
+
+
+class _Sink:
+    """Destino no buscable para ZipFile: acumula lo escrito hasta que se drena."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_zip(fileobj, arcname, chunk_size=CHUNK):
+    """Genera los bytes de un .zip con fileobj como única entrada."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open(arcname, "w", force_zip64=True) as entry:
+            while True:
+                chunk = fileobj.read(chunk_size)
+                if not chunk:
+                    break
+                entry.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+def stream_db_zip(src_path, arcname=None, tmp_dir=None):
+    """
+    Instantánea + zip en streaming. Pensado para Flask Response. La instantánea
+    se toma aquí mismo (no al empezar a iterar) para que un error salga antes
+    de enviar cabeceras.
+    """
+    arcname = arcname or os.path.basename(src_path)
+    f = open_snapshot(src_path, tmp_dir)
+
+    def gen():
+        try:
+            yield from iter_zip(f, arcname)
+        finally:
+            f.close()
+    return gen()
+
+def spooled_db_zip(src_path, arcname=None, tmp_dir=None, max_mem=8 * 1024 * 1024):
+    """
+    Instantánea comprimida en un SpooledTemporaryFile (pasa a disco si supera
+    max_mem), listo para bot.send_document. Posicionado al inicio.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=max_mem, dir=tmp_dir)
+    for chunk in stream_db_zip(src_path, arcname, tmp_dir):
+        out.write(chunk)
+    out.seek(0)
+    return out
+
+
+# ---------------- filas: CSV / JSONL ----------------
+def iter_query(src_path, sql, params=(), arraysize=1000):
+    """
+    Filas de sql en una conexión de solo lectura propia. El cursor avanza
+    paso a paso en SQLite: nunca se cargan todas las filas en memoria, y toda
+    la exportación ve una sola instantánea (en WAL no bloquea a los escritores).
+    """
+    conn = sqlite3.connect(src_path, check_same_thread=False)
+    try:
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(arraysize)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+def iter_csv(columns, rows, flush_bytes=64 * 1024):
+    """Bytes UTF-8 de un CSV con cabecera, en trozos de ~flush_bytes."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for row in rows:
+        w.writerow(row)
+        if buf.tell() >= flush_bytes:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def iter_jsonl(columns, rows, flush_bytes=64 * 1024):
+    """Bytes UTF-8 de un JSON por línea ({columna: valor}), en trozos de ~flush_bytes."""
+    parts, size = [], 0
+    for row in rows:
+        line = json.dumps(dict(zip(columns, row)), ensure_ascii=False, separators=(",", ":")) + "\n"
+        parts.append(line)
+        size += len(line)
+        if size >= flush_bytes:
+            yield "".join(parts).encode("utf-8")
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+def spooled_gzip(chunks, tmp_dir=None, max_mem=8 * 1024 * 1024):
+    """Comprime un iterable de bytes en un SpooledTemporaryFile (para bot.send_document)."""
+    out = tempfile.SpooledTemporaryFile(max_size=max_mem, dir=tmp_dir)
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6) as gz:
+        for chunk in chunks:
+            gz.write(chunk)
+    out.seek(0)
+    return out
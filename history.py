@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# history.py
+# Historial de inversiones para el panel admin:
+# - Filtros por estado / usuario / rango de fechas (fecha_inversion)
+# - Paginación por clave sobre inversiones.id (id < último visto): cada página
+#   cuesta lo mismo aunque haya millones de filas antes
+# - Filtros compactos para callback_data (máx. 64 bytes en Telegram)
+# - Consulta de exportación para export.iter_query (CSV/JSONL en streaming)
+#
+# Filtros en texto (/historial, /exportar):
+#   estado=aprobado user=123 desde=2025-01-01 hasta=2025-01-31
+
+import datetime
+
+ESTADOS = {"p": "Pendiente", "a": "Aprobado", "r": "Rechazado"}
+
+PAGE_COLUMNS = ("id", "user_id", "monto", "estado", "fecha_inversion")
+EXPORT_COLUMNS = ("id", "user_id", "monto", "fecha_inversion", "fecha_pago", "estado", "ocr_ok", "comprobante_sha")
+
+
+def _date(s):
+    try:
+        return datetime.date.fromisoformat(s).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+def parse_filters(text):
+    """
+    "estado=aprobado user=123 desde=2025-01-01" -> {"estado": "Aprobado", ...}.
+    Devuelve (filtros, error); error es un texto para el admin o None.
+    """
+    f = {}
+    for tok in (text or "").split():
+        key, sep, val = tok.partition("=")
+        key = key.lower()
+        if not sep or not val:
+            return None, f"Filtro inválido: {tok}"
+        if key == "estado":
+            estado = ESTADOS.get(val[0].lower())
+            if not estado:
+                return None, f"Estado inválido: {val}"
+            f["estado"] = estado
+        elif key in ("user", "usuario"):
+            if not val.isdigit():
+                return None, f"Usuario inválido: {val}"
+            f["user"] = int(val)
+        elif key in ("desde", "hasta"):
+            d = _date(val)
+            if not d:
+                return None, f"Fecha inválida (usa AAAA-MM-DD): {val}"
+            f[key] = d
+        else:
+            return None, f"Filtro desconocido: {key}"
+    return f, None
+
+def describe(f):
+    parts = []
+    if f.get("estado"):
+        parts.append(f["estado"])
+    if f.get("user"):
+        parts.append(f"usuario {f['user']}")
+    if f.get("desde") or f.get("hasta"):
+        parts.append(f"{f.get('desde', '…')} → {f.get('hasta', '…')}")
+    return " · ".join(parts) or "todas"
+
+
+# ---------------- callback_data ----------------
+def encode_filters(f):
+    """{"estado": "Aprobado", "user": 5, "desde": "2025-01-01"} -> "a~5~20250101~"."""
+    return "~".join([
+        (f.get("estado") or "")[:1].lower(),
+        str(f.get("user") or ""),
+        (f.get("desde") or "").replace("-", ""),
+        (f.get("hasta") or "").replace("-", ""),
+    ])
+
+def decode_filters(s):
+    e, u, d, h = (s.split("~") + ["", "", "", ""])[:4]
+    f = {}
+    if e in ESTADOS:
+        f["estado"] = ESTADOS[e]
+    if u.isdigit():
+        f["user"] = int(u)
+    for key, v in (("desde", d), ("hasta", h)):
+        if len(v) == 8:
+            f[key] = _date(f"{v[:4]}-{v[4:6]}-{v[6:]}")
+    return {k: v for k, v in f.items() if v}
+
+
+# ---------------- consultas ----------------
+def where(f):
+    conds, params = [], []
+    if f.get("estado"):
+        conds.append("estado = ?"); params.append(f["estado"])
+    if f.get("user"):
+        conds.append("user_id = ?"); params.append(f["user"])
+    if f.get("desde"):
+        conds.append("fecha_inversion >= ?"); params.append(f["desde"])
+    if f.get("hasta"):
+        conds.append("fecha_inversion <= ?"); params.append(f["hasta"])
+    return conds, params
+
+def page(db, f, before_id=None, after_id=None, limit=20):
+    """
+    Página de más reciente a más antigua. before_id = siguiente página (más
+    antiguas), after_id = página anterior (más recientes).
+    Devuelve (filas, hay_mas_nuevas, hay_mas_antiguas).
+    """
+    conds, params = where(f)
+    cols = ", ".join(PAGE_COLUMNS)
+    if after_id is not None:
+        sql = f"SELECT {cols} FROM inversiones WHERE {' AND '.join(conds + ['id > ?'])} ORDER BY id ASC LIMIT ?"
+        rows = db.fetchall(sql, (*params, after_id, limit + 1))
+        newer = len(rows) > limit
+        return rows[:limit][::-1], newer, True
+    if before_id is not None:
+        conds = conds + ["id < ?"]
+        params = params + [before_id]
+    sql = f"SELECT {cols} FROM inversiones{' WHERE ' + ' AND '.join(conds) if conds else ''} ORDER BY id DESC LIMIT ?"
+    rows = db.fetchall(sql, (*params, limit + 1))
+    return rows[:limit], before_id is not None, len(rows) > limit
+
+def export_query(f):
+    conds, params = where(f)
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM inversiones{' WHERE ' + ' AND '.join(conds) if conds else ''} ORDER BY id"
+    return sql, params
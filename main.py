@@ -6,31 +6,46 @@
 #   inversión se exige traer un referido nuevo que también haya invertido.
 # - Perfil editable
 # - Panel admin para aprobar/rechazar inversiones
-# - Flask keep-alive + /download-db
+# - Flask keep-alive + /download-db + /health (supervisor por latidos)
 # - /dumpdb (solo admin) y backup diario
+#
+# Importar este módulo no tiene efectos secundarios (no abre la base, no crea
+# el bot ni arranca hilos): create_application() lo monta todo. Así los
+# handlers se pueden importar en benchmarks/pruebas y el arranque es rápido.
 
 import os
 import time
-import sqlite3
 import datetime
 import traceback
-import zipfile
 import threading
-import re
+import hmac
+import json
+import secrets
 from io import BytesIO
 
-from telebot import TeleBot, types
-
-# OCR libs
-try:
-    from PIL import Image
-    import pytesseract
-    TESSERACT_AVAILABLE = True
-except Exception:
-    TESSERACT_AVAILABLE = False
-
-# Flask
-from flask import Flask, send_file, request, abort
+from telebot import TeleBot, types, apihelper
+
+from database import ConnectionPool
+from writer import GroupCommitWriter
+import migrations
+import stats
+import export
+import history
+import review
+from backup import BackupStore
+import ocr
+from ocr import OcrPipeline, parse_regions
+import receipt
+from receipt import verify_receipt
+from outbox import Outbox
+from conversations import ConversationEngine, SqliteStateStore, MemoryStateStore
+from repository import SqliteRepository, MemoryRepository, CachedRepository
+from cache import TTLCache
+from router import Router
+from supervisor import Supervisor, HandlerTracker
+from polling import Poller, WorkerPool
+from storage import ReceiptStore, OcrCache, image_dhash
+import metrics
 
 # ---------------- CONFIG ----------------
 # Preferir variables de entorno (Replit)
@@ -39,46 +54,165 @@ BOT_USERNAME = os.environ.get("BOT_USERNAME", "InversionesCT_bot")
 ADMIN_ID = int(os.environ.get("ADMIN_ID", "5871502663"))  # por defecto
 NEQUI_DESTINO = os.environ.get("NEQUI_DESTINO", "3053706109")
 
+# OCR en pool de procesos (ver ocr.py)
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", "0")) or None   # None = núcleos * OCR_PROCS_PER_CORE
+OCR_PROCS_PER_CORE = float(os.environ.get("OCR_PROCS_PER_CORE", "1"))
+OCR_QUEUE_MAX = int(os.environ.get("OCR_QUEUE_MAX", "100"))
+# Preprocesado antes de tesseract; OCR_REGIONS="x0,y0,x1,y1;..." (relativas) limita el OCR a esas zonas
+OCR_PREPROCESS = {
+    "enabled": os.environ.get("OCR_PREPROCESS", "1") == "1",
+    "target_width": int(os.environ.get("OCR_TARGET_WIDTH", "1000")),
+    "binarize": os.environ.get("OCR_BINARIZE", "1") == "1",
+    "threshold": int(os.environ.get("OCR_THRESHOLD", "160")),
+    "autocrop": os.environ.get("OCR_AUTOCROP", "1") == "1",
+    "regions": parse_regions(os.environ.get("OCR_REGIONS", "")),
+}
+# Lectura por campos (receipt.py): ubica las etiquetas y relee solo monto/número/fecha/referencia.
+# OCR_STRUCTURED=0 vuelve al OCR de la imagen completa (con las mismas reglas sobre el texto).
+OCR_STRUCTURED = os.environ.get("OCR_STRUCTURED", "1") == "1"
+
+# Ingreso de updates: "polling" (por defecto) o "webhook" sobre la app Flask.
+# En webhook, si set_webhook falla se vuelve a polling.
+BOT_MODE = os.environ.get("BOT_MODE", "polling").lower()
+BOT_THREADS = int(os.environ.get("BOT_THREADS", "4"))   # workers que ejecutan los handlers
+# Motor: "threads" (TeleBot, por defecto) o "asyncio" (AsyncTeleBot + aiohttp, ver aiobot.py).
+# Los handlers son los mismos; en asyncio corren en ASYNC_WORKERS hilos y la red va por el loop.
+BOT_ENGINE = os.environ.get("BOT_ENGINE", "threads").lower()
+ASYNC_WORKERS = int(os.environ.get("ASYNC_WORKERS", "32"))
+ASYNC_DOWNLOADS = int(os.environ.get("ASYNC_DOWNLOADS", "16"))   # descargas de comprobantes simultáneas
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")   # ej. https://midominio.com
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Base de la Bot API (por defecto la de Telegram). Para pruebas de carga contra
+# scripts/fake_bot_api.py: TELEGRAM_API_URL=http://127.0.0.1:8081
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "").rstrip("/")
+
+# Cola de envío (ver outbox.py); límites por defecto = límites de Telegram
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "4"))
+OUTBOX_GLOBAL_RATE = float(os.environ.get("OUTBOX_GLOBAL_RATE", "30"))
+OUTBOX_CHAT_RATE = float(os.environ.get("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = int(os.environ.get("OUTBOX_CHAT_BURST", "3"))
+OUTBOX_MAX_RETRIES = int(os.environ.get("OUTBOX_MAX_RETRIES", "5"))
+
+# Conversaciones de varios pasos (ver conversations.py): expiran si se abandonan
+CONV_TTL = int(os.environ.get("CONV_TTL", str(24 * 3600)))
+
+# /metrics (formato Prometheus); si METRICS_TOKEN está definido se exige ?token= o Bearer
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Escrituras pequeñas agrupadas en un COMMIT cada WRITER_MAX_DELAY_MS (ver writer.py)
+WRITER_MAX_DELAY_MS = float(os.environ.get("WRITER_MAX_DELAY_MS", "50"))
+WRITER_MAX_BATCH = int(os.environ.get("WRITER_MAX_BATCH", "500"))
+
+# Datos de usuarios/inversiones (ver repository.py): "sqlite" (por defecto) o "memory"
+# (pruebas de carga sin disco: nada sobrevive al proceso)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite").lower()
+# Caché de perfiles y de can_invest por usuario (ver cache.py); PROFILE_CACHE_SIZE=0 la desactiva
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", "300"))
+
+# Supervisor por latidos (ver supervisor.py): reinicia solo el componente atascado
+SUPERVISOR_INTERVAL = float(os.environ.get("SUPERVISOR_INTERVAL", "5"))
+SUPERVISOR_MAX_RESTARTS = int(os.environ.get("SUPERVISOR_MAX_RESTARTS", "5"))   # por 10 min y componente
+POLL_STALL_S = float(os.environ.get("POLL_STALL_S", "150"))          # getUpdates largo = 60 s
+HANDLER_STALL_S = float(os.environ.get("HANDLER_STALL_S", "120"))
+OCR_STALL_S = float(os.environ.get("OCR_STALL_S", "180"))
+
 DB_FILE = os.path.join(os.getcwd(), "inversionesct.db")
 DOWNLOAD_DIR = os.path.join(os.getcwd(), "comprobantes")
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-bot = TeleBot(TOKEN, parse_mode=None)
+# creados por create_bot() / create_app() (ver "Arranque")
+bot = None
+outbox = None
+app = None
+# solo en BOT_ENGINE=threads (create_bot): hilo de polling y workers de handlers propios (polling.py)
+poller = None
+handler_pool = None
+# solo en BOT_ENGINE=asyncio (create_async_bot): loop + executor y el AsyncTeleBot
+aio = None
+abot = None
+
+# ---------------- Métricas ----------------
+# Histogramas de latencia + contadores de error; las colas se leen al hacer scrape (ver metrics.py)
+registry = metrics.Registry()
+m_handler = registry.histogram("inversionesct_handler_seconds", "Duración de los handlers del bot", ("kind", "handler"))
+m_handler_err = registry.counter("inversionesct_handler_errors_total", "Excepciones no capturadas en handlers", ("kind", "handler"))
+m_db = registry.histogram("inversionesct_db_seconds", "Duración de consultas y transacciones SQLite", ("op",))
+m_db_err = registry.counter("inversionesct_db_errors_total", "Errores de SQLite", ("op",))
+m_api = registry.histogram("inversionesct_telegram_api_seconds", "Duración de las llamadas a la API de Telegram", ("method",))
+m_api_err = registry.counter("inversionesct_telegram_api_errors_total", "Errores de la API de Telegram", ("method",))
+m_ocr = registry.histogram("inversionesct_ocr_seconds", "Tiempo de OCR por comprobante en el worker", ("result",))
+m_ocr_wait = registry.histogram("inversionesct_ocr_wait_seconds", "Tiempo de espera en la cola de OCR")
+
+def _observe_db(op, seconds, error):
+    m_db.labels(op).observe(seconds)
+    if error:
+        m_db_err.labels(op).inc()
+
+# ---------------- Supervisor ----------------
+# Latidos de polling, handlers, OCR y backup; /health expone el estado
+def _supervisor_event(name, event, detail):
+    if event != "recovered":
+        safe_send(ADMIN_ID, f"🩺 Supervisor: {name} {event} ({detail})")
+
+supervisor = Supervisor(interval=SUPERVISOR_INTERVAL, max_restarts=SUPERVISOR_MAX_RESTARTS, on_event=_supervisor_event)
+handler_tracker = HandlerTracker(supervisor, "handlers")
+last_update = {"received": None, "lag": None}   # último update (time.time) y su retraso respecto a Telegram
+
+def note_updates(updates):
+    """Latido del polling + cuándo llegó el último update y con cuánto retraso."""
+    supervisor.beat("polling")
+    if not updates:
+        return
+    now = time.time()
+    last_update["received"] = now
+    dates = [u.message.date for u in updates if getattr(u, "message", None) is not None]
+    if dates:
+        last_update["lag"] = round(now - max(dates), 3)
+
 
 # ---------------- DB helpers ----------------
-def get_conn():
-    return sqlite3.connect(DB_FILE, check_same_thread=False)
+# Una conexión persistente por hilo (WAL); ver database.py. El pool no abre
+# nada hasta la primera consulta.
+db = ConnectionPool(
+    DB_FILE,
+    busy_timeout_ms=int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000")),
+    cache_kb=int(os.environ.get("DB_CACHE_KB", "16384")),
+    mmap_mb=int(os.environ.get("DB_MMAP_MB", "128")),
+)
+if METRICS_ENABLED:
+    db.observer = _observe_db
 
 def init_db():
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS usuarios (
-        user_id INTEGER PRIMARY KEY,
-        nombre TEXT,
-        telefono TEXT,
-        nequi TEXT,
-        cedula TEXT,
-        referido_por INTEGER,
-        referidos INTEGER DEFAULT 0,
-        total_invertido INTEGER DEFAULT 0,
-        ganancia_total INTEGER DEFAULT 0
-    );
-    ''')
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS inversiones (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        monto INTEGER,
-        fecha_inversion TEXT,
-        fecha_pago TEXT,
-        estado TEXT,
-        comprobante_path TEXT,
-        ocr_text TEXT
-    );
-    ''')
-    conn.commit(); conn.close()
-
-init_db()
+    # esquema e índices versionados en migrations.py
+    migrations.migrate(db)
+
+# group commit para escrituras que no necesitan confirmarse antes de responder
+writer = GroupCommitWriter(db, max_delay=WRITER_MAX_DELAY_MS / 1000.0, max_batch=WRITER_MAX_BATCH)
+
+# usuarios, inversiones y estadísticas: los handlers no escriben SQL
+if STORAGE_BACKEND == "memory":
+    repo = MemoryRepository()
+else:
+    repo = SqliteRepository(db, writer=writer)
+# perfiles y elegibilidad en memoria; las escrituras del repositorio las invalidan
+if PROFILE_CACHE_SIZE > 0:
+    repo = CachedRepository(repo, TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL),
+                            TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL))
+
+# estado de conversaciones en SQLite: sobrevive reinicios y expira por TTL; los
+# cambios de paso van por el writer (un paso no cuesta un COMMIT propio)
+conv = ConversationEngine(MemoryStateStore() if STORAGE_BACKEND == "memory" else SqliteStateStore(db, writer=writer),
+                          default_ttl=CONV_TTL)
+
+def repo_cache_stats():
+    return repo.cache_stats() if isinstance(repo, CachedRepository) else {}
+
+# comprobantes por sha256 (comprobantes/ab/cd/<sha>.<ext>) + caché de OCR
+receipts = ReceiptStore(DOWNLOAD_DIR)
+ocr_cache = OcrCache(db)
 
 # ---------------- Utilities ----------------
 def fmt_money(n):
@@ -88,13 +222,14 @@ def fmt_money(n):
         return str(n)
 
 def safe_send(chat_id, text, **kwargs):
+    """
+    Encola el mensaje y vuelve de inmediato. El outbox respeta los límites de
+    Telegram, reintenta y, si el formato falla, lo reenvía como texto plano.
+    """
     try:
-        bot.send_message(chat_id, text, **kwargs)
+        outbox.send_message(chat_id, text, **kwargs)
     except Exception:
-        try:
-            bot.send_message(chat_id, text)
-        except Exception:
-            pass
+        traceback.print_exc()
 
 def iso_today():
     return datetime.date.today().isoformat()  # YYYY-MM-DD
@@ -106,22 +241,79 @@ def parse_date_iso(s):
         return None
 
 # ---------------- Menú ----------------
-def menu_principal_for(user_id):
+# Teclados fijos serializados una sola vez: telebot envía el JSON tal cual
+# (reply_markup acepta el texto) en lugar de construir y serializar botones
+# en cada respuesta
+def _reply_keyboard(*rows):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    if user_id == ADMIN_ID:
-        markup.add(types.KeyboardButton("📈 Panel admin"), types.KeyboardButton("💰 Invertir"))
-        markup.add(types.KeyboardButton("🤝 Referir amigos"), types.KeyboardButton("📊 Mi perfil"))
-    else:
-        markup.add(types.KeyboardButton("💰 Invertir"), types.KeyboardButton("🤝 Referir amigos"))
-        markup.add(types.KeyboardButton("📊 Mi perfil"), types.KeyboardButton("👥 Mis referidos"))
-    return markup
+    for row in rows:
+        markup.add(*(types.KeyboardButton(t) for t in row))
+    return markup.to_json()
+
+def _inline_keyboard(*rows):
+    markup = types.InlineKeyboardMarkup()
+    for row in rows:
+        markup.add(*(types.InlineKeyboardButton(t, callback_data=d) for t, d in row))
+    return markup.to_json()
+
+KB_MENU_ADMIN = _reply_keyboard(("📈 Panel admin", "💰 Invertir"), ("🤝 Referir amigos", "📊 Mi perfil"))
+KB_MENU_USER = _reply_keyboard(("💰 Invertir", "🤝 Referir amigos"), ("📊 Mi perfil", "👥 Mis referidos"))
+KB_PERFIL = _reply_keyboard(("✏️ Actualizar datos", "🔙 Volver al menú"))
+KB_PANEL_ADMIN = _reply_keyboard(("📊 Estadísticas", "🔎 Revisar pendientes"), ("📜 Historial", "🔙 Volver"))
+KB_ACTUALIZAR = _inline_keyboard([("📛 Nombre", "UPD|nombre")], [("📱 Teléfono", "UPD|telefono")],
+                                 [("🪪 Cédula", "UPD|cedula")], [("💳 Nequi", "UPD|nequi")])
+
+def menu_principal_for(user_id):
+    return KB_MENU_ADMIN if user_id == ADMIN_ID else KB_MENU_USER
+
+# ---------------- Router ----------------
+# Un solo handler de mensajes y uno de callbacks; rutas por dict (ver router.py)
+router = Router(is_admin=lambda uid: uid == ADMIN_ID)
+
+# Respuesta a un no-admin en las rutas admin que ya existían (la misma de antes);
+# las demás rutas admin responden como un mensaje sin ruta (menú principal)
+def _denied_no_access(m):
+    safe_send(m.chat.id, "❌ No tienes acceso.")
+
+def _denied_silent(update):
+    pass
+
+def _denied_reply(text):
+    return lambda m: bot.reply_to(m, text)
+
+def _denied_callback(c):
+    bot.answer_callback_query(c.id, "No autorizado.")
+
+# ---------------- Conversaciones ----------------
+def _in_conversation(m):
+    # comandos y botones del menú salen de la conversación y siguen su camino normal
+    if m.text and (m.text.startswith("/") or router.has_text(m.text)):
+        # los botones del menú cortan la conversación en curso; sin conversación no se encola un DELETE
+        if router.has_text(m.text) and conv.active(m.chat.id):
+            conv.finish(m.chat.id)
+        return False
+    return conv.active(m.chat.id)
+
+# create_bot() lo registra antes que el router: tiene prioridad, como los next_step de antes
+def conversation_step(m):
+    try:
+        conv.dispatch(m)
+    except Exception:
+        traceback.print_exc()
+
+def _text_or_prompt(message, prompt):
+    texto = (message.text or "").strip()
+    if not texto:
+        safe_send(message.chat.id, prompt)
+    return texto
 
 # ---------------- START / REGISTRO ----------------
-@bot.message_handler(commands=['start'])
+@router.command("start")
 def handle_start(message):
     try:
         chat_id = message.chat.id
         user_id = message.from_user.id
+        conv.finish(chat_id)  # /start reinicia cualquier conversación a medias
         parts = message.text.split()
         referido = None
         if len(parts) > 1:
@@ -130,17 +322,12 @@ def handle_start(message):
             except:
                 referido = None
 
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("SELECT user_id FROM usuarios WHERE user_id=?", (user_id,))
-        exists = cur.fetchone()
-        cur.execute("INSERT OR IGNORE INTO usuarios (user_id, referido_por) VALUES (?, ?)", (user_id, referido))
-        conn.commit()
+        exists = repo.start_user(user_id, referido)
 
         if referido and referido != user_id:
             try:
                 # sumar referidos al referer una sola vez:
-                cur.execute("UPDATE usuarios SET referidos = referidos + 1 WHERE user_id=?", (referido,))
-                conn.commit()
+                repo.add_referral(referido)
                 try:
                     safe_send(referido, f"🎉 Nuevo usuario registrado gracias a tu enlace: ID {user_id}")
                 except:
@@ -148,65 +335,68 @@ def handle_start(message):
             except Exception:
                 pass
 
-        conn.close()
-
         if exists:
             safe_send(chat_id, "👋 Bienvenido de nuevo. Mostrando menú principal.", reply_markup=menu_principal_for(user_id))
         else:
             safe_send(chat_id, "👋 Bienvenido a *InversionesCT* 💰\nPor favor escribe tu nombre completo:", parse_mode="Markdown")
-            bot.register_next_step_handler_by_chat_id(chat_id, step_nombre)
+            conv.goto(chat_id, "reg_nombre")
     except Exception:
         traceback.print_exc()
 
-def step_nombre(message):
+@conv.state("reg_nombre")
+def step_nombre(message, data):
     try:
         user_id = message.from_user.id
-        nombre = message.text.strip()
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE usuarios SET nombre=? WHERE user_id=?", (nombre, user_id))
-        conn.commit(); conn.close()
+        nombre = _text_or_prompt(message, "Por favor escribe tu nombre completo:")
+        if not nombre:
+            return
+        # los datos del registro viajan en el estado de la conversación y se guardan juntos al final
         safe_send(user_id, "📱 Ingresa tu número de teléfono:")
-        bot.register_next_step_handler_by_chat_id(user_id, step_telefono)
+        conv.goto(message.chat.id, "reg_telefono", dict(data, nombre=nombre))
     except Exception:
         traceback.print_exc()
 
-def step_telefono(message):
+@conv.state("reg_telefono")
+def step_telefono(message, data):
     try:
         user_id = message.from_user.id
-        telefono = message.text.strip()
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE usuarios SET telefono=? WHERE user_id=?", (telefono, user_id))
-        conn.commit(); conn.close()
+        telefono = _text_or_prompt(message, "📱 Ingresa tu número de teléfono:")
+        if not telefono:
+            return
         safe_send(user_id, "🪪 Ingresa tu número de cédula:")
-        bot.register_next_step_handler_by_chat_id(user_id, step_cedula)
+        conv.goto(message.chat.id, "reg_cedula", dict(data, telefono=telefono))
     except Exception:
         traceback.print_exc()
 
-def step_cedula(message):
+@conv.state("reg_cedula")
+def step_cedula(message, data):
     try:
         user_id = message.from_user.id
-        cedula = message.text.strip()
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE usuarios SET cedula=? WHERE user_id=?", (cedula, user_id))
-        conn.commit(); conn.close()
+        cedula = _text_or_prompt(message, "🪪 Ingresa tu número de cédula:")
+        if not cedula:
+            return
         safe_send(user_id, "💳 Ingresa tu número de Nequi:")
-        bot.register_next_step_handler_by_chat_id(user_id, step_nequi)
+        conv.goto(message.chat.id, "reg_nequi", dict(data, cedula=cedula))
     except Exception:
         traceback.print_exc()
 
-def step_nequi(message):
+@conv.state("reg_nequi")
+def step_nequi(message, data):
     try:
         user_id = message.from_user.id
-        nequi = message.text.strip()
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE usuarios SET nequi=? WHERE user_id=?", (nequi, user_id))
-        conn.commit(); conn.close()
+        nequi = _text_or_prompt(message, "💳 Ingresa tu número de Nequi:")
+        if not nequi:
+            return
+        # un solo UPDATE (un COMMIT) para todo el registro; lo que falte en data conserva
+        # lo ya guardado por conversaciones empezadas antes de este cambio
+        repo.complete_registration(user_id, data.get("nombre"), data.get("telefono"), data.get("cedula"), nequi)
+        conv.finish(message.chat.id)
         safe_send(user_id, "✅ Registro completado. Aquí tienes el menú principal.", reply_markup=menu_principal_for(user_id))
     except Exception:
         traceback.print_exc()
 
 # ---------------- Referidos ----------------
-@bot.message_handler(func=lambda m: m.text == "🤝 Referir amigos")
+@router.text("🤝 Referir amigos")
 def handler_referir(m):
     user_id = m.from_user.id
     bot_name = BOT_USERNAME
@@ -216,15 +406,11 @@ def handler_referir(m):
     safe_send(user_id, "Cada persona que se registre desde tu enlace quedará asociada a ti.")
 
 # ---------------- Perfil y actualización ----------------
-_pending_updates = {}
-
-@bot.message_handler(func=lambda m: m.text == "📊 Mi perfil")
+@router.text("📊 Mi perfil")
 def handler_perfil(m):
     try:
         user_id = m.from_user.id
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("SELECT nombre, telefono, nequi, cedula, total_invertido, ganancia_total, referidos FROM usuarios WHERE user_id=?", (user_id,))
-        r = cur.fetchone(); conn.close()
+        r = repo.profile(user_id)
         if not r:
             safe_send(user_id, "⚠️ No estás registrado. Usa /start para registrarte.")
             return
@@ -239,95 +425,81 @@ def handler_perfil(m):
             f"Ganancia acumulada: ${fmt_money(ganancia_total)}\n"
             f"Referidos: {referidos}"
         )
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        markup.add(types.KeyboardButton("✏️ Actualizar datos"), types.KeyboardButton("🔙 Volver al menú"))
         safe_send(user_id, text, parse_mode="Markdown")
-        safe_send(user_id, "¿Deseas actualizar algún dato?", reply_markup=markup)
+        safe_send(user_id, "¿Deseas actualizar algún dato?", reply_markup=KB_PERFIL)
     except Exception:
         traceback.print_exc()
 
-@bot.message_handler(func=lambda m: m.text == "🔙 Volver al menú")
+@router.text("🔙 Volver al menú")
 def volver_menu(m):
     safe_send(m.chat.id, "Volviendo al menú principal...", reply_markup=menu_principal_for(m.from_user.id))
 
-@bot.message_handler(func=lambda m: m.text == "✏️ Actualizar datos")
+@router.text("✏️ Actualizar datos")
 def iniciar_actualizar(m):
-    uid = m.from_user.id
-    kb = types.InlineKeyboardMarkup()
-    kb.add(types.InlineKeyboardButton("📛 Nombre", callback_data="UPD|nombre"))
-    kb.add(types.InlineKeyboardButton("📱 Teléfono", callback_data="UPD|telefono"))
-    kb.add(types.InlineKeyboardButton("🪪 Cédula", callback_data="UPD|cedula"))
-    kb.add(types.InlineKeyboardButton("💳 Nequi", callback_data="UPD|nequi"))
-    bot.send_message(uid, "Selecciona el dato que deseas actualizar:", reply_markup=kb)
+    safe_send(m.from_user.id, "Selecciona el dato que deseas actualizar:", reply_markup=KB_ACTUALIZAR)
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("UPD|"))
+@router.callback("UPD|")
 def callback_update_field(c):
     try:
         uid = c.from_user.id
         _, field = c.data.split("|", 1)
-        _pending_updates[uid] = field
+        conv.goto(c.message.chat.id if c.message else uid, "upd_valor", {"field": field})
         bot.answer_callback_query(c.id, "Perfecto — escribe el nuevo valor ahora.")
-        bot.send_message(uid, f"✏️ Ingresa el nuevo valor para *{field.upper()}*:", parse_mode="Markdown")
-        bot.register_next_step_handler_by_chat_id(uid, procesar_update_valor)
+        safe_send(uid, f"✏️ Ingresa el nuevo valor para *{field.upper()}*:", parse_mode="Markdown")
     except Exception:
         traceback.print_exc()
 
-def procesar_update_valor(message):
+@conv.state("upd_valor")
+def procesar_update_valor(message, data):
     try:
         uid = message.from_user.id
-        if uid not in _pending_updates:
-            bot.send_message(uid, "No se detectó ninguna actualización pendiente. Vuelve a seleccionar el campo.")
+        field = data.get("field")
+        if not field:
+            conv.finish(message.chat.id)
+            safe_send(uid, "No se detectó ninguna actualización pendiente. Vuelve a seleccionar el campo.")
+            return
+        nuevo = _text_or_prompt(message, "✏️ Escribe el nuevo valor como texto:")
+        if not nuevo:
             return
-        field = _pending_updates.pop(uid)
-        nuevo = message.text.strip()
+        conv.finish(message.chat.id)
         if field == "telefono":
             nuevo = nuevo.replace(" ", "").replace("-", "")
         if field == "cedula":
             nuevo = nuevo.replace(" ", "")
-        conn = get_conn(); cur = conn.cursor()
         if field in ("nombre", "telefono", "cedula", "nequi"):
-            cur.execute(f"UPDATE usuarios SET {field}=? WHERE user_id=?", (nuevo, uid))
-            conn.commit()
-            conn.close()
-            bot.send_message(uid, f"✅ {field.capitalize()} actualizado correctamente.", reply_markup=menu_principal_for(uid))
+            repo.update_field(uid, field, nuevo)
+            safe_send(uid, f"✅ {field.capitalize()} actualizado correctamente.", reply_markup=menu_principal_for(uid))
         else:
-            conn.close()
-            bot.send_message(uid, "Campo no válido.")
+            safe_send(uid, "Campo no válido.")
     except Exception:
         traceback.print_exc()
         try:
-            bot.send_message(uid, "Error actualizando datos.")
+            safe_send(uid, "Error actualizando datos.")
         except:
             pass
 
 # ---------------- Mis referidos ----------------
-@bot.message_handler(func=lambda m: m.text == "👥 Mis referidos")
+@router.text("👥 Mis referidos")
 def handler_mis_referidos(m):
     try:
         user_id = m.from_user.id
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("SELECT referidos FROM usuarios WHERE user_id=?", (user_id,))
-        r = cur.fetchone(); conn.close()
-        referidos = r[0] if r else 0
+        referidos = repo.referidos(user_id)
         safe_send(user_id, f"👥 Has referido a {referidos} persona(s).")
     except Exception:
         traceback.print_exc()
 
 # ---------------- Inversiones (reglas avanzadas) ----------------
 INV_OPTIONS = [100000, 300000, 500000]
+KB_INVERTIR = _inline_keyboard(*([(f"💵 {fmt_money(amt)}", f"INV|{amt}")] for amt in INV_OPTIONS))
 
-@bot.message_handler(func=lambda m: m.text == "💰 Invertir")
+@router.text("💰 Invertir")
 def handler_invertir(m):
     try:
-        markup = types.InlineKeyboardMarkup(row_width=3)
-        for amt in INV_OPTIONS:
-            btn = types.InlineKeyboardButton(f"💵 {fmt_money(amt)}", callback_data=f"INV|{amt}")
-            markup.add(btn)
-        safe_send(m.chat.id, "Selecciona el monto a invertir:", reply_markup=markup)
+        safe_send(m.chat.id, "Selecciona el monto a invertir:", reply_markup=KB_INVERTIR)
     except Exception:
         traceback.print_exc()
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("INV|"))
+@router.callback("INV|")
 def callback_inv(c):
     try:
         parts = c.data.split("|")
@@ -338,7 +510,7 @@ def callback_inv(c):
             safe_send(uid, "❌ Para seguir invirtiendo, debes invitar a un nuevo usuario con tu enlace y asegurarte de que también realice su primera inversión. Vuelve cuando cumplas ese requisito.")
             return
         safe_send(uid, f"📸 Envía la imagen del comprobante Nequi por el valor de ${fmt_money(monto)} al número {NEQUI_DESTINO}.")
-        bot.register_next_step_handler_by_chat_id(uid, lambda m: procesar_comprobante(m, monto))
+        conv.goto(c.message.chat.id if c.message else uid, "comprobante", {"monto": monto})
     except Exception:
         traceback.print_exc()
 
@@ -347,216 +519,279 @@ def can_user_invest(user_id):
     Reglas:
     - Si el usuario NO tiene inversiones previas -> puede invertir (primera inversión).
     - Si ya tiene al menos 1 inversión -> requiere que exista al menos un referido
-      que se haya registrado tras la última inversión del usuario y que ese referido
-      tenga al menos 1 inversión (estado 'Pendiente' o 'Aprobado').
+      cuya primera inversión sea posterior a la última inversión del usuario y que ese
+      referido tenga al menos 1 inversión (estado 'Pendiente' o 'Aprobado').
     """
     try:
-        conn = get_conn(); cur = conn.cursor()
-        # contar inversiones del usuario
-        cur.execute("SELECT COUNT(*), MAX(fecha_inversion) FROM inversiones WHERE user_id=?", (user_id,))
-        row = cur.fetchone()
-        conn.close()
-        count = row[0] if row else 0
-        last_date = row[1] if row and row[1] else None
-        if count == 0:
-            return True  # primera inversión permitida
-        # buscar referidos registrados del usuario
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("SELECT user_id FROM usuarios WHERE referido_por=?", (user_id,))
-        referidos = [r[0] for r in cur.fetchall()]
-        if not referidos:
-            conn.close()
-            return False
-        # convertir last_date a date
-        last_dt = parse_date_iso(last_date) if last_date else None
-        # revisar cada referido: debe tener al menos 1 inversion (Pendiente o Aprobado)
-        for rid in referidos:
-            cur.execute("SELECT MIN(fecha_inversion) FROM inversiones WHERE user_id=?", (rid,))
-            rmin = cur.fetchone()
-            if not rmin:
-                continue
-            first_inv_date = rmin[0]
-            if not first_inv_date:
-                continue
-            first_dt = parse_date_iso(first_inv_date)
-            # referido debe haberse invertido y esa inversión debe ser posterior a la última inversión del usuario
-            if first_dt and last_dt:
-                if first_dt > last_dt:
-                    # además verificar que referido tenga al menos una inversión con estado Pendiente o Aprobado
-                    cur.execute("SELECT COUNT(*) FROM inversiones WHERE user_id=? AND estado IN ('Pendiente','Aprobado')", (rid,))
-                    cnt = cur.fetchone()[0]
-                    if cnt and cnt > 0:
-                        conn.close()
-                        return True
-            else:
-                # si no hay last_dt por alguna razón, basta con que referido tenga inversión
-                cur.execute("SELECT COUNT(*) FROM inversiones WHERE user_id=? AND estado IN ('Pendiente','Aprobado')", (rid,))
-                cnt = cur.fetchone()[0]
-                if cnt and cnt > 0:
-                    conn.close()
-                    return True
-        conn.close()
-        return False
+        return repo.can_invest(user_id)
     except Exception:
         traceback.print_exc()
         return False
 
-def save_file_from_message(message, filename):
+def receipt_file_ref(message):
+    """(file_id, tipo) del comprobante; tipo es 'photo' o 'document'."""
+    if message.photo:
+        return message.photo[-1].file_id, "photo"
+    if message.document:
+        return message.document.file_id, "document"
+    return None, None
+
+def save_file_from_message(message):
+    """Descarga el comprobante y lo guarda por contenido. Devuelve (ruta, sha256, error)."""
     try:
-        file_id = None
-        if message.photo:
-            file_id = message.photo[-1].file_id
-        elif message.document:
-            file_id = message.document.file_id
-        else:
-            return None, "No hay archivo en el mensaje."
-        file_info = bot.get_file(file_id)
-        data = bot.download_file(file_info.file_path)
-        path = os.path.join(DOWNLOAD_DIR, filename)
-        with open(path, "wb") as f:
-            f.write(data)
-        return path, None
+        file_id, _ = receipt_file_ref(message)
+        if not file_id:
+            return None, None, "No hay archivo en el mensaje."
+        # en modo asyncio suele venir ya descargado por _prefetch_receipt
+        data = getattr(message, "receipt_bytes", None)
+        if data is None:
+            file_info = bot.get_file(file_id)
+            data = bot.download_file(file_info.file_path)
+        ext = ".jpg"
+        if message.document and message.document.file_name:
+            ext = os.path.splitext(message.document.file_name)[1].lower() or ext
+        path, sha, _ = receipts.put(data, ext)
+        return path, sha, None
     except Exception as e:
-        return None, str(e)
+        return None, None, str(e)
+
+@conv.state("comprobante")
+def step_comprobante(message, data):
+    procesar_comprobante(message, data["monto"])
 
 def procesar_comprobante(message, monto):
     try:
         chat_id = message.chat.id
         user_id = message.from_user.id
         if not (message.photo or message.document):
+            # la conversación sigue abierta: puede reenviar la imagen
             safe_send(chat_id, "⚠️ Debes enviar una imagen del comprobante.")
             return
+        conv.finish(chat_id)
         safe_send(chat_id, "🧾 Comprobante recibido. Verificando, esto puede tardar unos segundos ⏳...")
-        timestamp = int(time.time())
-        filename = f"comp_{user_id}_{timestamp}.jpg"
-        saved_path, err = save_file_from_message(message, filename)
+        saved_path, sha, err = save_file_from_message(message)
         if not saved_path:
             safe_send(chat_id, f"⚠️ Error al guardar archivo: {err}")
             return
 
-        ocr_text = ""
-        ocr_ok = False
-        ocr_reason = ""
-        if TESSERACT_AVAILABLE:
-            try:
-                img = Image.open(saved_path)
-                ocr_text = pytesseract.image_to_string(img, lang='spa')
-                # extracción de números (posible monto - buscamos cifra grande)
-                nums = re.findall(r'\d{3,}', ocr_text.replace(".", "").replace(",", ""))
-                monto_detected = int(max(nums, key=len)) if nums else None
-                cleaned_text = ocr_text.replace(" ", "").replace("\n","")
-                # validar número destino y monto aproximado
-                if NEQUI_DESTINO in cleaned_text and monto_detected and abs(monto_detected - monto) <= 2000:
-                    ocr_ok = True
-                else:
-                    ocr_ok = False
-                    ocr_reason = "No se detectó número destino o monto coincidente."
-            except Exception as e:
-                ocr_ok = False
-                ocr_reason = f"OCR falló: {e}"
-        else:
-            ocr_ok = False
-            ocr_reason = "OCR no disponible en este entorno."
-
         fecha_inversion = iso_today()
         fecha_pago = (datetime.date.today() + datetime.timedelta(days=3)).strftime("%d/%m/%Y")
 
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado, comprobante_path, ocr_text) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (user_id, monto, str(fecha_inversion), fecha_pago, "Pendiente", saved_path, ocr_text))
-        conn.commit(); conn.close()
-
-        if ocr_ok:
-            safe_send(chat_id, f"✅ Comprobante recibido y verificado preliminarmente. Está pendiente de aprobación por el administrador.\n📅 Fecha estimada de pago: {fecha_pago}")
-            safe_send(ADMIN_ID, f"📥 Nuevo comprobante PENDIENTE de {message.from_user.first_name} (${fmt_money(monto)}). OCR OK.")
-        else:
-            safe_send(chat_id, f"⚠️ Comprobante recibido pero no se pudo verificar automáticamente: {ocr_reason}\nEl administrador lo revisará manualmente.")
-            safe_send(ADMIN_ID, f"📥 Nuevo comprobante PENDIENTE de {message.from_user.first_name} (${fmt_money(monto)}). OCR: {ocr_reason}")
+        file_id, tipo = receipt_file_ref(message)
+        # dup: mismo archivo ya usado en otra inversión, se avisa al admin
+        inv_id, dup = repo.create_investment(user_id, monto, str(fecha_inversion), fecha_pago, saved_path, file_id, tipo, sha)
+
+        job = {
+            "inv_id": inv_id, "chat_id": chat_id, "user_id": user_id, "monto": monto,
+            "path": saved_path, "fecha_pago": fecha_pago, "first_name": message.from_user.first_name,
+            "sha": sha, "duplicate_of": dup,
+        }
+        cached = ocr_cache.get(sha)
+        if cached is not None:
+            # mismo archivo ya procesado: no se vuelve a pasar por tesseract
+            job["cache"] = "exact"
+            on_ocr_result(job, cached, None)
+        elif not ocr.available():
+            on_ocr_result(job, "", None, reason="OCR no disponible en este entorno.")
+        elif not ocr_pipeline.submit(job):
+            # cola llena: el comprobante queda pendiente para revisión manual
+            on_ocr_result(job, "", None, reason="Verificador automático saturado, intenta más tarde.")
     except Exception:
         traceback.print_exc()
         safe_send(message.chat.id, "⚠️ Ocurrió un error procesando el comprobante. Intenta nuevamente.")
 
+def on_ocr_result(job, ocr_text, error, reason=None):
+    """
+    Se llama desde el hilo de resultados del pipeline OCR (o directamente si
+    no hay OCR). Guarda el texto/resultado y envía los mensajes de seguimiento.
+    """
+    if "ocr_s" in job:
+        m_ocr.labels("error" if error else "ok").observe(job["ocr_s"])
+    if "wait_s" in job:
+        m_ocr_wait.observe(job["wait_s"])
+    if reason:
+        ocr_ok, ocr_reason = False, reason
+    elif error:
+        ocr_ok, ocr_reason = False, f"OCR falló: {error}"
+    else:
+        # campos de receipt.parse_file; desde la caché o sin OCR_STRUCTURED salen del texto
+        fields = (job.get("receipt") or {}).get("fields")
+        ocr_ok, ocr_reason = verify_receipt(ocr_text, job["monto"], NEQUI_DESTINO, fields=fields)
+        if job.get("sha") and job.get("cache") != "exact":
+            try:
+                ocr_cache.put(job["sha"], job.get("phash"), ocr_text)
+            except Exception:
+                traceback.print_exc()
+
+    # verify_receipt solo mira monto y destino: un archivo repetido (o casi idéntico) a otra
+    # inversión se guarda sin ocr_ok para que "/aprobar ocr" no lo apruebe otra vez sin mirarlo
+    repeated = job.get("duplicate_of") or job.get("similar_of")
+    repo.set_ocr_result(job["inv_id"], ocr_text, ocr_ok and not repeated)
+
+    chat_id, monto, fecha_pago = job["chat_id"], job["monto"], job["fecha_pago"]
+    dup = f"\n⚠️ Mismo archivo que la inversión {job['duplicate_of']}." if job.get("duplicate_of") else ""
+    if job.get("similar_of"):
+        dup += f"\n⚠️ Imagen muy parecida a la de la inversión {job['similar_of']} (posible duplicado, revisar)."
+    if ocr_ok and repeated:
+        dup += "\nNo entra en /aprobar ocr: revisar a mano."
+    if ocr_ok:
+        safe_send(chat_id, f"✅ Comprobante recibido y verificado preliminarmente. Está pendiente de aprobación por el administrador.\n📅 Fecha estimada de pago: {fecha_pago}")
+        safe_send(ADMIN_ID, f"📥 Nuevo comprobante PENDIENTE de {job['first_name']} (${fmt_money(monto)}). OCR OK.{dup}")
+    else:
+        safe_send(chat_id, f"⚠️ Comprobante recibido pero no se pudo verificar automáticamente: {ocr_reason}\nEl administrador lo revisará manualmente.")
+        safe_send(ADMIN_ID, f"📥 Nuevo comprobante PENDIENTE de {job['first_name']} (${fmt_money(monto)}). OCR: {ocr_reason}{dup}")
+
+def ocr_precheck(job):
+    # antes del OCR: ¿hay una imagen casi idéntica (recomprimida/reescalada) de otra inversión?
+    # Solo se avisa al admin; esta imagen se pasa igual por tesseract y se verifica con su propio texto
+    job["phash"] = image_dhash(job["path"])
+    similar = ocr_cache.find_similar(job["phash"], exclude_sha=job.get("sha"))
+    if similar is not None:
+        other = repo.investment_by_sha(similar[0])
+        if other is not None and other != job.get("duplicate_of"):
+            job["similar_of"] = other
+    return None
+
+ocr_pipeline = OcrPipeline(on_ocr_result, workers=OCR_WORKERS, procs_per_core=OCR_PROCS_PER_CORE, max_queue=OCR_QUEUE_MAX,
+                           preprocess=OCR_PREPROCESS, precheck=ocr_precheck, heartbeat=lambda: supervisor.beat("ocr"),
+                           fn=receipt.parse_file if OCR_STRUCTURED else None)
+
 # ---------------- Admin Panel ----------------
-@bot.message_handler(func=lambda m: m.text == "📈 Panel admin")
+@router.text("📈 Panel admin", admin=True, denied=_denied_no_access)
 def panel_admin(m):
-    if m.from_user.id != ADMIN_ID:
-        safe_send(m.chat.id, "❌ No tienes acceso.")
-        return
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("📊 Estadísticas"), types.KeyboardButton("🔎 Revisar pendientes"))
-    markup.add(types.KeyboardButton("📜 Historial"), types.KeyboardButton("🔙 Volver"))
-    safe_send(m.chat.id, "Panel admin - selecciona una opción:", reply_markup=markup)
+    safe_send(m.chat.id, "Panel admin - selecciona una opción:", reply_markup=KB_PANEL_ADMIN)
 
-@bot.message_handler(func=lambda m: m.text == "📊 Estadísticas")
+@router.text("📊 Estadísticas", admin=True, denied=_denied_silent)
 def admin_stats(m):
-    if m.from_user.id != ADMIN_ID:
-        return
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM usuarios"); total_users = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM inversiones WHERE estado='Pendiente'"); pend = cur.fetchone()[0]
-    cur.execute("SELECT SUM(monto) FROM inversiones WHERE estado='Aprobado'"); s = cur.fetchone()[0] or 0
-    conn.close()
-    safe_send(m.chat.id, f"📊 Usuarios: {total_users}\nInversiones pendientes: {pend}\nTotal invertido (aprobado): ${fmt_money(s)}")
-
-@bot.message_handler(func=lambda m: m.text == "🔎 Revisar pendientes")
+    # contadores mantenidos por stats.py (O(1)); /statscheck compara con las tablas
+    t = repo.totals()
+    hoy = repo.day(iso_today())
+    q = ocr_pipeline.stats()
+    o = outbox.stats()
+    c = ocr_cache.stats()
+    pc = repo_cache_stats().get("profiles")
+    safe_send(m.chat.id, f"📊 Usuarios: {t.get('usuarios', 0)}\nInversiones pendientes: {t.get('pendiente_n', 0)} (${fmt_money(t.get('pendiente_sum', 0))})\n"
+                         f"Total invertido (aprobado): ${fmt_money(t.get('aprobado_sum', 0))} en {t.get('aprobado_n', 0)}\n"
+                         f"Rechazadas: {t.get('rechazado_n', 0)} (${fmt_money(t.get('rechazado_sum', 0))})\n"
+                         f"📅 Hoy: {hoy.get('pendiente_n', 0) + hoy.get('aprobado_n', 0) + hoy.get('rechazado_n', 0)} inversiones · "
+                         f"${fmt_money(hoy.get('pendiente_sum', 0) + hoy.get('aprobado_sum', 0) + hoy.get('rechazado_sum', 0))}\n"
+                         f"🧾 Cola OCR: {q['queued']}/{q['max_queue']} · en proceso: {q['in_flight']} · workers: {q['workers']}\n"
+                         f"🗂️ Caché OCR: {c['exact']} idénticos · {c['miss']} nuevos ({c['similar']} parecidos a otro)\n"
+                         + (f"🧠 Caché perfiles: {pc['hit_rate'] * 100:.0f}% aciertos · {pc['size']} en memoria\n" if pc else "") +
+                         f"📤 Envíos: {o['sent']} ok · {o['failed']} fallidos · {o['queued']} en cola · 429: {o['rate_limited']} · "
+                         f"latencia media {o['latency_avg'] * 1000:.0f} ms"
+                         + (f"\n💾 Último backup {last_backup['id']}: {last_backup['duration_s']} s · +{fmt_money(last_backup['bytes_written'])} B"
+                            if last_backup else ""))
+
+REVIEW_PAGE_SIZE = int(os.environ.get("REVIEW_PAGE_SIZE", "5"))
+
+@router.text("🔎 Revisar pendientes", admin=True, denied=_denied_silent)
 def admin_revisar_pendientes(m):
-    if m.from_user.id != ADMIN_ID:
-        return
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT id, user_id, monto, fecha_inversion, fecha_pago, comprobante_path, ocr_text FROM inversiones WHERE estado='Pendiente' ORDER BY id ASC")
-    rows = cur.fetchall(); conn.close()
+    show_pending_page(m.chat.id)
+
+def _backfill_file_id(inv_id, tipo):
+    # comprobantes antiguos sin file_id: guardar el que devuelve Telegram tras la primera subida
+    def cb(sent):
+        try:
+            fid = sent.photo[-1].file_id if tipo == "photo" else sent.document.file_id
+            repo.set_file_id(inv_id, fid, tipo)
+        except Exception:
+            traceback.print_exc()
+    return cb
+
+PHOTO_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+def send_pending_row(chat_id, r):
+    inv_id, uid, monto, finv, fpago, path, ocr_text, file_id, tipo = r
+    text = f"ID:{inv_id} · Usuario:{uid} · Monto:${fmt_money(monto)} · Fecha pago:{fpago}\nOCR: {ocr_text[:200] if ocr_text else 'N/A'}"
+    kb = types.InlineKeyboardMarkup()
+    kb.add(types.InlineKeyboardButton("✅ Aprobar", callback_data=f"APP|{inv_id}"),
+           types.InlineKeyboardButton("❌ Rechazar", callback_data=f"REJ|{inv_id}"))
+    if tipo is None and path:
+        # filas anteriores a comprobante_tipo: los PDF y demás documentos no se pueden mandar como foto
+        tipo = "photo" if os.path.splitext(path)[1].lower() in PHOTO_EXTS else "document"
+    method = "send_document" if tipo == "document" else "send_photo"
+    if file_id:
+        # reenvío por file_id: Telegram no vuelve a recibir el archivo
+        outbox.enqueue(method, chat_id, file_id, caption=text, reply_markup=kb)
+    elif path and os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            extra = {"visible_file_name": os.path.basename(path)} if method == "send_document" else {}
+            outbox.enqueue(method, chat_id, data, caption=text, reply_markup=kb,
+                           on_sent=_backfill_file_id(inv_id, tipo), **extra)
+        except Exception:
+            safe_send(chat_id, text, reply_markup=kb)
+    else:
+        safe_send(chat_id, text, reply_markup=kb)
+
+def show_pending_page(chat_id, after_id=None, before_id=None):
+    """
+    Paginación por clave (id) sobre idx_inv_estado_id: cada página cuesta lo
+    mismo sin importar cuántos pendientes haya antes.
+    """
+    if before_id is not None:
+        rows = repo.pending_before(before_id, REVIEW_PAGE_SIZE + 1)
+        has_prev = len(rows) > REVIEW_PAGE_SIZE
+        rows = rows[:REVIEW_PAGE_SIZE][::-1]
+        has_next = True
+    else:
+        rows = repo.pending_after(after_id, REVIEW_PAGE_SIZE + 1)
+        has_next = len(rows) > REVIEW_PAGE_SIZE
+        rows = rows[:REVIEW_PAGE_SIZE]
+        has_prev = bool(after_id)
     if not rows:
-        safe_send(m.chat.id, "✅ No hay inversiones pendientes.")
+        safe_send(chat_id, "✅ No hay inversiones pendientes.")
         return
     for r in rows:
-        inv_id, uid, monto, finv, fpago, path, ocr_text = r
-        text = f"ID:{inv_id} · Usuario:{uid} · Monto:${fmt_money(monto)} · Fecha pago:{fpago}\nOCR: {ocr_text[:200] if ocr_text else 'N/A'}"
-        if path and os.path.exists(path):
-            try:
-                bot.send_photo(m.chat.id, open(path, "rb"), caption=text)
-            except:
-                safe_send(m.chat.id, text)
+        send_pending_row(chat_id, r)
+    total = repo.pending_count()
+    nav = []
+    if has_prev:
+        nav.append(types.InlineKeyboardButton("⬅️ Anterior", callback_data=f"PEN|<|{rows[0][0]}"))
+    if has_next:
+        nav.append(types.InlineKeyboardButton("Siguiente ➡️", callback_data=f"PEN|>|{rows[-1][0]}"))
+    kb = types.InlineKeyboardMarkup()
+    # revisión por lote: las pendientes de esta página (rango de IDs mostrado)
+    lo, hi = rows[0][0], rows[-1][0]
+    kb.add(types.InlineKeyboardButton(f"✅ Aprobar {len(rows)}", callback_data=f"BAT|A|{lo}|{hi}"),
+           types.InlineKeyboardButton(f"❌ Rechazar {len(rows)}", callback_data=f"BAT|R|{lo}|{hi}"))
+    if nav:
+        kb.add(*nav)
+    safe_send(chat_id, f"🔎 Pendientes ID {lo}–{hi} · total pendientes: {total}\n"
+                       f"Lotes: /aprobar 12 15 20-30 · /aprobar ocr (todas con OCR OK)", reply_markup=kb)
+
+@router.callback("PEN|", admin=True)
+def admin_pending_nav(c):
+    try:
+        _, direction, ref = c.data.split("|")
+        bot.answer_callback_query(c.id)
+        if direction == "<":
+            show_pending_page(c.message.chat.id, before_id=int(ref))
         else:
-            safe_send(m.chat.id, text)
-        kb = types.InlineKeyboardMarkup()
-        kb.add(types.InlineKeyboardButton("✅ Aprobar", callback_data=f"APP|{inv_id}"),
-               types.InlineKeyboardButton("❌ Rechazar", callback_data=f"REJ|{inv_id}"))
-        safe_send(m.chat.id, "Acciones:", reply_markup=kb)
+            show_pending_page(c.message.chat.id, after_id=int(ref))
+    except Exception:
+        traceback.print_exc()
 
-@bot.callback_query_handler(func=lambda c: c.data and (c.data.startswith("APP|") or c.data.startswith("REJ|")))
+@router.callback("APP|", "REJ|", admin=True, denied=_denied_callback)
 def admin_process_callback(c):
     try:
-        if c.from_user.id != ADMIN_ID:
-            return bot.answer_callback_query(c.id, "No autorizado.")
         action, inv_id = c.data.split("|")
         inv_id = int(inv_id)
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("SELECT user_id, monto, fecha_pago FROM inversiones WHERE id=?", (inv_id,))
-        row = cur.fetchone()
-        if not row:
-            conn.close()
-            return bot.answer_callback_query(c.id, "Inversión no encontrada.")
-        uid, monto, fecha_pago = row
-        if action == "APP":
-            cur.execute("UPDATE inversiones SET estado='Aprobado' WHERE id=?", (inv_id,))
-            ganancia = int(monto * 0.6)  # 60% ganancia como antes
-            cur.execute("UPDATE usuarios SET total_invertido = total_invertido + ?, ganancia_total = ganancia_total + ? WHERE user_id=?", (monto, ganancia, uid))
-            conn.commit(); conn.close()
+        estado = review.APROBADO if action == "APP" else review.RECHAZADO
+        changed = repo.decide([inv_id], estado)
+        if not changed:
+            # doble clic o ya decidida desde un lote: no se vuelve a sumar nada
+            estado_actual = repo.estado(inv_id)
+            return bot.answer_callback_query(c.id, f"Ya estaba {estado_actual}." if estado_actual else "Inversión no encontrada.")
+        if estado == review.APROBADO:
             bot.answer_callback_query(c.id, "Inversión aprobada.")
             safe_send(ADMIN_ID, f"✅ Inversión {inv_id} aprobada.")
-            try:
-                safe_send(uid, f"✅ Tu inversión de ${fmt_money(monto)} ha sido aprobada.\n💰 Ganancia estimada: ${fmt_money(ganancia)}\n📅 Recibirás tu pago el {fecha_pago}")
-            except:
-                pass
         else:
-            cur.execute("UPDATE inversiones SET estado='Rechazado' WHERE id=?", (inv_id,))
-            conn.commit(); conn.close()
             bot.answer_callback_query(c.id, "Inversión rechazada.")
             safe_send(ADMIN_ID, f"❌ Inversión {inv_id} rechazada.")
-            try:
-                safe_send(uid, f"❌ Tu comprobante de ${fmt_money(monto)} fue rechazado. Revisa la información y vuelve a enviar uno válido.")
-            except:
-                pass
+        notify_decisions(changed, estado)
     except Exception:
         traceback.print_exc()
         try:
@@ -564,31 +799,156 @@ def admin_process_callback(c):
         except:
             pass
 
-@bot.message_handler(func=lambda m: m.text == "📜 Historial")
+def notify_decisions(changed, estado):
+    # después del COMMIT; el outbox reparte los envíos sin bloquear al handler
+    for inv_id, uid, monto, fecha_pago, _ in changed:
+        if estado == review.APROBADO:
+            safe_send(uid, f"✅ Tu inversión de ${fmt_money(monto)} ha sido aprobada.\n💰 Ganancia estimada: ${fmt_money(review.ganancia(monto))}\n📅 Recibirás tu pago el {fecha_pago}")
+        else:
+            safe_send(uid, f"❌ Tu comprobante de ${fmt_money(monto)} fue rechazado. Revisa la información y vuelve a enviar uno válido.")
+
+def apply_batch(chat_id, ids, estado):
+    """Decide un lote en una transacción y notifica. Devuelve cuántas cambiaron."""
+    t0 = time.perf_counter()
+    changed = repo.decide(ids, estado)
+    dt = time.perf_counter() - t0
+    notify_decisions(changed, estado)
+    icon = "✅" if estado == review.APROBADO else "❌"
+    total = sum(r[2] or 0 for r in changed)
+    safe_send(chat_id, f"{icon} Lote: {len(changed)} {estado.lower()}(s) por ${fmt_money(total)} · "
+                       f"{len(ids) - len(changed)} omitida(s) (ya decididas) · {dt * 1000:.0f} ms")
+    return len(changed)
+
+@router.command("aprobar", "rechazar", admin=True)
+def cmd_batch(message):
+    # /aprobar 12 15 20-30 · /rechazar 40-45 · /aprobar ocr (todas las pendientes con OCR OK, con confirmación)
+    try:
+        parts = message.text.split(maxsplit=1)
+        aprobar = parts[0][1:].split("@")[0] == "aprobar"
+        estado = review.APROBADO if aprobar else review.RECHAZADO
+        arg = parts[1].strip() if len(parts) > 1 else ""
+        if arg.lower() == "ocr":
+            ids = repo.pending_ids(ocr_ok=True)
+            if not ids:
+                safe_send(message.chat.id, "No hay pendientes con OCR OK.")
+                return
+            kb = types.InlineKeyboardMarkup()
+            kb.add(types.InlineKeyboardButton(f"{'✅ Aprobar' if aprobar else '❌ Rechazar'} {len(ids)}",
+                                              callback_data=f"BAT|{'A' if aprobar else 'R'}|ocr|{ids[-1]}"))
+            safe_send(message.chat.id, f"{len(ids)} pendiente(s) con OCR OK (ID {ids[0]}–{ids[-1]}). ¿Confirmar?", reply_markup=kb)
+            return
+        ids, err = review.parse_ids(arg)
+        if err or not ids:
+            safe_send(message.chat.id, f"⚠️ {err or 'Indica los IDs.'}\nUso: /{parts[0][1:]} 12 15 20-30  ·  /{parts[0][1:]} ocr")
+            return
+        apply_batch(message.chat.id, ids, estado)
+    except Exception:
+        traceback.print_exc()
+        safe_send(message.chat.id, "Error procesando el lote.")
+
+@router.callback("BAT|", admin=True)
+def admin_batch_callback(c):
+    # BAT|A|<desde>|<hasta> (página de pendientes) · BAT|A|ocr|<hasta> (OCR OK hasta ese ID)
+    try:
+        _, action, sel, ref = c.data.split("|", 3)
+        estado = review.APROBADO if action == "A" else review.RECHAZADO
+        if sel == "ocr":
+            ids = repo.pending_ids(hi=int(ref), ocr_ok=True)
+        else:
+            ids = repo.pending_ids(lo=int(sel), hi=int(ref))
+        bot.answer_callback_query(c.id, "Procesando lote...")
+        apply_batch(c.message.chat.id, ids, estado)
+    except Exception:
+        traceback.print_exc()
+        try:
+            bot.answer_callback_query(c.id, "Error procesando el lote.")
+        except:
+            pass
+
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+
+@router.text("📜 Historial", admin=True, denied=_denied_silent)
 def admin_historial(m):
-    if m.from_user.id != ADMIN_ID:
+    show_history_page(m.chat.id, {})
+
+@router.command("historial", admin=True)
+def cmd_historial(message):
+    # /historial estado=aprobado user=123 desde=2025-01-01 hasta=2025-01-31
+    parts = message.text.split(maxsplit=1)
+    f, err = history.parse_filters(parts[1] if len(parts) > 1 else "")
+    if err:
+        safe_send(message.chat.id, f"⚠️ {err}\nUso: /historial estado=aprobado user=123 desde=AAAA-MM-DD hasta=AAAA-MM-DD")
         return
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT id, user_id, monto, estado, fecha_inversion FROM inversiones ORDER BY id DESC LIMIT 50")
-    rows = cur.fetchall(); conn.close()
+    show_history_page(message.chat.id, f)
+
+def show_history_page(chat_id, f, before_id=None, after_id=None):
+    """Paginación por clave sobre inversiones.id (ver history.py); una página por mensaje."""
+    rows, newer, older = repo.history_page(f, before_id, after_id, HISTORY_PAGE_SIZE)
     if not rows:
-        safe_send(m.chat.id, "No hay historial.")
+        safe_send(chat_id, f"No hay historial ({history.describe(f)}).")
         return
-    s = "📜 Historial (últimos 50):\n"
-    for r in rows:
-        s += f"ID {r[0]} | U:{r[1]} | ${fmt_money(r[2])} | {r[3]} | Inv:{r[4]}\n"
-    safe_send(m.chat.id, s)
+    lines = [f"📜 Historial ({history.describe(f)}) · ID {rows[0][0]}–{rows[-1][0]}"]
+    lines += [f"ID {r[0]} | U:{r[1]} | ${fmt_money(r[2])} | {r[3]} | Inv:{r[4]}" for r in rows]
+    enc = history.encode_filters(f)
+    nav = []
+    if newer:
+        nav.append(types.InlineKeyboardButton("⬅️ Más recientes", callback_data=f"HIS|<|{rows[0][0]}|{enc}"))
+    if older:
+        nav.append(types.InlineKeyboardButton("Más antiguas ➡️", callback_data=f"HIS|>|{rows[-1][0]}|{enc}"))
+    kb = types.InlineKeyboardMarkup()
+    if nav:
+        kb.add(*nav)
+    safe_send(chat_id, "\n".join(lines), reply_markup=kb)
 
-@bot.message_handler(func=lambda m: m.text == "🔙 Volver")
+@router.callback("HIS|", admin=True)
+def admin_history_nav(c):
+    try:
+        _, direction, ref, enc = c.data.split("|", 3)
+        bot.answer_callback_query(c.id)
+        f = history.decode_filters(enc)
+        if direction == "<":
+            show_history_page(c.message.chat.id, f, after_id=int(ref))
+        else:
+            show_history_page(c.message.chat.id, f, before_id=int(ref))
+    except Exception:
+        traceback.print_exc()
+
+@router.command("exportar", admin=True)
+def cmd_exportar(message):
+    # /exportar [csv|jsonl] [filtros como /historial] -> documento .gz
+    parts = message.text.split()[1:]
+    fmt = parts.pop(0).lower() if parts and parts[0].lower() in ("csv", "jsonl") else "csv"
+    f, err = history.parse_filters(" ".join(parts))
+    if err:
+        safe_send(message.chat.id, f"⚠️ {err}\nUso: /exportar [csv|jsonl] estado=... user=... desde=... hasta=...")
+        return
+    safe_send(message.chat.id, f"⏳ Exportando inversiones ({history.describe(f)}) en {fmt.upper()}...")
+    # en un hilo aparte: una exportación grande no ocupa un worker del bot
+    threading.Thread(target=_send_export, args=(message.chat.id, fmt, f), daemon=True).start()
+
+def _export_chunks(fmt, f):
+    sql, params = history.export_query(f)
+    rows = export.iter_query(DB_FILE, sql, params)
+    if fmt == "jsonl":
+        return export.iter_jsonl(history.EXPORT_COLUMNS, rows)
+    return export.iter_csv(history.EXPORT_COLUMNS, rows)
+
+def _send_export(chat_id, fmt, f):
+    try:
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        with export.spooled_gzip(_export_chunks(fmt, f)) as out:
+            bot.send_document(chat_id, out, caption=f"📤 Inversiones ({history.describe(f)})",
+                              visible_file_name=f"inversiones_{ts}.{fmt}.gz")
+    except Exception as e:
+        traceback.print_exc()
+        safe_send(chat_id, f"⚠️ Error exportando: {e}")
+
+@router.text("🔙 Volver")
 def admin_volver(m):
     safe_send(m.chat.id, "Volviendo al menú...", reply_markup=menu_principal_for(m.from_user.id))
 # ---------------- Comando /ping (solo admin) ----------------
-@bot.message_handler(commands=["ping"])
+@router.command("ping", admin=True, denied=_denied_reply("❌ No tienes permiso para usar este comando."))
 def cmd_ping(message):
-    if message.from_user.id != ADMIN_ID:
-        bot.reply_to(message, "❌ No tienes permiso para usar este comando.")
-        return
-
     start = time.time()
     msg = bot.reply_to(message, "⏳ Ping en progreso...")
     end = time.time()
@@ -600,18 +960,34 @@ def cmd_ping(message):
         message_id=msg.message_id
     )
 
+# ---------------- Comandos admin /statscheck y /statsrebuild ----------------
+@router.command("statscheck", "statsrebuild", admin=True)
+def cmd_stats_check(message):
+    try:
+        drift = stats.verify(db)
+        if drift:
+            lines = [f"{k}: guardado {a} · real {b}" for k, (a, b) in sorted(drift.items())[:30]]
+            safe_send(message.chat.id, f"⚠️ Deriva en {len(drift)} contador(es):\n" + "\n".join(lines))
+        else:
+            safe_send(message.chat.id, "✅ Estadísticas consistentes con las tablas.")
+        if message.text.startswith("/statsrebuild"):
+            stats.rebuild(db)
+            safe_send(message.chat.id, "🔁 Estadísticas reconstruidas.")
+    except Exception:
+        traceback.print_exc()
+        safe_send(message.chat.id, "Error verificando estadísticas.")
+
 # ---------------- Comando admin /dumpdb ----------------
-@bot.message_handler(commands=["dumpdb"])
+@router.command("dumpdb", admin=True, denied=_denied_reply("No autorizado."))
 def cmd_dumpdb(message):
     try:
-        if message.from_user.id != ADMIN_ID:
-            bot.reply_to(message, "No autorizado.")
-            return
         if not os.path.exists(DB_FILE):
             bot.reply_to(message, "❌ No existe la base de datos.")
             return
-        with open(DB_FILE, "rb") as f:
-            bot.send_document(ADMIN_ID, f, caption="📥 Base de datos (inversionesct.db)")
+        # instantánea consistente (API de backup), comprimida fuera de memoria
+        with export.spooled_db_zip(DB_FILE) as f:
+            bot.send_document(ADMIN_ID, f, caption="📥 Base de datos (inversionesct.db)",
+                              visible_file_name="inversionesct_db.zip")
     except Exception:
         traceback.print_exc()
         try:
@@ -620,152 +996,451 @@ def cmd_dumpdb(message):
             pass
 
 # ---------------- Flask keep-alive + /download-db (protegido) ----------------
-app = Flask(__name__)
-
-@app.route("/")
-def home():
-    return "InversionesCT está en línea ✅"
-
-@app.route("/download-db")
-def download_db():
-    token = request.args.get("token", "")
-    DB_DOWNLOAD_TOKEN = os.environ.get("DB_DOWNLOAD_TOKEN", str(ADMIN_ID))
-    if token != DB_DOWNLOAD_TOKEN:
-        abort(403)
-    if not os.path.exists(DB_FILE):
-        abort(404)
-    zip_path = "/tmp/inversionesct_db_backup.zip"
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.write(DB_FILE, arcname=os.path.basename(DB_FILE))
-    return send_file(zip_path, as_attachment=True)
+def create_app():
+    """
+    App Flask (keep-alive, /download-db, /export, /metrics, /health y webhook). Flask se
+    importa aquí: no se paga al importar main.py.
+    """
+    global app
+    if app is not None:
+        return app
+    from flask import Flask, Response, request, abort, stream_with_context
+    app = Flask(__name__)
+
+    @app.route("/")
+    def home():
+        return "InversionesCT está en línea ✅"
+
+    def _require_download_token():
+        token = request.args.get("token", "")
+        DB_DOWNLOAD_TOKEN = os.environ.get("DB_DOWNLOAD_TOKEN", str(ADMIN_ID))
+        if token != DB_DOWNLOAD_TOKEN:
+            abort(403)
+
+    @app.route("/download-db")
+    def download_db():
+        _require_download_token()
+        if not os.path.exists(DB_FILE):
+            abort(404)
+        # instantánea propia de cada petición + zip en streaming (sin archivo zip temporal)
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        return Response(stream_with_context(export.stream_db_zip(DB_FILE)), mimetype="application/zip",
+                        headers={"Content-Disposition": f"attachment; filename=inversionesct_db_{ts}.zip"})
+
+    @app.route("/export/inversiones")
+    def export_inversiones():
+        # ?token=...&format=csv|jsonl&estado=&user=&desde=&hasta= ; fila a fila, memoria constante
+        _require_download_token()
+        fmt = request.args.get("format", "csv").lower()
+        if fmt not in ("csv", "jsonl"):
+            abort(400)
+        f, err = history.parse_filters(" ".join(f"{k}={request.args[k]}" for k in ("estado", "user", "desde", "hasta")
+                                                if request.args.get(k)))
+        if err:
+            return Response(err + "\n", status=400, mimetype="text/plain")
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        return Response(stream_with_context(_export_chunks(fmt, f)), mimetype=mimetype,
+                        headers={"Content-Disposition": f"attachment; filename=inversiones_{ts}.{fmt}"})
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        if not METRICS_ENABLED:
+            abort(404)
+        if METRICS_TOKEN:
+            got = request.args.get("token", "") or request.headers.get("Authorization", "").replace("Bearer ", "", 1)
+            if not hmac.compare_digest(got, METRICS_TOKEN):
+                abort(403)
+        return Response(registry.render(), content_type=metrics.CONTENT_TYPE)
+
+    @app.route("/health")
+    def health():
+        """Readiness: 200 si bot y componentes críticos están bien, 503 si no. JSON con el detalle."""
+        ok, components = supervisor.ready()
+        ok = ok and bot is not None
+        received = last_update["received"]
+        body = {
+            "status": "ok" if ok else "degraded",
+            "components": components,
+            "last_update_age_s": round(time.time() - received, 1) if received else None,
+            "last_update_lag_s": last_update["lag"],
+            "queues": {"outbox": outbox.depth() if outbox else None, "ocr": ocr_pipeline.depth(), "writer": writer.depth()},
+        }
+        return Response(json.dumps(body), status=200 if ok else 503, mimetype="application/json")
+
+    @app.route("/health/live")
+    def health_live():
+        # liveness: el proceso responde y el supervisor sigue vigilando
+        if supervisor.alive():
+            return "ok"
+        return Response("supervisor detenido\n", status=503, mimetype="text/plain")
+
+    @app.route(WEBHOOK_PATH, methods=["POST"])
+    def telegram_webhook():
+        """
+        Recibe updates de Telegram. Valida el secret token y los entrega al pool
+        de workers de handlers (en asyncio se programan en el loop); la petición
+        vuelve sin esperar al handler.
+        Para probar en local: scripts/post_update.py
+        """
+        got = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(got, WEBHOOK_SECRET):
+            abort(403)
+        try:
+            update = types.Update.de_json(request.get_data(as_text=True))
+        except Exception:
+            abort(400)
+        if update is None:
+            abort(400)
+        note_updates([update])
+        if aio is not None:
+            aio.spawn(abot.process_new_updates([update]))
+        else:
+            dispatch_updates([update])
+        return ""
+
+    return app
 
 def run_flask():
     port = int(os.environ.get("PORT", 8080))
-    app.run(host="0.0.0.0", port=port)
+    create_app().run(host="0.0.0.0", port=port)
 
 def keep_alive():
     t = threading.Thread(target=run_flask, daemon=True)
     t.start()
 
 # ---------------- Backup automático diario ----------------
+# Incremental y deduplicado (ver backup.py); al admin solo le llega el resumen
+BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(os.getcwd(), "backups"))
+BACKUP_KEEP_DAILY = int(os.environ.get("BACKUP_KEEP_DAILY", "7"))
+BACKUP_KEEP_WEEKLY = int(os.environ.get("BACKUP_KEEP_WEEKLY", "4"))
+BACKUP_KEEP_MONTHLY = int(os.environ.get("BACKUP_KEEP_MONTHLY", "6"))
+# backups/ está en el mismo disco que la base: con "telegram" (por defecto) cada backup manda
+# además la instantánea comprimida al chat del admin; "none" deja solo la copia local
+BACKUP_OFFSITE = os.environ.get("BACKUP_OFFSITE", "telegram").lower()
+TELEGRAM_UPLOAD_MAX = 50 * 1024 * 1024   # límite de send_document de la Bot API
+last_backup = {}   # métricas del último backup (admin_stats)
+
+def run_backup():
+    store = BackupStore(BACKUP_DIR)
+    man = store.run(DB_FILE, DOWNLOAD_DIR)
+    removed, swept = store.prune(BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY, BACKUP_KEEP_MONTHLY)
+    m = dict(man["metrics"], id=man["id"], verified=man.get("verified"),
+             pruned=removed, swept=swept, store_bytes=store.usage_bytes())
+    last_backup.clear(); last_backup.update(m)
+    return m
+
+def send_backup_offsite(backup_id):
+    """Copia fuera del servidor del backup recién hecho. Devuelve la línea para el aviso al admin."""
+    if BACKUP_OFFSITE == "none":
+        return "💽 Solo copia local (BACKUP_OFFSITE=none)"
+    try:
+        with export.spooled_db_zip(DB_FILE) as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(0)
+            if size > TELEGRAM_UPLOAD_MAX:
+                return f"⚠️ Instantánea de {fmt_money(size)} B: supera el límite de Telegram, solo hay copia local (/download-db)"
+            bot.send_document(ADMIN_ID, f, caption=f"💾 Base de datos · backup {backup_id}",
+                              visible_file_name=f"inversionesct_backup_{backup_id}.zip")
+        return f"☁️ Copia enviada a este chat ({fmt_money(size)} B)"
+    except Exception as e:
+        traceback.print_exc()
+        return f"⚠️ No se pudo enviar la copia fuera del servidor: {e}"
+
 def backup_task(interval_hours=24):
     while True:
+        supervisor.beat("backup")
         try:
             if not os.path.exists(DB_FILE):
                 time.sleep(60*10)
                 continue
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-            zip_path = f"/tmp/inversionesct_backup_{timestamp}.zip"
-            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-                zf.write(DB_FILE, arcname=os.path.basename(DB_FILE))
-            try:
-                with open(zip_path, "rb") as f:
-                    bot.send_document(ADMIN_ID, f, caption=f"🔁 Backup automático - {timestamp}")
-            except Exception:
-                try:
-                    bot.send_message(ADMIN_ID, f"⚠️ Backup creado en servidor: {zip_path}")
-                except:
-                    pass
+            m = run_backup()
+            offsite = send_backup_offsite(m["id"])
+            estado = "✅ verificado" if m["verified"] else "❌ FALLÓ la verificación"
+            safe_send(ADMIN_ID, f"🔁 Backup automático {m['id']} · {estado}\n"
+                                f"DB {fmt_money(m['db_size'])} B · nuevos {fmt_money(m['bytes_written'])} B "
+                                f"({m['chunks_new']} trozos nuevos, {m['chunks_reused']} reutilizados)\n"
+                                f"Comprobantes: {m['files_hashed']} nuevos/cambiados, {m['files_reused']} sin cambios\n"
+                                f"⏱️ {m['duration_s']} s · almacén {fmt_money(m['store_bytes'])} B · podados {m['pruned']}\n"
+                                f"{offsite}")
         except Exception as e:
-            try:
-                bot.send_message(ADMIN_ID, f"⚠️ Error en backup automático: {e}")
-            except:
-                pass
+            traceback.print_exc()
+            safe_send(ADMIN_ID, f"⚠️ Error en backup automático: {e}")
         time.sleep(interval_hours * 3600)
 
-backup_thread = threading.Thread(target=backup_task, args=(24,), daemon=True)
-backup_thread.start()
-
 # ---------------- Fallback handler ----------------
-@bot.message_handler(func=lambda m: True)
+@router.default
 def fallback(m):
     safe_send(m.chat.id, "Selecciona una opción:", reply_markup=menu_principal_for(m.from_user.id))
 
+# ---------------- Métricas: colas y handlers ----------------
+registry.func("inversionesct_ocr_queue_depth", "Comprobantes esperando OCR", lambda: ocr_pipeline.depth())
+registry.func("inversionesct_ocr_in_flight", "Comprobantes en los workers de OCR", lambda: ocr_pipeline.stats()["in_flight"])
+registry.func("inversionesct_ocr_jobs_total", "Trabajos de OCR por resultado",
+              lambda: [((k,), v) for k, v in ocr_pipeline.stats().items() if k in ("done", "failed", "rejected", "cached")],
+              kind="counter", labels=("result",))
+registry.func("inversionesct_ocr_cache_total", "Consultas a la caché de OCR",
+              lambda: [((k,), v) for k, v in ocr_cache.stats().items()], kind="counter", labels=("result",))
+registry.func("inversionesct_outbox_queue_depth", "Mensajes en la cola de envío", lambda: outbox.depth())
+registry.func("inversionesct_outbox_messages_total", "Mensajes del outbox por resultado",
+              lambda: [((k,), v) for k, v in outbox.stats().items()
+                       if k in ("enqueued", "sent", "failed", "retried", "coalesced", "rate_limited", "fallback_plain")],
+              kind="counter", labels=("result",))
+registry.func("inversionesct_db_open_connections", "Conexiones SQLite abiertas (una por hilo)", lambda: db.open_connections())
+registry.func("inversionesct_conversations_active", "Conversaciones de varios pasos abiertas", lambda: conv.store.count())
+registry.func("inversionesct_heartbeat_age_seconds", "Segundos desde el último latido de cada componente",
+              lambda: [((k,), v["age_s"]) for k, v in supervisor.status().items()], labels=("component",))
+registry.func("inversionesct_component_restarts_total", "Reinicios hechos por el supervisor",
+              lambda: [((k,), v["restarts"]) for k, v in supervisor.status().items()], kind="counter", labels=("component",))
+registry.func("inversionesct_repo_cache_total", "Lecturas de la caché de perfiles/elegibilidad por resultado",
+              lambda: [((name, k), v) for name, st in repo_cache_stats().items()
+                       for k, v in st.items() if k in ("hits", "misses", "evictions")],
+              kind="counter", labels=("cache", "result"))
+registry.func("inversionesct_repo_cache_hit_ratio", "Proporción de aciertos desde el arranque",
+              lambda: [((name,), st["hit_rate"]) for name, st in repo_cache_stats().items()], labels=("cache",))
+registry.func("inversionesct_repo_cache_entries", "Entradas en la caché de perfiles/elegibilidad",
+              lambda: [((name,), st["size"]) for name, st in repo_cache_stats().items()], labels=("cache",))
+registry.func("inversionesct_writer_queue_depth", "Escrituras esperando el próximo COMMIT agrupado", lambda: writer.depth())
+registry.func("inversionesct_writer_total", "Escrituras agrupadas y COMMIT del writer",
+              lambda: [((k,), v) for k, v in writer.stats().items() if k in ("writes", "batches", "failed", "split")],
+              kind="counter", labels=("kind",))
+
+# ---------------- Arranque (application factory) ----------------
+# Todo lo que abre archivos, crea el bot o lanza hilos está aquí y se llama
+# explícitamente desde __main__ (o desde un benchmark con lo que necesite).
+_started = set()
+
+def _once(name):
+    if name in _started:
+        return False
+    _started.add(name)
+    return True
+
+def dispatch_updates(updates):
+    """BOT_ENGINE=threads: cada update a un worker del pool (polling y webhook)."""
+    for u in updates:
+        handler_pool.submit(bot.process_new_updates, [u])
+
+def _polling_error(e, fails):
+    print("⚠️ Polling error:", e)
+    if fails == 3:
+        safe_send(ADMIN_ID, f"⚠️ El bot ha fallado {fails} veces seguidas. Revisar conexión.")
+
+def create_bot():
+    """TeleBot + outbox, pool de handlers y poller (sin arrancar) + registro de handlers. Idempotente."""
+    global bot, outbox, poller, handler_pool
+    if bot is not None:
+        return bot
+    if TELEGRAM_API_URL:
+        apihelper.API_URL = TELEGRAM_API_URL + "/bot{0}/{1}"
+        apihelper.FILE_URL = TELEGRAM_API_URL + "/file/bot{0}/{1}"
+    # threaded=False: los handlers corren en handler_pool (polling.py), que el supervisor puede reiniciar
+    b = TeleBot(TOKEN, parse_mode=None, threaded=False)
+    if METRICS_ENABLED:
+        # todas las salidas a Telegram (outbox, reply_to, answer_callback_query...) pasan por aquí
+        metrics.instrument_methods(b, ("send_message", "send_photo", "send_document", "edit_message_text",
+                                       "answer_callback_query", "get_file", "download_file"), m_api, m_api_err)
+    outbox = Outbox(b, workers=OUTBOX_WORKERS, global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE,
+                    chat_burst=OUTBOX_CHAT_BURST, max_retries=OUTBOX_MAX_RETRIES)
+    # cada getUpdates (aunque venga vacío) es un latido del polling
+    get_updates = b.get_updates
+    def _get_updates(*args, **kwargs):
+        updates = get_updates(*args, **kwargs)
+        note_updates(updates)
+        return updates
+    b.get_updates = _get_updates
+    # conversation_step primero, el router al final (incluye el fallback)
+    b.message_handler(func=_in_conversation, content_types=["text", "photo", "document"])(conversation_step)
+    router.install(b)
+    handler_tracker.install(b)
+    if METRICS_ENABLED:
+        metrics.instrument_router(router, m_handler, m_handler_err)
+        metrics.instrument_handlers(b, m_handler, m_handler_err)
+    handler_pool = WorkerPool(BOT_THREADS, "handler")
+    poller = Poller(b, dispatch_updates, timeout=20, long_polling_timeout=60, on_error=_polling_error)
+    bot = b
+    return bot
+
+# ---------------- Modo asyncio (BOT_ENGINE=asyncio) ----------------
+def handle_message(m):
+    """Entrada única de mensajes en modo asyncio: lo mismo que los dos handlers de create_bot()."""
+    if _in_conversation(m):
+        conversation_step(m)
+    elif m.content_type == "text":
+        router.dispatch_message(m)
+
+_download_slots = None
+
+async def _prefetch_receipt(m):
+    """Comprobante esperado: se descarga en el loop antes del handler, sin ocupar un hilo."""
+    if not (m.photo or m.document):
+        return
+    state = await aio.call(conv.current, m.chat.id)
+    if not state or state[0] != "comprobante":
+        return
+    file_id, _ = receipt_file_ref(m)
+    async with _download_slots:
+        info = await abot.get_file(file_id)
+        m.receipt_bytes = await abot.download_file(info.file_path)
+
+def create_async_bot():
+    """AsyncTeleBot en su propio loop + SyncBot (misma interfaz que TeleBot) para handlers y outbox. Idempotente."""
+    global bot, outbox, aio, abot, _download_slots
+    if bot is not None:
+        return bot
+    import asyncio
+    import aiobot
+    from telebot import asyncio_helper
+    from telebot.async_telebot import AsyncTeleBot
+    if TELEGRAM_API_URL:
+        asyncio_helper.API_URL = TELEGRAM_API_URL + "/bot{0}/{1}"
+        asyncio_helper.FILE_URL = TELEGRAM_API_URL + "/file/bot{0}/{1}"
+    aio = aiobot.AsyncRuntime(workers=ASYNC_WORKERS)
+    aio.start()
+    abot = AsyncTeleBot(TOKEN, parse_mode=None)
+    _download_slots = asyncio.Semaphore(ASYNC_DOWNLOADS)
+    get_updates = abot.get_updates
+    async def _get_updates(*args, **kwargs):
+        updates = await get_updates(*args, **kwargs)
+        note_updates(updates)
+        return updates
+    abot.get_updates = _get_updates
+    b = aiobot.SyncBot(abot, aio)
+    if METRICS_ENABLED:
+        metrics.instrument_methods(b, ("send_message", "send_photo", "send_document", "edit_message_text",
+                                       "answer_callback_query", "get_file", "download_file"), m_api, m_api_err)
+        metrics.instrument_router(router, m_handler, m_handler_err)
+    outbox = Outbox(b, workers=OUTBOX_WORKERS, global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE,
+                    chat_burst=OUTBOX_CHAT_BURST, max_retries=OUTBOX_MAX_RETRIES)
+    aiobot.install(abot, aio, handler_tracker.wrap(handle_message), handler_tracker.wrap(router.dispatch_callback),
+                   prefetch=_prefetch_receipt)
+    bot = b
+    return bot
+
+def init_storage():
+    """Directorio de comprobantes + migraciones de la base."""
+    if _once("storage"):
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        init_db()
+
+_backup_thread = None
+
+def start_backup_thread():
+    """Arranca el backup diario si no está corriendo. False si sigue vivo (bloqueado)."""
+    global _backup_thread
+    if _backup_thread is not None and _backup_thread.is_alive():
+        return False
+    _backup_thread = threading.Thread(target=backup_task, args=(24,), name="backup", daemon=True)
+    _backup_thread.start()
+    return True
+
+def start_background():
+    """Hilos de fondo: writer, outbox, barrido de conversaciones, OCR (si hay tesseract), backup diario y supervisor."""
+    if not _once("background"):
+        return
+    writer.start()
+    outbox.start()
+    conv.start_sweeper()
+    if handler_pool is not None:
+        handler_pool.start()
+    # un hilo colgado no se puede matar: el reinicio pone hilos nuevos y abandona el viejo
+    supervisor.register("handlers", HANDLER_STALL_S, busy=handler_tracker.in_flight,
+                        restart=handler_tracker.restart_with(aio.restart_executor if aio is not None
+                                                             else handler_pool.restart),
+                        info=lambda: {"in_flight": handler_tracker.in_flight(),
+                                      "oldest_s": round(handler_tracker.oldest(), 1)})
+    if ocr.available():   # primer import de PIL/pytesseract, fuera del camino de import
+        ocr_pipeline.start()
+        supervisor.register("ocr", OCR_STALL_S, restart=ocr_pipeline.restart,
+                            busy=lambda: ocr_pipeline.depth() > 0 or ocr_pipeline.stats()["in_flight"] > 0,
+                            info=lambda: {k: v for k, v in ocr_pipeline.stats().items()
+                                          if k in ("queued", "in_flight", "restarts")})
+    start_backup_thread()
+    supervisor.register("backup", 26 * 3600, restart=start_backup_thread, thread=lambda: _backup_thread,
+                        critical=False, info=lambda: {"last": last_backup.get("id")})
+    supervisor.start()
+
+def create_application(start=True):
+    """Monta todo en orden: base, bot, app Flask y (si start) los hilos de fondo."""
+    init_storage()
+    if BOT_ENGINE == "asyncio":
+        create_async_bot()
+    else:
+        create_bot()
+    create_app()
+    if start:
+        start_background()
+    return bot, app
+
+# ---------------- Webhook ----------------
+def start_webhook():
+    """
+    Registra el webhook en Telegram. Devuelve False si no se pudo (sin
+    WEBHOOK_URL o error de la API) para que el llamador use polling.
+    """
+    if not WEBHOOK_URL:
+        print("⚠️ BOT_MODE=webhook pero falta WEBHOOK_URL; usando polling.")
+        return False
+    try:
+        bot.remove_webhook()
+        bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                        max_connections=WEBHOOK_MAX_CONNECTIONS)
+        print(f"🪝 Webhook activo en {WEBHOOK_URL + WEBHOOK_PATH}. OCR disponible =", ocr.available())
+        return True
+    except Exception as e:
+        print("⚠️ No se pudo registrar el webhook:", e)
+        traceback.print_exc()
+        return False
+
 # ---------------- Polling con reconexión ----------------
 def start_polling_with_retries():
-    print("🤖 InversionesCT iniciado. TESSERACT_AVAILABLE =", TESSERACT_AVAILABLE)
+    """
+    threads: arranca el hilo de polling (polling.Poller) y vuelve. asyncio:
+    bloquea relanzando el polling del loop cada vez que termina.
+    """
+    print(f"🤖 InversionesCT iniciado ({BOT_ENGINE}). OCR disponible =", ocr.available())
+    try:
+        bot.remove_webhook()  # getUpdates no funciona con un webhook registrado
+    except Exception:
+        pass
+    if aio is None:
+        # sin getUpdates en POLL_STALL_S: se abandona el hilo (aunque siga colgado) y otro
+        # vuelve a pedir desde el último offset con sesión nueva
+        supervisor.register("polling", POLL_STALL_S, restart=poller.restart, thread=poller.thread,
+                            info=lambda: {"last_update_lag_s": last_update["lag"]})
+        poller.start()
+        return
+    # asyncio: stop_polling() cancela la tarea de polling (también un getUpdates colgado) y
+    # este bucle la relanza
+    supervisor.register("polling", POLL_STALL_S, restart=aio.stop_polling,
+                        info=lambda: {"last_update_lag_s": last_update["lag"]})
     fails = 0
-    last_ok = time.time()
     while True:
         try:
-            bot.infinity_polling(timeout=20, long_polling_timeout=60)
+            # el polling corre en el loop; este hilo solo espera a que termine
+            aio.run_polling(abot, timeout=60, request_timeout=90)
             fails = 0
-            last_ok = time.time()
+            time.sleep(1)
         except Exception as e:
             fails += 1
-            print("⚠️ Polling error:", e)
             traceback.print_exc()
-            if fails >= 3:
-                try:
-                    safe_send(ADMIN_ID, f"⚠️ El bot ha fallado {fails} veces seguidas. Revisar conexión.")
-                except Exception:
-                    pass
+            _polling_error(e, fails)
             time.sleep(15)
 
-# ---------------- Autoping automático ----------------
-def self_ping(interval=300):
-    """
-    Envía solicitudes periódicas al propio servidor Flask para evitar suspensión.
-    Compatible con Replit y Pydroid.
-    """
-    import requests
-    import socket
-
-    repl_slug = os.environ.get("REPL_SLUG")
-    repl_owner = os.environ.get("REPL_OWNER")
-
-    if repl_slug and repl_owner:
-        url = f"https://{repl_slug}.{repl_owner}.repl.co/"
-    else:
-        local_ip = socket.gethostbyname(socket.gethostname())
-        url = f"http://{local_ip}:8080/"
-
-    print(f"🌐 Autoping activo hacia: {url}")
-
-    time.sleep(10)  # esperar que Flask levante
-
-    while True:
-        try:
-            r = requests.get(url, timeout=10)
-            if r.status_code == 200:
-                print(f"✅ Autoping OK: {r.status_code}")
-            else:
-                print(f"⚠️ Autoping código {r.status_code}")
-        except Exception as e:
-            print(f"⚠️ Error en autoping: {e}")
-        time.sleep(interval)
-
-# ---------------- Watchdog (reinicio por inactividad) ----------------
-def watchdog(interval=300, timeout_limit=600):
-    """
-    Revisa periódicamente si el bot sigue respondiendo.
-    Si detecta inactividad prolongada, reinicia el proceso.
-    """
-    import sys
-    last_check = time.time()
-    while True:
-        now = time.time()
-        if now - last_check > timeout_limit:
-            try:
-                safe_send(ADMIN_ID, "⚠️ Watchdog: reiniciando bot por inactividad prolongada.")
-            except:
-                pass
-            os.execv(sys.executable, ['python'] + sys.argv)
-        time.sleep(interval)
-        last_check = now
-
 # ---------------- MAIN ----------------
 if __name__ == "__main__":
+    t0 = time.perf_counter()
+    create_application()
+    print(f"⏱️ Arranque: {(time.perf_counter() - t0) * 1000:.0f} ms")
     keep_alive()
-    threading.Thread(target=self_ping, daemon=True).start()
-    threading.Thread(target=watchdog, daemon=True).start()
     try:
         bot.send_message(ADMIN_ID, "🤖 Bot InversionesCT iniciado (modo estable 24/7).")
     except:
         pass
 
-    # Bucle de polling con autoreinicio
-    start_polling_with_retries()
+    # Webhook (si está configurado) o bucle de polling con autoreinicio
+    if not (BOT_MODE == "webhook" and start_webhook()):
+        start_polling_with_retries()
 
     # Bucle infinito de seguridad
     while True:
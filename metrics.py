@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# metrics.py
+# Métricas en formato de texto de Prometheus para la ruta /metrics:
+# - Contadores e histogramas con etiquetas, sin dependencias externas
+# - Métricas "por función" que se leen al hacer scrape (colas del OCR y del
+#   outbox, conexiones abiertas...): no cuestan nada entre scrapes
+# - instrument_handlers() envuelve los handlers ya registrados en el bot,
+#   instrument_router() las rutas de router.Router e instrument_methods()
+#   métodos de un objeto (llamadas a la API)
+#
+# observe() es un bisect + un lock sin contención: pensado para dejarlo
+# activo en producción (ver benchmarks/bench_metrics.py).
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+# segundos; cubre desde una consulta SQLite hasta un OCR lento
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _fmt_labels(names, values, extra=""):
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt_num(v):
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+# ---------------- contadores ----------------
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, *labelvalues, n=1):
+        self.labels(*labelvalues).inc(n)
+
+    def render(self):
+        out = self.header()
+        for values, c in list(self._children.items()):
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, values)} {_fmt_num(c.value)}")
+        return out
+
+
+# ---------------- histogramas ----------------
+class _HistChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, v):
+        i = bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistChild(self.bounds)
+
+    def observe(self, v, *labelvalues):
+        self.labels(*labelvalues).observe(v)
+
+    def time(self, *labelvalues):
+        """Context manager que observa la duración del bloque."""
+        return _Timer(self.labels(*labelvalues))
+
+    def render(self):
+        out = self.header()
+        for values, child in list(self._children.items()):
+            counts, total, n = child.snapshot()
+            acc = 0
+            for bound, c in zip(self.bounds + (float("inf"),), counts):
+                acc += c
+                le = 'le="%s"' % _fmt_num(bound)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, values, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, values)} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, values)} {n}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("child", "t0")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.t0)
+        return False
+
+
+# ---------------- métricas leídas al hacer scrape ----------------
+class FuncMetric(_Metric):
+    """
+    fn() devuelve un número, o una lista de (valores_de_etiquetas, número) si
+    la métrica tiene etiquetas. kind: "gauge" o "counter".
+    """
+
+    def __init__(self, name, help, fn, kind="gauge", labels=()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self.kind = kind
+
+    def render(self):
+        try:
+            v = self.fn()
+        except Exception:
+            return []   # una fuente caída no tumba el scrape completo
+        out = self.header()
+        if self.labelnames:
+            for values, x in v:
+                out.append(f"{self.name}{_fmt_labels(self.labelnames, values)} {_fmt_num(x)}")
+        else:
+            out.append(f"{self.name} {_fmt_num(v)}")
+        return out
+
+
+# ---------------- registro ----------------
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def func(self, name, help, fn, kind="gauge", labels=()):
+        return self.register(FuncMetric(name, help, fn, kind, labels))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---------------- instrumentación ----------------
+def _wrap(fn, child, err_child):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            err_child.inc()
+            raise
+        finally:
+            child.observe(time.perf_counter() - t0)
+    wrapper.__wrapped_metrics__ = True
+    return wrapper
+
+def instrument_handlers(bot, latency, errors):
+    """
+    Envuelve las funciones de los handlers ya registrados (message y
+    callback_query). latency/errors llevan etiquetas (kind, handler).
+    Llamar una vez, después de registrar todos los handlers.
+    """
+    n = 0
+    for kind, handlers in (("message", bot.message_handlers), ("callback", bot.callback_query_handlers)):
+        for h in handlers:
+            fn = h["function"]
+            if getattr(fn, "__wrapped_metrics__", False):
+                continue
+            name = getattr(fn, "__name__", "handler")
+            h["function"] = _wrap(fn, latency.labels(kind, name), errors.labels(kind, name))
+            n += 1
+    return n
+
+def instrument_router(router, latency, errors):
+    """Como instrument_handlers, para las rutas de router.Router (etiqueta kind = tabla)."""
+    n = 0
+    for kind, table in router.tables():
+        for route in table.values():
+            if getattr(route.fn, "__wrapped_metrics__", False):
+                continue
+            name = getattr(route.fn, "__name__", "handler")
+            route.fn = _wrap(route.fn, latency.labels(kind, name), errors.labels(kind, name))
+            n += 1
+    if router.fallback and not getattr(router.fallback, "__wrapped_metrics__", False):
+        name = router.fallback.__name__
+        router.fallback = _wrap(router.fallback, latency.labels("message", name), errors.labels("message", name))
+        n += 1
+    return n
+
+def instrument_methods(obj, names, latency, errors):
+    """Reemplaza obj.<name> por una versión medida; etiqueta (method,)."""
+    for name in names:
+        fn = getattr(obj, name, None)
+        if fn is None or getattr(fn, "__wrapped_metrics__", False):
+            continue
+        setattr(obj, name, _wrap(fn, latency.labels(name), errors.labels(name)))
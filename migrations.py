@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# migrations.py
+# Migraciones versionadas del esquema de InversionesCT.
+# La versión aplicada se guarda en PRAGMA user_version. Cada migración corre en
+# su propia transacción junto con el cambio de versión, así una base existente
+# (creada por el antiguo init_db) se pone al día sin perder datos.
+#
+# Para cambiar el esquema: añadir una tupla al final de MIGRATIONS con la
+# siguiente versión. Nunca editar migraciones ya publicadas.
+
+import traceback
+
+import stats
+
+
+def _columns(cur, table):
+    return [r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def _add_column(cur, table, column, decl):
+    if column not in _columns(cur, table):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# ---------------- Migraciones ----------------
+def m001_base(cur):
+    # esquema original de init_db(); IF NOT EXISTS para bases ya creadas
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS usuarios (
+        user_id INTEGER PRIMARY KEY,
+        nombre TEXT,
+        telefono TEXT,
+        nequi TEXT,
+        cedula TEXT,
+        referido_por INTEGER,
+        referidos INTEGER DEFAULT 0,
+        total_invertido INTEGER DEFAULT 0,
+        ganancia_total INTEGER DEFAULT 0
+    );
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS inversiones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        monto INTEGER,
+        fecha_inversion TEXT,
+        fecha_pago TEXT,
+        estado TEXT,
+        comprobante_path TEXT,
+        ocr_text TEXT
+    );
+    ''')
+
+def m002_ocr_ok(cur):
+    _add_column(cur, "inversiones", "ocr_ok", "INTEGER")
+
+def m003_indices_elegibilidad(cur):
+    # can_user_invest: COUNT/MAX/MIN por usuario, EXISTS por estado, referidos por usuario
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_user_fecha ON inversiones(user_id, fecha_inversion)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_user_estado ON inversiones(user_id, estado)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_referido ON usuarios(referido_por)")
+
+
+def m004_file_id_comprobante(cur):
+    # file_id de Telegram del comprobante: reenviarlo no requiere volver a subirlo
+    _add_column(cur, "inversiones", "comprobante_file_id", "TEXT")
+    _add_column(cur, "inversiones", "comprobante_tipo", "TEXT")   # 'photo' | 'document'
+    # revisión paginada de pendientes: WHERE estado=? AND id > ? ORDER BY id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_estado_id ON inversiones(estado, id)")
+
+def m005_stats(cur):
+    # contadores del panel admin (stats.py); se inicializan desde las tablas base
+    cur.execute("CREATE TABLE IF NOT EXISTS stats_totales (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL DEFAULT 0)")
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS stats_diarias (
+        fecha TEXT NOT NULL,
+        clave TEXT NOT NULL,
+        valor INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (fecha, clave)
+    ) WITHOUT ROWID;
+    ''')
+    stats.rebuild(cur=cur)
+
+def m006_conversaciones(cur):
+    # estado de conversaciones (conversations.py); expira = epoch en segundos
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS conversaciones (
+        chat_id INTEGER PRIMARY KEY,
+        estado TEXT NOT NULL,
+        datos TEXT,
+        expira REAL
+    );
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conv_expira ON conversaciones(expira)")
+
+def m007_ocr_cache(cur):
+    # storage.py: comprobantes por sha256 y caché de OCR con bandas de dHash
+    _add_column(cur, "inversiones", "comprobante_sha", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_sha ON inversiones(comprobante_sha)")
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS ocr_cache (
+        sha256 TEXT PRIMARY KEY,
+        phash INTEGER,
+        b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER,
+        ocr_text TEXT
+    );
+    ''')
+    for i in range(4):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_ocr_cache_b{i} ON ocr_cache(b{i})")
+
+def m008_indice_fecha(cur):
+    # history.py: filtro por rango de fecha_inversion en el historial y /exportar
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inv_fecha ON inversiones(fecha_inversion)")
+
+
+MIGRATIONS = [
+    (1, "esquema base", m001_base),
+    (2, "inversiones.ocr_ok", m002_ocr_ok),
+    (3, "índices de elegibilidad", m003_indices_elegibilidad),
+    (4, "file_id de comprobantes + índice de pendientes", m004_file_id_comprobante),
+    (5, "tablas de estadísticas", m005_stats),
+    (6, "estado de conversaciones", m006_conversaciones),
+    (7, "caché de OCR + sha de comprobantes", m007_ocr_cache),
+    (8, "índice por fecha de inversión", m008_indice_fecha),
+]
+
+
+# ---------------- Runner ----------------
+def current_version(db):
+    return db.scalar("PRAGMA user_version", default=0)
+
+def migrate(db, migrations=None, verbose=True):
+    """
+    Aplica en orden las migraciones con versión > user_version.
+    Devuelve la versión final.
+    """
+    migrations = sorted(migrations or MIGRATIONS, key=lambda m: m[0])
+    version = current_version(db)
+    for num, desc, fn in migrations:
+        if num <= version:
+            continue
+        try:
+            with db.transaction() as cur:
+                fn(cur)
+                cur.execute(f"PRAGMA user_version={int(num)}")
+        except Exception:
+            traceback.print_exc()
+            raise RuntimeError(f"Migración {num} ({desc}) falló; base en versión {version}")
+        version = num
+        if verbose:
+            print(f"🗄️ Migración {num} aplicada: {desc}")
+    return version
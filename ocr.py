@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# ocr.py
+# Verificación OCR de comprobantes fuera del hilo de updates del bot:
+# - Cola acotada de trabajos (backpressure: si está llena, submit() devuelve False)
+# - Pool de procesos con tope de procesos tesseract por núcleo
+# - Hilo de resultados que entrega (job, texto, error) al callback del bot
+# - Preprocesado Pillow opcional antes de tesseract (reescalado, binarizado,
+#   recorte al área con texto, OCR solo de regiones de interés)
+# - Pillow/pytesseract se importan la primera vez que se usan (available(),
+#   run_ocr): importar este módulo no cuesta nada al arrancar el bot
+# - restart(): pool de procesos nuevo si uno se cuelga o se rompe (lo llama el
+#   supervisor, ver supervisor.py); heartbeat() en cada avance
+# - Workers con forkserver (spawn donde no hay): un fork del proceso del bot
+#   heredaría locks tomados por sus hilos (writer, outbox, Flask) y las
+#   conexiones SQLite abiertas. Cada worker avisa su PID al arrancar y abre su
+#   propio grupo de procesos: restart() termina worker + tesseract sin tocar
+#   los internos de ProcessPoolExecutor
+# - fn: función del worker (run_ocr por defecto; receipt.parse_file para la
+#   lectura por campos). Si devuelve un dict, va a job["receipt"] y su "text"
+#   es el texto que recibe on_result
+
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# OCR libs (import diferido, ver _load)
+Image = ImageOps = pytesseract = None
+_available = None
+
+def _load():
+    global Image, ImageOps, pytesseract, _available
+    if _available is None:
+        try:
+            from PIL import Image, ImageOps
+            import pytesseract
+            _available = True
+        except Exception:
+            _available = False
+    return _available
+
+def available():
+    """True si Pillow y pytesseract se pueden importar (se importan aquí la primera vez)."""
+    return _load()
+
+
+# ---------------- Preprocesado ----------------
+# Opciones por defecto; main.py las sobreescribe desde variables de entorno.
+# regions: lista de cajas relativas (x0, y0, x1, y1) en 0..1 sobre la imagen ya
+# recortada; si está vacía se hace OCR de la imagen completa.
+DEFAULT_PREPROCESS = {
+    "enabled": True,
+    "target_width": 1000,   # px; capturas de Nequi quedan ~300 dpi efectivos
+    "binarize": True,
+    "threshold": 160,
+    "autocrop": True,
+    "crop_margin": 12,
+    "regions": [],
+}
+
+def parse_regions(s):
+    """
+    "x0,y0,x1,y1;x0,y0,x1,y1" -> [(x0, y0, x1, y1), ...] con valores 0..1
+    """
+    regions = []
+    for part in (s or "").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        box = tuple(float(v) for v in part.split(","))
+        if len(box) != 4:
+            raise ValueError(f"Región inválida: {part}")
+        regions.append(box)
+    return regions
+
+def preprocess_image(img, opts=None):
+    """
+    Devuelve una lista de imágenes listas para tesseract (una por región, o la
+    imagen completa si no hay regiones).
+    """
+    o = dict(DEFAULT_PREPROCESS, **(opts or {}))
+    if not o["enabled"]:
+        return [img]
+    img = ImageOps.exif_transpose(img)
+    # reescalar antes de todo lo demás: el resto trabaja sobre menos píxeles
+    tw = o["target_width"]
+    if tw and img.width > tw:
+        h = max(1, int(img.height * tw / img.width))
+        img = img.resize((tw, h), Image.BILINEAR)
+    img = ImageOps.autocontrast(ImageOps.grayscale(img))
+    if o["binarize"]:
+        th = o["threshold"]
+        img = img.point(lambda p: 255 if p > th else 0, mode="1").convert("L")
+    if o["autocrop"]:
+        # bbox del contenido oscuro (texto) sobre fondo claro
+        bbox = ImageOps.invert(img).getbbox()
+        if bbox:
+            m = o["crop_margin"]
+            x0, y0, x1, y1 = bbox
+            img = img.crop((max(0, x0 - m), max(0, y0 - m), min(img.width, x1 + m), min(img.height, y1 + m)))
+    if not o["regions"]:
+        return [img]
+    w, h = img.size
+    return [img.crop((int(x0 * w), int(y0 * h), int(x1 * w), int(y1 * h))) for x0, y0, x1, y1 in o["regions"]]
+
+
+# ---------------- Trabajo OCR (corre en el proceso worker) ----------------
+def _init_worker(pids=None):
+    # tesseract usa OpenMP; un hilo por proceso para que el tope por núcleo se respete
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    if hasattr(os, "setsid"):
+        os.setsid()   # grupo propio: restart() termina también el tesseract hijo
+    if pids is not None:
+        pids.put(os.getpid())
+    _load()   # cada worker importa PIL/pytesseract al arrancar, no en el primer trabajo
+
+def run_ocr(path, lang="spa", preprocess=None):
+    if not _load():
+        raise RuntimeError("Pillow/pytesseract no disponibles")
+    img = Image.open(path)
+    if preprocess is None or not preprocess.get("enabled", True):
+        return pytesseract.image_to_string(img, lang=lang)
+    parts = preprocess_image(img, preprocess)
+    # --dpi evita que tesseract estime la resolución en cada imagen
+    return "\n".join(pytesseract.image_to_string(p, lang=lang, config="--dpi 300") for p in parts)
+
+def _terminate(pid):
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(pid, signal.SIGTERM)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass   # ya había terminado
+
+
+# ---------------- Pipeline ----------------
+class OcrPipeline:
+    """
+    job: dict con al menos "path"; el resto de claves se devuelven tal cual a
+    on_result(job, ocr_text, error). El pipeline añade "wait_s" (tiempo en
+    cola) y "ocr_s" (tiempo en el worker) para las métricas.
+    """
+
+    def __init__(self, on_result, workers=None, procs_per_core=1, max_queue=100, lang="spa", preprocess=None,
+                 precheck=None, heartbeat=None, fn=None):
+        cores = os.cpu_count() or 1
+        cap = max(1, int(cores * procs_per_core))
+        self.workers = max(1, min(int(workers), cap)) if workers else cap
+        self.max_queue = max_queue
+        self.lang = lang
+        self.preprocess = preprocess
+        self.fn = fn or run_ocr   # fn(path, lang, preprocess), de nivel de módulo (va al worker)
+        # precheck(job) -> texto o None; corre en el hilo de despacho antes de
+        # usar un worker (p. ej. caché de OCR). Si devuelve texto no se llama a tesseract.
+        self.precheck = precheck
+        self.on_result = on_result
+        # heartbeat(): se llama al tomar y al terminar cada trabajo (supervisor)
+        self.heartbeat = heartbeat
+        self._jobs = queue.Queue(maxsize=max_queue)
+        self._results = queue.Queue()
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._executor = None
+        self._ctx = None
+        self._pids = None      # cola donde avisan su PID los workers del pool actual
+        self._broken = False
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = {}     # id(job) -> job dentro del pool
+        self.restarts = 0
+        self.done = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cached = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._executor, self._pids = self._new_executor()
+        threading.Thread(target=self._dispatch_loop, name="ocr-dispatch", daemon=True).start()
+        threading.Thread(target=self._results_loop, name="ocr-results", daemon=True).start()
+
+    def _new_executor(self):
+        pids = self._ctx.SimpleQueue()
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._ctx, initializer=_init_worker,
+                                   initargs=(pids,)), pids
+
+    def restart(self):
+        """
+        Reemplaza el pool de procesos. Los trabajos que estaban dentro terminan
+        con error (el comprobante queda para revisión manual); los de la cola siguen.
+        """
+        if self._executor is None:
+            return
+        old, old_pids = self._executor, self._pids
+        self._executor, self._pids = self._new_executor()
+        self._broken = False
+        with self._lock:
+            self.restarts += 1
+            running = list(self._running.values())
+        # primero se dan por terminados: así el BrokenProcessPool del pool viejo no marca roto al nuevo
+        for job in running:
+            self._finish(job, None, RuntimeError("OCR reiniciado"))
+        # un tesseract colgado no sale con shutdown(): terminar los workers (y su grupo) a mano
+        while not old_pids.empty():
+            _terminate(old_pids.get())
+        old_pids.close()
+        try:
+            old.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            traceback.print_exc()
+
+    def submit(self, job):
+        job["_t_queued"] = time.perf_counter()
+        try:
+            self._jobs.put_nowait(job)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+    def depth(self):
+        return self._jobs.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._jobs.qsize(),
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "done": self.done,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "cached": self.cached,
+                "restarts": self.restarts,
+            }
+
+    # ---------------- hilos internos ----------------
+    def _dispatch_loop(self):
+        while True:
+            job = self._jobs.get()
+            if self.heartbeat is not None:
+                self.heartbeat()
+            job["wait_s"] = time.perf_counter() - job.pop("_t_queued", time.perf_counter())
+            if self.precheck is not None:
+                try:
+                    cached = self.precheck(job)
+                except Exception:
+                    traceback.print_exc()
+                    cached = None
+                if cached is not None:
+                    with self._lock:
+                        self.cached += 1
+                    self._results.put((job, cached, None))
+                    continue
+            self._slots.acquire()  # como mucho `workers` trabajos dentro del pool
+            if self._broken:
+                # un worker murió (OOM, señal): el pool ya no acepta trabajos
+                self.restart()
+            with self._lock:
+                self._in_flight += 1
+                self._running[id(job)] = job
+            job["_t_run"] = time.perf_counter()
+            try:
+                fut = self._executor.submit(self.fn, job["path"], self.lang, self.preprocess)
+            except Exception as e:
+                self._broken = isinstance(e, BrokenProcessPool)
+                self._finish(job, None, e)
+                continue
+            fut.add_done_callback(lambda f, job=job: self._on_future(job, f))
+
+    def _on_future(self, job, fut):
+        try:
+            err = fut.exception()
+        except Exception as e:    # cancelado en restart()
+            err = e
+        with self._lock:
+            current = id(job) in self._running   # no, si restart() ya lo dio por terminado
+        if isinstance(err, BrokenProcessPool) and current:
+            self._broken = True
+        res = None if err else fut.result()
+        if isinstance(res, dict):
+            job["receipt"] = res
+            res = res.get("text", "")
+        self._finish(job, res, err)
+
+    def _finish(self, job, text, err):
+        with self._lock:
+            # restart() y el future pueden terminar el mismo trabajo: solo cuenta el primero
+            if self._running.pop(id(job), None) is None:
+                return
+            self._in_flight -= 1
+            if err:
+                self.failed += 1
+            else:
+                self.done += 1
+        job["ocr_s"] = time.perf_counter() - job.pop("_t_run", time.perf_counter())
+        self._slots.release()
+        if self.heartbeat is not None:
+            self.heartbeat()
+        self._results.put((job, text, err))
+
+    def _results_loop(self):
+        while True:
+            job, text, err = self._results.get()
+            try:
+                self.on_result(job, text or "", err)
+            except Exception:
+                traceback.print_exc()
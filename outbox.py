@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# outbox.py
+# Cola de envío saliente para el bot:
+# - Los handlers encolan y vuelven de inmediato
+# - Token bucket global (30 msg/s) y por chat (1 msg/s, 20/min en grupos)
+# - Respeta retry_after de los 429 y reintenta con backoff exponencial
+# - Une mensajes de texto consecutivos al mismo chat en uno solo
+# - Orden por chat garantizado: un chat nunca se envía desde dos hilos a la vez
+# - Métricas de entrega (stats())
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections import deque
+
+MAX_TEXT = 4096          # límite de Telegram por mensaje
+COALESCE_SEP = "\n\n"
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)          # tokens por segundo
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.ts = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def wait_time(self, now=None):
+        """Segundos hasta que haya un token (0 si ya hay)."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Msg:
+    __slots__ = ("method", "chat_id", "args", "kwargs", "on_sent", "ts", "attempts")
+
+    def __init__(self, method, chat_id, args, kwargs, on_sent=None):
+        self.method = method
+        self.chat_id = chat_id
+        self.args = args
+        self.kwargs = kwargs
+        self.on_sent = on_sent
+        self.ts = time.monotonic()
+        self.attempts = 0
+
+    def coalescable(self):
+        # solo texto plano sin teclado ni formato: unir no cambia cómo se ve
+        return self.method == "send_message" and not self.kwargs and self.on_sent is None
+
+
+def _error_code(e):
+    return getattr(e, "error_code", None)
+
+def _retry_after(e):
+    rj = getattr(e, "result_json", None) or {}
+    try:
+        return float((rj.get("parameters") or {}).get("retry_after") or 0)
+    except Exception:
+        return 0.0
+
+
+class Outbox:
+    def __init__(self, bot, workers=4, global_rate=30, chat_rate=1.0, chat_burst=3,
+                 group_rate_per_min=20, max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_min / 60.0
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._global = TokenBucket(global_rate, global_rate)
+        self._global_pause_until = 0.0
+        self._cv = threading.Condition()
+        self._pending = {}       # chat_id -> deque[_Msg]
+        self._buckets = {}       # chat_id -> TokenBucket
+        self._ready = []         # heap (no_antes_de, seq, chat_id)
+        self._scheduled = set()  # chats en el heap o en vuelo
+        self._seq = itertools.count()
+        self._started = False
+        self.metrics = {
+            "enqueued": 0, "sent": 0, "api_calls": 0, "failed": 0, "retried": 0,
+            "coalesced": 0, "rate_limited": 0, "fallback_plain": 0,
+            "latency_sum": 0.0, "latency_max": 0.0,
+        }
+
+    # ---------------- API ----------------
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"outbox-{i}", daemon=True).start()
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.enqueue("send_message", chat_id, text, **kwargs)
+
+    def enqueue(self, method, chat_id, *args, on_sent=None, **kwargs):
+        """
+        Encola bot.<method>(chat_id, *args, **kwargs). on_sent(resultado) se
+        llama desde el worker cuando Telegram confirma el envío.
+        """
+        msg = _Msg(method, chat_id, args, kwargs, on_sent)
+        with self._cv:
+            self._pending.setdefault(chat_id, deque()).append(msg)
+            self.metrics["enqueued"] += 1
+            if chat_id not in self._scheduled:
+                self._schedule(chat_id, time.monotonic())
+            self._cv.notify()
+
+    def depth(self):
+        with self._cv:
+            return sum(len(q) for q in self._pending.values())
+
+    def stats(self):
+        with self._cv:
+            m = dict(self.metrics)
+            m["queued"] = sum(len(q) for q in self._pending.values())
+            m["chats"] = len(self._pending)
+        m["latency_avg"] = m["latency_sum"] / m["sent"] if m["sent"] else 0.0
+        return m
+
+    def flush(self, timeout=30):
+        """Espera a que la cola se vacíe (pruebas/benchmarks). True si se vació."""
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            with self._cv:
+                if not self._scheduled:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    # ---------------- planificación ----------------
+    def _bucket(self, chat_id):
+        b = self._buckets.get(chat_id)
+        if b is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                b = TokenBucket(self.group_rate, 1)
+            else:
+                b = TokenBucket(self.chat_rate, self.chat_burst)
+            self._buckets[chat_id] = b
+        return b
+
+    def _schedule(self, chat_id, not_before):
+        # llamado con self._cv tomado
+        not_before = max(not_before, time.monotonic() + self._bucket(chat_id).wait_time())
+        heapq.heappush(self._ready, (not_before, next(self._seq), chat_id))
+        self._scheduled.add(chat_id)
+
+    def _next_batch(self):
+        """Bloquea hasta tener un chat listo; devuelve (chat_id, [msgs])."""
+        with self._cv:
+            while True:
+                now = time.monotonic()
+                if not self._ready:
+                    self._cv.wait()
+                    continue
+                not_before = self._ready[0][0]
+                wait = max(not_before - now, self._global_pause_until - now, self._global.wait_time(now))
+                if wait > 0:
+                    self._cv.wait(wait)
+                    continue
+                _, _, chat_id = heapq.heappop(self._ready)
+                q = self._pending.get(chat_id)
+                if not q:
+                    self._scheduled.discard(chat_id)
+                    continue
+                self._global.take(now)
+                self._bucket(chat_id).take(now)
+                batch = [q.popleft()]
+                if batch[0].coalescable():
+                    size = len(batch[0].args[0])
+                    while q and q[0].coalescable() and size + len(COALESCE_SEP) + len(q[0].args[0]) <= MAX_TEXT:
+                        size += len(COALESCE_SEP) + len(q[0].args[0])
+                        batch.append(q.popleft())
+                    self.metrics["coalesced"] += len(batch) - 1
+                return chat_id, batch
+
+    def _done(self, chat_id, requeue=None, not_before=0.0):
+        with self._cv:
+            q = self._pending.get(chat_id)
+            if requeue:
+                if q is None:
+                    q = self._pending[chat_id] = deque()
+                q.extendleft(reversed(requeue))
+            if q:
+                self._schedule(chat_id, not_before)
+            else:
+                self._pending.pop(chat_id, None)
+                self._scheduled.discard(chat_id)
+                b = self._buckets.get(chat_id)
+                if b is not None and b.full():
+                    del self._buckets[chat_id]
+            self._cv.notify()
+
+    # ---------------- envío ----------------
+    def _worker(self):
+        while True:
+            chat_id, batch = self._next_batch()
+            try:
+                self._deliver(chat_id, batch)
+            except Exception:
+                traceback.print_exc()
+                self._done(chat_id)
+
+    def _call(self, msg, text=None, kwargs=None):
+        args = msg.args if text is None else (text,) + tuple(msg.args[1:])
+        return getattr(self.bot, msg.method)(msg.chat_id, *args, **(msg.kwargs if kwargs is None else kwargs))
+
+    def _deliver(self, chat_id, batch):
+        first = batch[0]
+        text = COALESCE_SEP.join(m.args[0] for m in batch) if len(batch) > 1 else None
+        try:
+            result = self._call(first, text)
+        except Exception as e:
+            code = _error_code(e)
+            if code == 429:
+                ra = _retry_after(e) or 1.0
+                with self._cv:
+                    self.metrics["rate_limited"] += 1
+                    # el 429 puede ser global: pausar todo el envío
+                    self._global_pause_until = max(self._global_pause_until, time.monotonic() + ra)
+                return self._done(chat_id, requeue=batch, not_before=time.monotonic() + ra)
+            if code == 400 and first.kwargs and first.method == "send_message":
+                # como el safe_send original: reintentar una vez sin formato/teclado
+                try:
+                    self._call(first, text, kwargs={})
+                    with self._cv:
+                        self.metrics["fallback_plain"] += 1
+                    return self._sent(chat_id, batch)
+                except Exception:
+                    pass
+            if code in (400, 401, 403, 404):
+                # errores definitivos (chat bloqueado, no existe...): descartar
+                return self._failed(chat_id, batch)
+            first.attempts += 1
+            if first.attempts > self.max_retries:
+                return self._failed(chat_id, batch)
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (first.attempts - 1)))
+            with self._cv:
+                self.metrics["retried"] += 1
+            return self._done(chat_id, requeue=batch, not_before=time.monotonic() + delay)
+        if first.on_sent is not None:
+            try:
+                first.on_sent(result)
+            except Exception:
+                traceback.print_exc()
+        self._sent(chat_id, batch)
+
+    def _sent(self, chat_id, batch):
+        now = time.monotonic()
+        with self._cv:
+            self.metrics["api_calls"] += 1
+            self.metrics["sent"] += len(batch)
+            for m in batch:
+                lat = now - m.ts
+                self.metrics["latency_sum"] += lat
+                self.metrics["latency_max"] = max(self.metrics["latency_max"], lat)
+        self._done(chat_id)
+
+    def _failed(self, chat_id, batch):
+        with self._cv:
+            self.metrics["failed"] += len(batch)
+        self._done(chat_id)
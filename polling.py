@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# polling.py
+# Polling y workers de handlers propios para BOT_ENGINE=threads, en lugar de
+# infinity_polling y el ThreadPool interno de TeleBot, para que el supervisor
+# pueda reiniciarlos de verdad sin tocar las tripas de un poller en marcha:
+# - Poller: un hilo hace getUpdates y entrega los updates a dispatch().
+#   restart() abandona ese hilo (aunque esté colgado en getUpdates) y arranca
+#   otro; telebot usa una sesión HTTP por hilo, así que el nuevo empieza con
+#   sesión y timeouts limpios. El offset es compartido: el nuevo pide desde el
+#   último update entregado y lo que el viejo reciba tarde se descarta
+# - WorkerPool: N hilos sobre una cola. restart() arranca N hilos nuevos sobre
+#   la misma cola (lo pendiente no se pierde); los viejos salen al terminar lo
+#   que tienen entre manos y uno colgado se abandona
+# - El bot se crea con threaded=False: process_new_updates() corre los
+#   handlers en el hilo que lo llama (un worker del pool)
+#
+# Uso:
+#   pool = WorkerPool(4); pool.start()
+#   poller = Poller(bot, lambda ups: [pool.submit(bot.process_new_updates, [u]) for u in ups])
+#   poller.start()
+#   sup.register("polling", 150, restart=poller.restart, thread=poller.thread)
+
+import queue
+import threading
+import time
+import traceback
+
+
+class Poller:
+    def __init__(self, bot, dispatch, timeout=20, long_polling_timeout=60, on_error=None):
+        self.bot = bot
+        self.dispatch = dispatch      # dispatch(updates), en el hilo de polling: no debe bloquear
+        self.timeout = timeout
+        self.long_polling_timeout = long_polling_timeout
+        self.on_error = on_error      # on_error(excepción, fallos seguidos)
+        self.offset = None
+        self.restarts = 0
+        self._gen = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Arranca un hilo de polling nuevo; el anterior (si había) queda abandonado."""
+        with self._lock:
+            self._gen += 1
+            self._thread = threading.Thread(target=self._loop, args=(self._gen,), name=f"polling-{self._gen}",
+                                            daemon=True)
+            self._thread.start()
+
+    def restart(self):
+        with self._lock:
+            self.restarts += 1
+        self.start()
+        return True
+
+    def stop(self):
+        with self._lock:
+            self._gen += 1
+
+    def thread(self):
+        return self._thread
+
+    def _loop(self, gen):
+        fails = 0
+        while gen == self._gen:
+            try:
+                updates = self.bot.get_updates(offset=self.offset, timeout=self.timeout,
+                                               long_polling_timeout=self.long_polling_timeout)
+            except Exception as e:
+                if gen != self._gen:
+                    return
+                fails += 1
+                traceback.print_exc()
+                if self.on_error is not None:
+                    try:
+                        self.on_error(e, fails)
+                    except Exception:
+                        traceback.print_exc()
+                time.sleep(min(15, 2 ** fails))
+                continue
+            if gen != self._gen:
+                # reemplazado mientras esperaba: sin confirmar, el hilo nuevo los vuelve a pedir
+                return
+            fails = 0
+            if updates:
+                self.offset = updates[-1].update_id + 1
+                self.dispatch(updates)
+
+
+class WorkerPool:
+    def __init__(self, workers=4, name="handler"):
+        self.workers = workers
+        self.name = name
+        self.restarts = 0
+        self._tasks = queue.Queue()
+        self._gen = 0
+
+    def start(self):
+        self._gen += 1
+        for i in range(self.workers):
+            threading.Thread(target=self._run, args=(self._gen,), name=f"{self.name}-{self._gen}-{i}",
+                             daemon=True).start()
+
+    def restart(self):
+        """Hilos nuevos sobre la misma cola; los colgados se abandonan."""
+        self.restarts += 1
+        self.start()
+        return True
+
+    def submit(self, fn, *args):
+        self._tasks.put((fn, args))
+
+    def depth(self):
+        return self._tasks.qsize()
+
+    def _run(self, gen):
+        while gen == self._gen:
+            try:
+                fn, args = self._tasks.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
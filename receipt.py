@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# receipt.py
+# Lectura estructurada de comprobantes: monto, número destino, fecha y referencia.
+# - Primera pasada rápida: image_to_data sobre la imagen reducida -> palabras con
+#   caja y confianza agrupadas en líneas; se localizan las etiquetas ("¿Cuánto?",
+#   "Número Nequi", "Fecha", "Referencia") y la línea con el valor de cada una
+# - Segunda pasada solo sobre esas líneas, a resolución completa, como una sola
+#   línea (--psm 7) y con lista blanca de caracteres en los campos numéricos
+# - Con regiones en el preprocesado (OCR_REGIONS) ambas pasadas se hacen solo
+#   dentro de esas zonas, igual que run_ocr
+# - parse_text(): las mismas reglas sobre texto libre (caché de OCR, texto viejo)
+# - verify_receipt(): compara los campos con el monto y el número esperados; ya
+#   no toma "la cifra más larga" del texto (solía ser un teléfono o la referencia)
+#
+# Uso (en el worker del pipeline, ver OcrPipeline(fn=...)):
+#   r = receipt.parse_file(path, "spa", preprocess)
+#   r["fields"]      {"amount": 100000, "destination": "3001234567", "date": "2025-03-12", "reference": "M1234567"}
+#   r["confidence"]  {"amount": 93.0, ...}  (0..100 de tesseract; None si no se encontró)
+#   r["text"]        texto con los valores releídos, para guardar y cachear
+#   ok, motivo = receipt.verify_receipt(r["text"], 100000, "3001234567", fields=r["fields"])
+
+import re
+import unicodedata
+
+import ocr   # ocr._load(): Pillow/pytesseract se importan la primera vez que se usan
+
+FIELDS = ("reference", "amount", "date", "destination")   # orden de búsqueda de etiquetas
+
+# etiquetas normalizadas (sin tildes ni signos); la línea debe empezar por una de ellas
+LABELS = {
+    "reference": ("referencia", "numero de referencia", "no de referencia", "ref"),
+    "amount": ("cuanto", "valor", "monto", "total"),
+    "date": ("fecha",),
+    "destination": ("numero nequi", "numero de celular", "numero de cuenta", "celular", "cuenta destino", "destino"),
+}
+
+# segunda pasada: una línea, solo los caracteres que puede tener el valor
+WHITELIST = {
+    "amount": "0123456789.,$",
+    "destination": "0123456789",
+    "reference": "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+}
+
+FAST_WIDTH = 600          # px de la imagen de la primera pasada
+REFINE_PAD = 0.35         # margen alrededor de la línea, en alturas de línea
+
+MESES = {"ene": 1, "feb": 2, "mar": 3, "abr": 4, "may": 5, "jun": 6,
+         "jul": 7, "ago": 8, "sep": 9, "set": 9, "oct": 10, "nov": 11, "dic": 12}
+
+
+# ---------------- normalización de valores ----------------
+def _norm(s):
+    s = unicodedata.normalize("NFKD", s or "")
+    s = "".join(c for c in s if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", s).split())
+
+_O_DIGIT_RE = re.compile(r"[\dOo][\dOo.,]*")
+_AMOUNT_RE = re.compile(r"\d{1,3}(?:[.,\s]\d{3})+(?:[.,]\d{1,2})?(?!\d)|\d+(?:[.,]\d{1,2})?(?!\d)")
+
+def parse_amount(s):
+    """"$ 100.000,00" / "$100,000.00" / "100000" -> 100000; None si no hay cifra."""
+    # O/o leída en lugar de 0 solo dentro de una cifra ("1OO.OOO"); "envío", "total" no se tocan
+    m = _AMOUNT_RE.search(_O_DIGIT_RE.sub(lambda t: re.sub("[Oo]", "0", t.group())
+                                          if re.search(r"\d", t.group()) else t.group(), s or ""))
+    if not m:
+        return None
+    tok = m.group()
+    dec = re.search(r"[.,](\d{1,2})$", tok)
+    if dec:   # centavos: ",00" / ".00"
+        tok = tok[:dec.start()]
+    value = int(re.sub(r"\D", "", tok) or 0)
+    return value or None
+
+def parse_destination(s):
+    """Número de celular (10 dígitos, empieza por 3) aunque venga con espacios."""
+    digits = re.sub(r"\D", "", s or "")
+    m = re.search(r"3\d{9}", digits)
+    if m:
+        return m.group()
+    return digits if 7 <= len(digits) <= 12 else None
+
+def parse_date(s):
+    """"12 de marzo de 2025 a las ..." / "12/03/2025" -> "2025-03-12"."""
+    n = _norm(s)
+    m = re.search(r"(\d{1,2}) (?:de )?([a-z]{3,}) (?:de |del )?(\d{4})", n)
+    if m and m.group(2)[:3] in MESES:
+        d, mo, y = int(m.group(1)), MESES[m.group(2)[:3]], int(m.group(3))
+    else:
+        m = re.search(r"(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})", s or "")
+        if not m:
+            return None
+        d, mo, y = int(m.group(1)), int(m.group(2)), int(m.group(3))
+        y += 2000 if y < 100 else 0
+    if not (1 <= d <= 31 and 1 <= mo <= 12):
+        return None
+    return f"{y:04d}-{mo:02d}-{d:02d}"
+
+def parse_reference(s):
+    ref = re.sub(r"[^A-Za-z0-9]", "", s or "").upper()
+    return ref if len(ref) >= 4 and re.search(r"\d", ref) else None
+
+PARSERS = {"amount": parse_amount, "destination": parse_destination, "date": parse_date, "reference": parse_reference}
+
+
+# ---------------- localización de etiquetas ----------------
+def _label(line_text):
+    """(campo, nº de palabras de la etiqueta) si la línea empieza por una etiqueta."""
+    n = _norm(line_text)
+    for field in FIELDS:
+        for lab in LABELS[field]:
+            if n == lab or n.startswith(lab + " "):
+                return field, len(lab.split())
+    return None, 0
+
+def locate(lines):
+    """
+    lines: [[palabra, ...], ...] en orden de lectura. Devuelve
+    {campo: (índice de línea, palabras a saltar)}: el valor va en la misma línea
+    tras la etiqueta o, si ahí no hay nada, en la línea siguiente.
+    """
+    found = {}
+    for i, words in enumerate(lines):
+        field, k = _label(" ".join(words))
+        if field is None or field in found:
+            continue
+        if PARSERS[field](" ".join(words[k:])) is not None:
+            found[field] = (i, k)
+            continue
+        # valor debajo de la etiqueta: la primera de las dos siguientes que lo tenga
+        for j in range(i + 1, min(i + 3, len(lines))):
+            if _label(" ".join(lines[j]))[0] is not None:
+                break
+            if PARSERS[field](" ".join(lines[j])) is not None:
+                found[field] = (j, 0)
+                break
+        else:
+            if i + 1 < len(lines) and _label(" ".join(lines[i + 1]))[0] is None:
+                found[field] = (i + 1, 0)   # ilegible en la primera pasada: se relee
+    return found
+
+def _fallback(field, lines):
+    # sin etiqueta: "$ <cifra>" para el monto, un celular para el destino
+    if field == "amount":
+        for words in lines:
+            m = re.search(r"\$\s*([\d.,\s]+)", " ".join(words))
+            if m and parse_amount(m.group(1)):
+                return parse_amount(m.group(1))
+    elif field == "destination":
+        for words in lines:
+            m = re.search(r"3\d{9}", re.sub(r"\D", "", " ".join(words)))
+            if m:
+                return m.group()
+    return None
+
+def parse_text(text):
+    """Campos a partir de texto libre (sin cajas): mismas etiquetas y reglas."""
+    lines = [l.split() for l in (text or "").splitlines() if l.strip()]
+    found = locate(lines)
+    fields = {}
+    for field in FIELDS:
+        value = None
+        if field in found:
+            i, k = found[field]
+            value = PARSERS[field](" ".join(lines[i][k:]))
+        fields[field] = value if value is not None else _fallback(field, lines)
+    return fields
+
+
+# ---------------- OCR por regiones (corre en el proceso worker) ----------------
+def _lines(data, scale=1.0):
+    """image_to_data (dict) -> líneas [{"words": [...], "boxes": [...], "confs": [...]}] ordenadas."""
+    by_key = {}
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        line = by_key.setdefault(key, {"words": [], "boxes": [], "confs": []})
+        line["words"].append(word)
+        line["boxes"].append(tuple(int(v * scale) for v in
+                                   (data["left"][i], data["top"][i], data["width"][i], data["height"][i])))
+        line["confs"].append(conf)
+    return sorted(by_key.values(), key=lambda l: (min(b[1] for b in l["boxes"]), min(b[0] for b in l["boxes"])))
+
+def _refine(img, boxes, field, lang):
+    """Relee una línea (cajas de sus palabras) a resolución completa. Devuelve (texto, confianza)."""
+    pytesseract = ocr.pytesseract
+    x0 = min(b[0] for b in boxes); y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes); y1 = max(b[1] + b[3] for b in boxes)
+    pad = int((y1 - y0) * REFINE_PAD) + 2
+    crop = img.crop((max(0, x0 - pad), max(0, y0 - pad), min(img.width, x1 + pad), min(img.height, y1 + pad)))
+    crop = ocr.ImageOps.expand(crop, border=10, fill="white")   # tesseract lee mejor con margen
+    config = "--psm 7 --dpi 300"
+    if field in WHITELIST:
+        config += f" -c tessedit_char_whitelist={WHITELIST[field]}"
+    d = pytesseract.image_to_data(crop, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+    words = [(w.strip(), float(c)) for w, c in zip(d["text"], d["conf"]) if (w or "").strip() and float(c) >= 0]
+    if not words:
+        return "", 0.0
+    return " ".join(w for w, _ in words), min(c for _, c in words)
+
+def _first_pass(img, lang, fast_width):
+    """Pasada rápida sobre img reducida; cada línea recuerda su imagen para la relectura."""
+    Image, pytesseract = ocr.Image, ocr.pytesseract
+    small, scale = img, 1.0
+    if fast_width and img.width > fast_width:
+        scale = img.width / fast_width
+        small = img.resize((fast_width, max(1, int(img.height / scale))), Image.BILINEAR)
+    data = pytesseract.image_to_data(small, lang=lang, config=f"--dpi {max(70, int(300 / scale))}",
+                                     output_type=pytesseract.Output.DICT)
+    lines = _lines(data, scale)   # cajas ya en coordenadas de img
+    for line in lines:
+        line["img"] = img
+    return lines
+
+def parse_file(path, lang="spa", preprocess=None, fast_width=FAST_WIDTH):
+    """
+    OCR por regiones de un comprobante. Devuelve {"text", "fields", "confidence",
+    "passes"}; pensado para OcrPipeline(fn=parse_file).
+    """
+    if not ocr._load():
+        raise RuntimeError("Pillow/pytesseract no disponibles")
+    # mismo preprocesado que run_ocr: con OCR_REGIONS se leen solo esas zonas, en orden
+    parts = ocr.preprocess_image(ocr.Image.open(path), preprocess or {"enabled": False})
+    lines = [line for part in parts for line in _first_pass(part, lang, fast_width)]
+    words = [l["words"] for l in lines]
+    found = locate(words)
+
+    fields, confidence, passes = {}, {}, 1
+    for field in FIELDS:
+        value = conf = None
+        if field in found:
+            i, k = found[field]
+            line = lines[i]
+            boxes = line["boxes"][k:] or line["boxes"]
+            text, conf = _refine(line["img"], boxes, field, lang)
+            passes += 1
+            value = PARSERS[field](text)
+            if value is not None:
+                # el texto guardado lleva el valor releído: parse_text() lo recupera desde la caché
+                line["words"] = line["words"][:k] + text.split()
+            else:
+                value = PARSERS[field](" ".join(line["words"][k:]))
+                conf = min(line["confs"][k:] or line["confs"]) if value is not None else None
+        if value is None:
+            value = _fallback(field, words)
+        fields[field] = value
+        confidence[field] = conf if value is not None else None
+    return {"text": "\n".join(" ".join(l["words"]) for l in lines), "fields": fields,
+            "confidence": confidence, "passes": passes}
+
+
+# ---------------- verificación ----------------
+def _money(n):
+    return f"{int(n):,}".replace(",", ".")
+
+def verify_receipt(ocr_text, monto, nequi_destino, tolerancia=2000, fields=None):
+    """
+    Devuelve (ok, motivo). fields: campos de parse_file; sin ellos se sacan
+    del texto con parse_text().
+    """
+    f = fields if fields is not None else parse_text(ocr_text)
+    dest, amount = f.get("destination"), f.get("amount")
+    if dest is None:
+        # sin campo destino: vale si el número aparece en el texto (como antes)
+        if nequi_destino not in (ocr_text or "").replace(" ", "").replace("\n", ""):
+            return False, "No se detectó el número destino."
+    elif dest != nequi_destino:
+        return False, f"Número destino {dest} distinto de {nequi_destino}."
+    if amount is None:
+        return False, "No se detectó el monto."
+    if abs(amount - monto) > tolerancia:
+        return False, f"Monto detectado ${_money(amount)} distinto de ${_money(monto)}."
+    return True, ""
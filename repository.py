@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+# repository.py
+# Capa de acceso a datos de los handlers (usuarios, inversiones, estadísticas):
+# - Los handlers de main.py no escriben SQL: llaman a repo.profile(uid),
+#   repo.create_investment(...), repo.decide(ids, estado), ...
+# - SqliteRepository: cada consulta es una constante de este módulo (la caché de
+#   sentencias de sqlite3 la prepara una vez por conexión) y dice qué índice usa
+# - MemoryRepository: misma interfaz en diccionarios (benchmarks/pruebas): mide
+#   los handlers sin disco; load(db) copia una base ya sembrada
+# - Las escrituras que no necesitan confirmarse antes de responder van por el
+#   GroupCommitWriter si se pasa writer=
+# - CachedRepository: perfiles y elegibilidad (can_invest) en cachés TTL/LRU
+#   (cache.py), invalidadas por los métodos de escritura del propio repositorio
+#
+# Uso:
+#   repo = CachedRepository(SqliteRepository(db, writer=writer), TTLCache(10000, 300), TTLCache(10000, 300))
+#   existed = repo.start_user(uid, referido)
+#   inv_id, dup_of = repo.create_investment(uid, monto, fecha, fecha_pago, path, file_id, tipo, sha)
+
+import bisect
+import threading
+
+import history
+import review
+import stats
+
+PROFILE_COLUMNS = ("nombre", "telefono", "nequi", "cedula", "total_invertido", "ganancia_total", "referidos")
+PROFILE_FIELDS = ("nombre", "telefono", "cedula", "nequi")   # editables con repo.update_field
+REFERIDOS_INDEX = PROFILE_COLUMNS.index("referidos")
+PENDING_COLUMNS = ("id", "user_id", "monto", "fecha_inversion", "fecha_pago", "comprobante_path",
+                   "ocr_text", "comprobante_file_id", "comprobante_tipo")
+
+
+# ---------------- SQL (SqliteRepository) ----------------
+# usuarios: PRIMARY KEY user_id salvo que se indique otro índice
+START_USER_SQL = "INSERT OR IGNORE INTO usuarios (user_id, referido_por) VALUES (?, ?)"
+ADD_REFERRAL_SQL = "UPDATE usuarios SET referidos = referidos + 1 WHERE user_id=?"
+REGISTRATION_SQL = ("UPDATE usuarios SET nombre=COALESCE(?, nombre), telefono=COALESCE(?, telefono), "
+                    "cedula=COALESCE(?, cedula), nequi=? WHERE user_id=?")
+UPDATE_FIELD_SQL = {f: f"UPDATE usuarios SET {f}=? WHERE user_id=?" for f in PROFILE_FIELDS}
+PROFILE_SQL = f"SELECT {', '.join(PROFILE_COLUMNS)} FROM usuarios WHERE user_id=?"
+REFERIDOS_SQL = "SELECT referidos FROM usuarios WHERE user_id=?"
+REFERRER_SQL = "SELECT referido_por FROM usuarios WHERE user_id=?"
+
+# Una sola consulta; usa idx_inv_user_fecha, idx_inv_user_estado e idx_usuarios_referido
+CAN_INVEST_SQL = """
+WITH yo AS (
+    SELECT COUNT(*) AS n, MAX(fecha_inversion) AS ultima FROM inversiones WHERE user_id = :uid
+)
+SELECT CASE WHEN (SELECT n FROM yo) = 0 THEN 1 ELSE EXISTS (
+    SELECT 1 FROM usuarios u
+    WHERE u.referido_por = :uid
+      AND EXISTS (SELECT 1 FROM inversiones i
+                  WHERE i.user_id = u.user_id AND i.estado IN ('Pendiente','Aprobado'))
+      AND ((SELECT ultima FROM yo) IS NULL
+           OR (SELECT MIN(i2.fecha_inversion) FROM inversiones i2 WHERE i2.user_id = u.user_id)
+              > (SELECT ultima FROM yo))
+) END
+"""
+
+# inversiones
+DUPLICATE_SQL = "SELECT id FROM inversiones WHERE comprobante_sha=? ORDER BY id LIMIT 1"   # idx_inv_sha
+CREATE_INVESTMENT_SQL = (
+    "INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado, comprobante_path, ocr_text, "
+    "comprobante_file_id, comprobante_tipo, comprobante_sha) VALUES (?, ?, ?, ?, 'Pendiente', ?, '', ?, ?, ?)")
+OCR_RESULT_SQL = "UPDATE inversiones SET ocr_text=?, ocr_ok=? WHERE id=?"
+FILE_ID_SQL = "UPDATE inversiones SET comprobante_file_id=?, comprobante_tipo=? WHERE id=? AND comprobante_file_id IS NULL"
+ESTADO_SQL = "SELECT estado FROM inversiones WHERE id=?"
+# idx_inv_estado_id: paginación por clave y conteo sin recorrer la tabla
+PENDING_AFTER_SQL = (f"SELECT {', '.join(PENDING_COLUMNS)} FROM inversiones "
+                     "WHERE estado='Pendiente' AND id > ? ORDER BY id ASC LIMIT ?")
+PENDING_BEFORE_SQL = (f"SELECT {', '.join(PENDING_COLUMNS)} FROM inversiones "
+                      "WHERE estado='Pendiente' AND id < ? ORDER BY id DESC LIMIT ?")
+PENDING_COUNT_SQL = "SELECT COUNT(*) FROM inversiones WHERE estado='Pendiente'"
+
+
+class SqliteRepository:
+    """Sobre un database.ConnectionPool; writer (opcional) = GroupCommitWriter."""
+
+    def __init__(self, db, writer=None):
+        self.db = db
+        self.writer = writer
+
+    def _submit(self, sql, params, on_done=None):
+        if self.writer is None:
+            self.db.execute(sql, params)
+            if on_done is not None:
+                on_done(None)
+        else:
+            self.writer.submit(sql, params, on_done=on_done)
+
+    # ---------------- usuarios ----------------
+    def start_user(self, user_id, referido=None):
+        """Crea el usuario si no existe. Devuelve True si ya existía."""
+        with self.db.transaction() as cur:
+            cur.execute(START_USER_SQL, (user_id, referido))
+            if cur.rowcount == 1:
+                stats.on_user_created(cur)
+                return False
+        return True
+
+    def add_referral(self, user_id, on_done=None):
+        """on_done(error) tras el COMMIT (con writer llega más tarde, desde su hilo)."""
+        self._submit(ADD_REFERRAL_SQL, (user_id,), on_done)
+
+    def complete_registration(self, user_id, nombre, telefono, cedula, nequi):
+        # COALESCE: los campos que falten conservan lo ya guardado
+        self.db.execute(REGISTRATION_SQL, (nombre, telefono, cedula, nequi, user_id))
+
+    def update_field(self, user_id, field, value):
+        sql = UPDATE_FIELD_SQL.get(field)
+        if sql is None:
+            raise ValueError(f"Campo no editable: {field}")
+        self.db.execute(sql, (value, user_id))
+
+    def profile(self, user_id):
+        """Tupla con PROFILE_COLUMNS o None si no está registrado."""
+        return self.db.fetchone(PROFILE_SQL, (user_id,))
+
+    def referidos(self, user_id):
+        return self.db.scalar(REFERIDOS_SQL, (user_id,), default=0)
+
+    def referrer(self, user_id):
+        """Quién refirió a user_id (referido_por) o None."""
+        return self.db.scalar(REFERRER_SQL, (user_id,))
+
+    # ---------------- inversiones ----------------
+    def can_invest(self, user_id):
+        return bool(self.db.scalar(CAN_INVEST_SQL, {"uid": user_id}, default=0))
+
+    def create_investment(self, user_id, monto, fecha_inversion, fecha_pago, path, file_id, tipo, sha):
+        """Inversión 'Pendiente'. Devuelve (id, id de otra inversión con el mismo archivo o None)."""
+        with self.db.transaction() as cur:
+            cur.execute(DUPLICATE_SQL, (sha,))
+            dup = cur.fetchone()
+            cur.execute(CREATE_INVESTMENT_SQL, (user_id, monto, fecha_inversion, fecha_pago, path, file_id, tipo, sha))
+            inv_id = cur.lastrowid
+            stats.on_investment_created(cur, monto, fecha_inversion)
+        return inv_id, dup[0] if dup else None
+
+    def set_ocr_result(self, inv_id, ocr_text, ocr_ok):
+        self._submit(OCR_RESULT_SQL, (ocr_text, 1 if ocr_ok else 0, inv_id))
+
+    def set_file_id(self, inv_id, file_id, tipo):
+        """Solo si aún no tenía file_id (comprobantes antiguos)."""
+        self._submit(FILE_ID_SQL, (file_id, tipo, inv_id))
+
+    def estado(self, inv_id):
+        return self.db.scalar(ESTADO_SQL, (inv_id,))
+
+    def investment_by_sha(self, sha):
+        """Primera inversión con ese comprobante (sha256) o None."""
+        return self.db.scalar(DUPLICATE_SQL, (sha,))
+
+    def pending_after(self, after_id, limit):
+        """Pendientes con id > after_id, ascendente (filas con PENDING_COLUMNS)."""
+        return self.db.fetchall(PENDING_AFTER_SQL, (after_id or 0, limit))
+
+    def pending_before(self, before_id, limit):
+        """Pendientes con id < before_id, descendente."""
+        return self.db.fetchall(PENDING_BEFORE_SQL, (before_id, limit))
+
+    def pending_count(self):
+        return self.db.scalar(PENDING_COUNT_SQL, default=0)
+
+    def pending_ids(self, lo=None, hi=None, ocr_ok=None, limit=review.MAX_BATCH):
+        return review.pending_ids(self.db, lo, hi, ocr_ok, limit)
+
+    def decide(self, ids, estado):
+        """review.decide en su propia transacción. Devuelve las filas que cambiaron."""
+        with self.db.transaction() as cur:
+            return review.decide(cur, ids, estado)
+
+    def history_page(self, f, before_id=None, after_id=None, limit=20):
+        return history.page(self.db, f, before_id, after_id, limit)
+
+    # ---------------- estadísticas ----------------
+    def totals(self):
+        return stats.totals(self.db)
+
+    def day(self, fecha):
+        return stats.day(self.db, fecha)
+
+
+# ---------------- memoria ----------------
+class MemoryRepository:
+    """
+    Misma interfaz en memoria (benchmarks/pruebas). Mismas reglas y mismos
+    contadores que SqliteRepository; no sobrevive a reinicios.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}       # user_id -> dict (PROFILE_COLUMNS + referido_por)
+        self._referred = {}    # referido_por -> {user_id}
+        self._invs = {}        # id -> dict (columnas de inversiones)
+        self._by_user = {}     # user_id -> [id]
+        self._by_sha = {}      # sha -> id más bajo
+        self._pending = []     # ids 'Pendiente' ordenados
+        self._next_id = 1
+        self._totals = {}
+        self._daily = {}       # fecha -> {clave: valor}
+
+    def load(self, db):
+        """Copia usuarios, inversiones y contadores de una base SQLite. Devuelve self."""
+        with self._lock:
+            for row in db.fetchall(f"SELECT user_id, referido_por, {', '.join(PROFILE_COLUMNS)} FROM usuarios"):
+                u = dict(zip(PROFILE_COLUMNS, row[2:]))
+                u["referido_por"] = row[1]
+                self._add_user(row[0], u)
+            cols = ("id", "user_id", "monto", "fecha_inversion", "fecha_pago", "estado", "comprobante_path",
+                    "ocr_text", "ocr_ok", "comprobante_file_id", "comprobante_tipo", "comprobante_sha")
+            for row in db.fetchall(f"SELECT {', '.join(cols)} FROM inversiones ORDER BY id"):
+                self._add_investment(dict(zip(cols, row)))
+            self._totals = stats.totals(db)
+            self._daily = {}
+            for fecha, clave, valor in db.fetchall("SELECT fecha, clave, valor FROM stats_diarias"):
+                self._daily.setdefault(fecha, {})[clave] = valor
+        return self
+
+    def _add_user(self, user_id, u):
+        self._users[user_id] = u
+        if u["referido_por"] is not None:
+            self._referred.setdefault(u["referido_por"], set()).add(user_id)
+
+    def _add_investment(self, inv):
+        i = inv["id"]
+        self._invs[i] = inv
+        self._by_user.setdefault(inv["user_id"], []).append(i)
+        if inv["comprobante_sha"] and inv["comprobante_sha"] not in self._by_sha:
+            self._by_sha[inv["comprobante_sha"]] = i
+        if inv["estado"] == review.PENDIENTE:
+            bisect.insort(self._pending, i)
+        self._next_id = max(self._next_id, i + 1)
+
+    def _bump(self, clave, delta, fecha=None):
+        if not delta:
+            return
+        self._totals[clave] = self._totals.get(clave, 0) + delta
+        if fecha:
+            d = self._daily.setdefault(fecha, {})
+            d[clave] = d.get(clave, 0) + delta
+
+    # ---------------- usuarios ----------------
+    def start_user(self, user_id, referido=None):
+        with self._lock:
+            if user_id in self._users:
+                return True
+            u = dict.fromkeys(PROFILE_COLUMNS)
+            u.update(total_invertido=0, ganancia_total=0, referidos=0, referido_por=referido)
+            self._add_user(user_id, u)
+            self._bump("usuarios", 1)
+        return False
+
+    def add_referral(self, user_id, on_done=None):
+        with self._lock:
+            u = self._users.get(user_id)
+            if u is not None:
+                u["referidos"] += 1
+        if on_done is not None:
+            on_done(None)
+
+    def complete_registration(self, user_id, nombre, telefono, cedula, nequi):
+        with self._lock:
+            u = self._users.get(user_id)
+            if u is None:
+                return
+            for k, v in (("nombre", nombre), ("telefono", telefono), ("cedula", cedula)):
+                if v is not None:
+                    u[k] = v
+            u["nequi"] = nequi
+
+    def update_field(self, user_id, field, value):
+        if field not in PROFILE_FIELDS:
+            raise ValueError(f"Campo no editable: {field}")
+        with self._lock:
+            u = self._users.get(user_id)
+            if u is not None:
+                u[field] = value
+
+    def profile(self, user_id):
+        with self._lock:
+            u = self._users.get(user_id)
+            return tuple(u[k] for k in PROFILE_COLUMNS) if u is not None else None
+
+    def referidos(self, user_id):
+        with self._lock:
+            u = self._users.get(user_id)
+            return u["referidos"] if u is not None and u["referidos"] is not None else 0
+
+    def referrer(self, user_id):
+        with self._lock:
+            u = self._users.get(user_id)
+            return u["referido_por"] if u is not None else None
+
+    # ---------------- inversiones ----------------
+    def can_invest(self, user_id):
+        # mismas reglas que CAN_INVEST_SQL
+        with self._lock:
+            mine = self._by_user.get(user_id)
+            if not mine:
+                return True
+            fechas = [self._invs[i]["fecha_inversion"] for i in mine if self._invs[i]["fecha_inversion"] is not None]
+            ultima = max(fechas) if fechas else None
+            for ref in self._referred.get(user_id, ()):
+                invs = [self._invs[i] for i in self._by_user.get(ref, ())]
+                if not any(inv["estado"] in (review.PENDIENTE, review.APROBADO) for inv in invs):
+                    continue
+                if ultima is None:
+                    return True
+                primeras = [inv["fecha_inversion"] for inv in invs if inv["fecha_inversion"] is not None]
+                if primeras and min(primeras) > ultima:
+                    return True
+            return False
+
+    def create_investment(self, user_id, monto, fecha_inversion, fecha_pago, path, file_id, tipo, sha):
+        with self._lock:
+            dup = self._by_sha.get(sha)
+            inv_id = self._next_id
+            self._add_investment({
+                "id": inv_id, "user_id": user_id, "monto": monto, "fecha_inversion": fecha_inversion,
+                "fecha_pago": fecha_pago, "estado": review.PENDIENTE, "comprobante_path": path, "ocr_text": "",
+                "ocr_ok": None, "comprobante_file_id": file_id, "comprobante_tipo": tipo, "comprobante_sha": sha})
+            k = stats.ESTADOS[review.PENDIENTE]
+            self._bump(f"{k}_n", 1, fecha_inversion)
+            self._bump(f"{k}_sum", monto or 0, fecha_inversion)
+        return inv_id, dup
+
+    def set_ocr_result(self, inv_id, ocr_text, ocr_ok):
+        with self._lock:
+            inv = self._invs.get(inv_id)
+            if inv is not None:
+                inv["ocr_text"], inv["ocr_ok"] = ocr_text, 1 if ocr_ok else 0
+
+    def set_file_id(self, inv_id, file_id, tipo):
+        with self._lock:
+            inv = self._invs.get(inv_id)
+            if inv is not None and inv["comprobante_file_id"] is None:
+                inv["comprobante_file_id"], inv["comprobante_tipo"] = file_id, tipo
+
+    def estado(self, inv_id):
+        with self._lock:
+            inv = self._invs.get(inv_id)
+            return inv["estado"] if inv is not None else None
+
+    def investment_by_sha(self, sha):
+        with self._lock:
+            return self._by_sha.get(sha)
+
+    def _pending_row(self, i):
+        inv = self._invs[i]
+        return tuple(inv[k] for k in PENDING_COLUMNS)
+
+    def pending_after(self, after_id, limit):
+        with self._lock:
+            start = bisect.bisect_right(self._pending, after_id or 0)
+            return [self._pending_row(i) for i in self._pending[start:start + limit]]
+
+    def pending_before(self, before_id, limit):
+        with self._lock:
+            end = bisect.bisect_left(self._pending, before_id)
+            return [self._pending_row(i) for i in reversed(self._pending[max(0, end - limit):end])]
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def pending_ids(self, lo=None, hi=None, ocr_ok=None, limit=review.MAX_BATCH):
+        with self._lock:
+            start = bisect.bisect_left(self._pending, lo) if lo is not None else 0
+            end = bisect.bisect_right(self._pending, hi) if hi is not None else len(self._pending)
+            out = []
+            for i in self._pending[start:end]:
+                if ocr_ok is not None and self._invs[i]["ocr_ok"] != (1 if ocr_ok else 0):
+                    continue
+                out.append(i)
+                if len(out) >= limit:
+                    break
+            return out
+
+    def decide(self, ids, estado):
+        if estado not in (review.APROBADO, review.RECHAZADO):
+            raise ValueError(f"Estado inválido: {estado}")
+        with self._lock:
+            changed = []
+            for i in sorted(set(int(i) for i in ids)):
+                inv = self._invs.get(i)
+                if inv is None or inv["estado"] != review.PENDIENTE:
+                    continue
+                inv["estado"] = estado
+                self._pending.pop(bisect.bisect_left(self._pending, i))
+                changed.append((i, inv["user_id"], inv["monto"], inv["fecha_pago"], inv["fecha_inversion"]))
+                if estado == review.APROBADO:
+                    u = self._users.get(inv["user_id"])
+                    if u is not None:
+                        u["total_invertido"] = (u["total_invertido"] or 0) + (inv["monto"] or 0)
+                        u["ganancia_total"] = (u["ganancia_total"] or 0) + review.ganancia(inv["monto"])
+                ko, kn = stats.ESTADOS[review.PENDIENTE], stats.ESTADOS[estado]
+                monto, fecha = inv["monto"] or 0, inv["fecha_inversion"]
+                self._bump(f"{ko}_n", -1, fecha)
+                self._bump(f"{ko}_sum", -monto, fecha)
+                self._bump(f"{kn}_n", 1, fecha)
+                self._bump(f"{kn}_sum", monto, fecha)
+            return changed
+
+    def history_page(self, f, before_id=None, after_id=None, limit=20):
+        # misma semántica que history.page (recorrido lineal: solo para pruebas)
+        def match(inv):
+            return ((not f.get("estado") or inv["estado"] == f["estado"])
+                    and (not f.get("user") or inv["user_id"] == f["user"])
+                    and (not f.get("desde") or (inv["fecha_inversion"] or "") >= f["desde"])
+                    and (not f.get("hasta") or (inv["fecha_inversion"] or "") <= f["hasta"]))
+        with self._lock:
+            ids = sorted(self._invs)
+            if after_id is not None:
+                rows = [i for i in ids if i > after_id and match(self._invs[i])][:limit + 1]
+                page = [tuple(self._invs[i][k] for k in history.PAGE_COLUMNS) for i in rows[:limit]]
+                return page[::-1], len(rows) > limit, True
+            rows = [i for i in reversed(ids) if (before_id is None or i < before_id) and match(self._invs[i])][:limit + 1]
+            page = [tuple(self._invs[i][k] for k in history.PAGE_COLUMNS) for i in rows[:limit]]
+            return page, before_id is not None, len(rows) > limit
+
+    # ---------------- estadísticas ----------------
+    def totals(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def day(self, fecha):
+        with self._lock:
+            return dict(self._daily.get(fecha, {}))
+
+
+# ---------------- caché ----------------
+class CachedRepository:
+    """
+    Envuelve otro repositorio: profile/referidos y can_invest se leen de
+    cachés TTLCache; el resto pasa directo. Cada escritura invalida lo que
+    cambia, también la elegibilidad de quien refirió al usuario (can_invest
+    depende de las inversiones de sus referidos). Un solo proceso: otra
+    instancia escribiendo en la misma base solo se ve al vencer el TTL.
+    """
+
+    def __init__(self, inner, profiles, eligibility):
+        self.inner = inner
+        self.profiles = profiles          # user_id -> fila de PROFILE_COLUMNS (o None)
+        self.eligibility = eligibility    # user_id -> bool de can_invest
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def _forget(self, user_ids, profile=True):
+        user_ids = set(user_ids)
+        if profile:
+            self.profiles.invalidate(*user_ids)
+        refs = {self.inner.referrer(u) for u in user_ids}
+        refs.discard(None)
+        self.eligibility.invalidate(*(user_ids | refs))
+
+    # ---------------- lecturas ----------------
+    def profile(self, user_id):
+        return self.profiles.get_or_load(user_id, self.inner.profile)
+
+    def referidos(self, user_id):
+        r = self.profile(user_id)
+        return (r[REFERIDOS_INDEX] or 0) if r else 0
+
+    def can_invest(self, user_id):
+        return self.eligibility.get_or_load(user_id, self.inner.can_invest)
+
+    # ---------------- escrituras ----------------
+    def start_user(self, user_id, referido=None):
+        existed = self.inner.start_user(user_id, referido)
+        if not existed:
+            self.profiles.invalidate(user_id)   # podía estar en caché como "no registrado"
+            if referido is not None:
+                # un referido nuevo (con inversiones hechas antes de /start) cambia la elegibilidad de quien refiere
+                self.eligibility.invalidate(user_id, referido)
+        return existed
+
+    def add_referral(self, user_id, on_done=None):
+        # antes y después del COMMIT: una lectura entre medias no se queda en caché
+        self.profiles.invalidate(user_id)
+
+        def done(error):
+            self.profiles.invalidate(user_id)
+            if on_done is not None:
+                on_done(error)
+        self.inner.add_referral(user_id, on_done=done)
+
+    def complete_registration(self, user_id, nombre, telefono, cedula, nequi):
+        self.inner.complete_registration(user_id, nombre, telefono, cedula, nequi)
+        self.profiles.invalidate(user_id)
+
+    def update_field(self, user_id, field, value):
+        self.inner.update_field(user_id, field, value)
+        self.profiles.invalidate(user_id)
+
+    def create_investment(self, user_id, *args):
+        r = self.inner.create_investment(user_id, *args)
+        self._forget([user_id], profile=False)
+        return r
+
+    def decide(self, ids, estado):
+        changed = self.inner.decide(ids, estado)
+        if changed:
+            # total_invertido / ganancia_total del perfil y elegibilidad (estado de la inversión)
+            self._forget(r[1] for r in changed)
+        return changed
+
+    def cache_stats(self):
+        return {"profiles": self.profiles.stats(), "eligibility": self.eligibility.stats()}
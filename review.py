@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# review.py
+# Aprobación / rechazo de inversiones pendientes, una o en lote:
+# - Todo el lote en una transacción: un UPDATE de inversiones y un UPDATE por
+#   conjuntos de usuarios.total_invertido / ganancia_total (no uno por fila)
+# - Idempotente: solo cambian las que siguen 'Pendiente'; un doble clic o un
+#   lote repetido no vuelve a sumar al usuario
+# - Devuelve las filas que cambiaron para notificar después del COMMIT
+#
+# Uso (dentro de db.transaction()):
+#   changed = review.decide(cur, ids, review.APROBADO)
+
+import re
+
+import stats
+
+PENDIENTE, APROBADO, RECHAZADO = "Pendiente", "Aprobado", "Rechazado"
+GANANCIA = 0.6        # 60% de ganancia sobre el monto aprobado
+MAX_BATCH = 5000
+
+
+def ganancia(monto):
+    return int((monto or 0) * GANANCIA)
+
+def parse_ids(text, max_ids=MAX_BATCH):
+    """"12 15, 20-30" -> [12, 15, 20, ..., 30]. Devuelve (ids, error)."""
+    ids = []
+    for tok in re.split(r"[\s,]+", (text or "").strip()):
+        if not tok:
+            continue
+        lo, sep, hi = tok.partition("-")
+        if not lo.isdigit() or (sep and not hi.isdigit()):
+            return None, f"ID inválido: {tok}"
+        lo = int(lo)
+        hi = int(hi) if sep else lo
+        if hi < lo or len(ids) + (hi - lo + 1) > max_ids:
+            return None, f"Rango inválido o demasiado grande (máx. {max_ids}): {tok}"
+        ids.extend(range(lo, hi + 1))
+    return ids, None
+
+def pending_ids(db, lo=None, hi=None, ocr_ok=None, limit=MAX_BATCH):
+    """IDs pendientes en [lo, hi] (y con ocr_ok si se indica), por idx_inv_estado_id."""
+    conds, params = ["estado = ?"], [PENDIENTE]
+    if lo is not None:
+        conds.append("id >= ?"); params.append(lo)
+    if hi is not None:
+        conds.append("id <= ?"); params.append(hi)
+    if ocr_ok is not None:
+        conds.append("ocr_ok = ?"); params.append(1 if ocr_ok else 0)
+    rows = db.fetchall(f"SELECT id FROM inversiones WHERE {' AND '.join(conds)} ORDER BY id LIMIT ?", (*params, limit))
+    return [r[0] for r in rows]
+
+def decide(cur, ids, estado):
+    """
+    Pasa a `estado` las inversiones de ids que siguen pendientes. Llamar dentro
+    de db.transaction(). Devuelve [(id, user_id, monto, fecha_pago, fecha_inversion)]
+    de las que cambiaron; las ya decididas se ignoran.
+    """
+    if estado not in (APROBADO, RECHAZADO):
+        raise ValueError(f"Estado inválido: {estado}")
+    # lote en una tabla temporal de la conexión: IN/JOIN por rowid sin límite de parámetros
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS lote_revision (id INTEGER PRIMARY KEY)")
+    cur.execute("DELETE FROM lote_revision")
+    cur.executemany("INSERT OR IGNORE INTO lote_revision (id) VALUES (?)", ((int(i),) for i in ids))
+    # solo las pendientes: el resto sale del lote (idempotencia). CROSS JOIN fija el
+    # orden lote -> inversiones: la tabla temporal no tiene estadísticas y el
+    # planificador tiende a recorrer inversiones entera
+    cur.execute("DELETE FROM lote_revision WHERE "
+                "(SELECT estado FROM inversiones WHERE id = lote_revision.id) IS NOT ?", (PENDIENTE,))
+    changed = cur.execute(
+        "SELECT i.id, i.user_id, i.monto, i.fecha_pago, i.fecha_inversion "
+        "FROM lote_revision l CROSS JOIN inversiones i ON i.id = l.id ORDER BY i.id").fetchall()
+    if not changed:
+        return []
+    cur.execute("UPDATE inversiones SET estado = ? WHERE id IN (SELECT id FROM lote_revision)", (estado,))
+    if estado == APROBADO:
+        # una sola sentencia para todos los usuarios del lote
+        cur.execute("""
+        UPDATE usuarios SET
+            total_invertido = total_invertido + (
+                SELECT COALESCE(SUM(i.monto), 0) FROM inversiones i JOIN lote_revision l ON l.id = i.id
+                WHERE i.user_id = usuarios.user_id),
+            ganancia_total = ganancia_total + (
+                SELECT COALESCE(SUM(CAST(i.monto * ? AS INTEGER)), 0) FROM inversiones i JOIN lote_revision l ON l.id = i.id
+                WHERE i.user_id = usuarios.user_id)
+        WHERE user_id IN (SELECT i.user_id FROM lote_revision l CROSS JOIN inversiones i ON i.id = l.id)
+        """, (GANANCIA,))
+    stats.on_investments_state(cur, [(r[2], r[4]) for r in changed], PENDIENTE, estado)
+    cur.execute("DELETE FROM lote_revision")
+    return changed
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# router.py
+# Enrutador de updates para InversionesCT. En lugar de una cadena de
+# @bot.message_handler(func=lambda m: m.text == "...") que TeleBot prueba uno
+# por uno en cada mensaje, se registra un solo handler de mensajes y uno de
+# callbacks:
+# - Botones de texto: búsqueda en dict por el texto exacto
+# - Comandos (/start, /ping...): dict por nombre de comando
+# - Callbacks: dict por prefijo ("INV" en "INV|100000")
+# - Rutas admin=True: la comprobación de permisos se hace aquí, una sola vez.
+#   Para un no-admin corre denied(update) de la ruta; sin denied el update se
+#   trata como si la ruta no existiera (fallback), así no se delata el comando
+#
+# Coste por update O(1) sin importar cuántas entradas tenga el menú
+# (ver benchmarks/bench_router.py).
+
+
+class Route:
+    __slots__ = ("fn", "admin", "denied")
+
+    def __init__(self, fn, admin=False, denied=None):
+        self.fn = fn
+        self.admin = admin
+        self.denied = denied
+
+
+def command_name(text):
+    """"/start@Bot 123" -> "start" (igual que telebot.util.extract_command)."""
+    return text.split(maxsplit=1)[0][1:].split("@")[0]
+
+
+class Router:
+    """
+    Uso:
+        router = Router(is_admin=lambda uid: uid == ADMIN_ID)
+
+        @router.text("📊 Mi perfil")
+        def handler_perfil(m): ...
+
+        @router.callback("APP|", "REJ|", admin=True, denied=no_autorizado)
+        def admin_process_callback(c): ...
+
+        router.install(bot)   # al final, después de los handlers con prioridad
+    """
+
+    def __init__(self, is_admin=None):
+        self.is_admin = is_admin or (lambda uid: False)
+        self.texts = {}
+        self.commands = {}
+        self.callbacks = {}
+        self.fallback = None
+
+    # ---------------- registro ----------------
+    def _add(self, table, keys, admin, denied):
+        def deco(fn):
+            for k in keys:
+                if k in table:
+                    raise ValueError(f"Ruta duplicada: {k}")
+                table[k] = Route(fn, admin, denied)
+            return fn
+        return deco
+
+    def text(self, *labels, admin=False, denied=None):
+        return self._add(self.texts, labels, admin, denied)
+
+    def command(self, *names, admin=False, denied=None):
+        return self._add(self.commands, names, admin, denied)
+
+    def callback(self, *prefixes, admin=False, denied=None):
+        return self._add(self.callbacks, [p.rstrip("|") for p in prefixes], admin, denied)
+
+    def default(self, fn):
+        """Handler para mensajes sin ruta (menú principal)."""
+        self.fallback = fn
+        return fn
+
+    def has_text(self, text):
+        return text in self.texts
+
+    def tables(self):
+        return (("message", self.texts), ("command", self.commands), ("callback", self.callbacks))
+
+    # ---------------- despacho ----------------
+    def _handler(self, route, update):
+        """Qué corre para este usuario: la ruta, su denied o None (como si no hubiera ruta)."""
+        if route is None:
+            return None
+        if route.admin and not self.is_admin(update.from_user.id):
+            return route.denied
+        return route.fn
+
+    def dispatch_message(self, m):
+        text = m.text or ""
+        route = self.commands.get(command_name(text)) if text.startswith("/") else self.texts.get(text)
+        fn = self._handler(route, m)
+        if fn is not None:
+            fn(m)
+        elif self.fallback:
+            self.fallback(m)
+
+    def dispatch_callback(self, c):
+        fn = self._handler(self.callbacks.get((c.data or "").partition("|")[0]), c)
+        if fn is not None:
+            fn(c)
+
+    def install(self, bot):
+        bot.message_handler(func=lambda m: True)(self.dispatch_message)
+        bot.callback_query_handler(func=lambda c: True)(self.dispatch_callback)
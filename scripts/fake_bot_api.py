@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# scripts/fake_bot_api.py
+# Servidor local que imita la Bot API de Telegram para pruebas de carga:
+# - getUpdates (long polling con offset/limit/timeout) sobre una cola de updates
+#   programados (cada uno se libera en su instante)
+# - sendMessage, sendPhoto, sendDocument, editMessageText, answerCallbackQuery,
+#   getFile y la descarga /file/bot<token>/<ruta>; el resto responde ok
+# - Latencia configurable y 429 (retry_after) inyectados al azar en los envíos
+# - Registro de cada llamada saliente (método, chat, instante) para medir
+#   latencias de extremo a extremo (ver benchmarks/bench_load.py)
+#
+# El bot se apunta aquí con TELEGRAM_API_URL=http://127.0.0.1:<puerto>.
+#
+# Uso suelto (updates a mano con scripts/updates/*.json):
+#   python scripts/fake_bot_api.py --port 8081 --latency-ms 40 --p429 0.02
+#   TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:x python main.py
+#   curl -X POST --data @scripts/updates/start.json http://127.0.0.1:8081/_control/updates
+#   curl http://127.0.0.1:8081/_control/stats
+
+import argparse
+import itertools
+import json
+import random
+import re
+import struct
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEND_METHODS = {"sendmessage", "sendphoto", "senddocument", "editmessagetext"}
+
+
+def tiny_png(width=64, height=64):
+    """PNG blanco válido (sin PIL) para servir como comprobante por defecto."""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    raw = b"".join(b"\x00" + b"\xff" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+def _multipart_fields(body, content_type):
+    """Campos de texto de un multipart/form-data (los archivos se ignoran)."""
+    m = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not m:
+        return {}
+    out = {}
+    for part in body.split(b"--" + m.group(1).encode()):
+        head, sep, value = part.partition(b"\r\n\r\n")
+        if not sep or b"filename=" in head:
+            continue
+        name = re.search(rb'name="([^"]+)"', head)
+        if name:
+            out[name.group(1).decode()] = value.rstrip(b"\r\n").decode("utf-8", "replace")
+    return out
+
+
+class FakeBotApi:
+    """Estado compartido del servidor: updates programados, archivos y registro de llamadas."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, p429=0.0, retry_after=1, file_bytes=None, seed=None):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.p429 = p429
+        self.retry_after = retry_after
+        self.file_bytes = file_bytes if file_bytes is not None else tiny_png()
+        self.rnd = random.Random(seed)
+        self._cv = threading.Condition()
+        self._updates = []          # [(liberar_en, update)] en orden de update_id
+        self._next_update_id = 1
+        self._msg_ids = itertools.count(1)
+        self.first_poll = threading.Event()
+        self.calls = []             # [(t, método, chat_id, status, extra)]
+        self.counts = {}            # método -> llamadas
+        self.injected_429 = 0
+        self.server = None
+
+    # ---------------- updates ----------------
+    def schedule(self, updates, base=None):
+        """
+        updates: [(offset_s, update)]; cada uno queda visible para getUpdates en
+        base + offset_s (monotonic). Se renumeran los update_id en orden.
+        Devuelve [(liberar_en, update)].
+        """
+        base = time.monotonic() if base is None else base
+        out = []
+        with self._cv:
+            for off, upd in sorted(updates, key=lambda x: x[0]):
+                upd = dict(upd, update_id=self._next_update_id)
+                self._next_update_id += 1
+                out.append((base + off, upd))
+            self._updates.extend(out)
+            self._cv.notify_all()
+        return out
+
+    def _released(self, offset, limit, now):
+        res = []
+        for t, upd in self._updates:
+            if upd["update_id"] >= offset and t <= now:
+                res.append(upd)
+                if len(res) >= limit:
+                    break
+        return res
+
+    def get_updates(self, offset=0, limit=100, timeout=0):
+        end = time.monotonic() + timeout
+        with self._cv:
+            # lo confirmado (update_id < offset) ya no hace falta
+            if offset:
+                self._updates = [u for u in self._updates if u[1]["update_id"] >= offset]
+            while True:
+                now = time.monotonic()
+                res = self._released(offset, limit, now)
+                if res or now >= end:
+                    return res
+                pending = [t for t, u in self._updates if t > now]
+                self._cv.wait(min(end, min(pending)) - now if pending else end - now)
+
+    def pending_updates(self):
+        with self._cv:
+            return len(self._updates)
+
+    # ---------------- métodos ----------------
+    def _record(self, method, chat_id, status, extra=None):
+        with self._cv:
+            self.calls.append((time.monotonic(), method, chat_id, status, extra))
+            self.counts[method] = self.counts.get(method, 0) + 1
+
+    def _message(self, chat_id, **fields):
+        return dict({"message_id": next(self._msg_ids), "date": int(time.time()),
+                     "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}}, **fields)
+
+    def call(self, method, params):
+        """Devuelve (status_http, json). Bloquea la latencia simulada."""
+        m = method.lower()
+        if m == "getupdates":
+            if not self.first_poll.is_set():
+                self.first_poll.set()
+            res = self.get_updates(int(params.get("offset") or 0), int(params.get("limit") or 100),
+                                   float(params.get("timeout") or 0))
+            return 200, {"ok": True, "result": res}
+
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self.rnd.uniform(-self.jitter, self.jitter)))
+        try:
+            chat_id = int(params.get("chat_id") or 0)
+        except ValueError:
+            chat_id = 0
+        if m in SEND_METHODS and self.p429 and self.rnd.random() < self.p429:
+            with self._cv:
+                self.injected_429 += 1
+            self._record(method, chat_id, 429)
+            return 429, {"ok": False, "error_code": 429,
+                         "description": f"Too Many Requests: retry after {self.retry_after}",
+                         "parameters": {"retry_after": self.retry_after}}
+
+        if m == "sendmessage":
+            result = self._message(chat_id, text=params.get("text", ""))
+        elif m == "editmessagetext":
+            result = self._message(chat_id, text=params.get("text", ""))
+        elif m == "sendphoto":
+            fid = f"sent-photo-{next(self._msg_ids)}"
+            result = self._message(chat_id, photo=[{"file_id": fid, "file_unique_id": fid, "width": 64, "height": 64}])
+        elif m == "senddocument":
+            fid = f"sent-doc-{next(self._msg_ids)}"
+            result = self._message(chat_id, document={"file_id": fid, "file_unique_id": fid})
+        elif m == "answercallbackquery":
+            self._record(method, 0, 200, params.get("callback_query_id"))
+            return 200, {"ok": True, "result": True}
+        elif m == "getfile":
+            fid = params.get("file_id", "")
+            result = {"file_id": fid, "file_unique_id": fid, "file_size": len(self.file_bytes),
+                      "file_path": f"photos/{fid}.png"}
+        elif m == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        else:
+            result = True   # deleteWebhook, setWebhook, sendChatAction...
+        self._record(method, chat_id, 200)
+        return 200, {"ok": True, "result": result}
+
+    def download(self, path):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self.rnd.uniform(-self.jitter, self.jitter)))
+        self._record("download", 0, 200, path)
+        return self.file_bytes
+
+    def stats(self):
+        with self._cv:
+            return {"calls": dict(self.counts), "injected_429": self.injected_429,
+                    "pending_updates": len(self._updates)}
+
+    # ---------------- servidor ----------------
+    def serve(self, host="127.0.0.1", port=0):
+        """Arranca el servidor HTTP en un hilo. Devuelve la URL base."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a):
+                pass
+
+            def _reply(self, status, body, ctype="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _params(self):
+                url = urllib.parse.urlsplit(self.path)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                n = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(n) if n else b""
+                ctype = self.headers.get("Content-Type", "")
+                if body:
+                    if ctype.startswith("application/json"):
+                        params.update(json.loads(body))
+                    elif ctype.startswith("multipart/form-data"):
+                        params.update(_multipart_fields(body, ctype))
+                    else:
+                        params.update(urllib.parse.parse_qsl(body.decode("utf-8", "replace")))
+                return url.path, params, body
+
+            def _route(self):
+                path, params, body = self._params()
+                parts = path.strip("/").split("/")
+                if parts[0] == "file" and len(parts) >= 3:
+                    return self._reply(200, api.download("/".join(parts[2:])), "application/octet-stream")
+                if parts[0] == "_control":
+                    if parts[-1] == "updates" and body:
+                        data = json.loads(body)
+                        api.schedule([(0, u) for u in (data if isinstance(data, list) else [data])])
+                        return self._reply(200, {"ok": True})
+                    return self._reply(200, api.stats())
+                if len(parts) == 2 and parts[0].startswith("bot"):
+                    return self._reply(*api.call(parts[1], params))
+                self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+            do_GET = do_POST = _route
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--jitter-ms", type=float, default=0)
+    ap.add_argument("--p429", type=float, default=0, help="probabilidad de 429 en cada envío")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--photo", help="archivo a servir en las descargas (por defecto un PNG en blanco)")
+    args = ap.parse_args()
+
+    data = None
+    if args.photo:
+        with open(args.photo, "rb") as f:
+            data = f.read()
+    api = FakeBotApi(args.latency_ms, args.jitter_ms, args.p429, args.retry_after, data)
+    url = api.serve(args.host, args.port)
+    print(f"Bot API falsa en {url}  (TELEGRAM_API_URL={url})")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        api.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# scripts/post_update.py
+# Envía updates de Telegram grabados (JSON) al webhook local, como lo haría
+# Telegram. Útil para probar BOT_MODE=webhook sin exponer el servidor.
+#
+# Uso:
+#   WEBHOOK_SECRET=abc python scripts/post_update.py scripts/updates/start.json
+#   python scripts/post_update.py --url http://127.0.0.1:8080/telegram/webhook --secret abc a.json b.json
+# Un archivo puede contener un update (objeto) o una lista de updates.
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+
+def post(url, secret, update):
+    req = urllib.request.Request(
+        url, data=json.dumps(update).encode("utf-8"), method="POST",
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("files", nargs="+")
+    port = os.environ.get("PORT", "8080")
+    path = os.environ.get("WEBHOOK_PATH", "/telegram/webhook")
+    ap.add_argument("--url", default=f"http://127.0.0.1:{port}{path}")
+    ap.add_argument("--secret", default=os.environ.get("WEBHOOK_SECRET", ""))
+    args = ap.parse_args()
+    if not args.secret:
+        sys.exit("Falta --secret o WEBHOOK_SECRET (debe coincidir con el del bot).")
+
+    for fn in args.files:
+        with open(fn, encoding="utf-8") as f:
+            data = json.load(f)
+        for upd in data if isinstance(data, list) else [data]:
+            print(f"{fn} update_id={upd.get('update_id')} -> HTTP {post(args.url, args.secret, upd)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# stats.py
+# Contadores agregados para el panel admin, mantenidos en la misma transacción
+# que las escrituras (handle_start, procesar_comprobante, review.decide).
+# Leer las estadísticas es O(1) sin importar el tamaño de las tablas.
+#
+# Tablas (migración 5):
+#   stats_totales(clave, valor)          usuarios, <estado>_n, <estado>_sum
+#   stats_diarias(fecha, clave, valor)   por fecha_inversion: <estado>_n, <estado>_sum
+# rebuild()/verify() recalculan desde las tablas base para corregir o detectar deriva.
+
+ESTADOS = {"Pendiente": "pendiente", "Aprobado": "aprobado", "Rechazado": "rechazado"}
+
+
+def _key(estado):
+    return ESTADOS.get(estado, "otro")
+
+def bump(cur, clave, delta, fecha=None):
+    if not delta:
+        return
+    cur.execute("INSERT INTO stats_totales (clave, valor) VALUES (?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET valor = valor + excluded.valor", (clave, delta))
+    if fecha:
+        cur.execute("INSERT INTO stats_diarias (fecha, clave, valor) VALUES (?, ?, ?) "
+                    "ON CONFLICT(fecha, clave) DO UPDATE SET valor = valor + excluded.valor", (fecha, clave, delta))
+
+
+# ---------------- hooks de escritura (llamar dentro de db.transaction()) ----------------
+def on_user_created(cur):
+    bump(cur, "usuarios", 1)
+
+def on_investment_created(cur, monto, fecha, estado="Pendiente"):
+    k = _key(estado)
+    bump(cur, f"{k}_n", 1, fecha)
+    bump(cur, f"{k}_sum", monto or 0, fecha)
+
+def on_investment_state(cur, monto, fecha, old, new):
+    if old == new:
+        return
+    ko, kn = _key(old), _key(new)
+    bump(cur, f"{ko}_n", -1, fecha)
+    bump(cur, f"{ko}_sum", -(monto or 0), fecha)
+    bump(cur, f"{kn}_n", 1, fecha)
+    bump(cur, f"{kn}_sum", monto or 0, fecha)
+
+def on_investments_state(cur, items, old, new):
+    """on_investment_state para un lote [(monto, fecha), ...]: un bump por fecha, no por fila."""
+    if old == new or not items:
+        return
+    por_fecha = {}
+    for monto, fecha in items:
+        n, s = por_fecha.get(fecha, (0, 0))
+        por_fecha[fecha] = (n + 1, s + (monto or 0))
+    ko, kn = _key(old), _key(new)
+    for fecha, (n, s) in por_fecha.items():
+        bump(cur, f"{ko}_n", -n, fecha)
+        bump(cur, f"{ko}_sum", -s, fecha)
+        bump(cur, f"{kn}_n", n, fecha)
+        bump(cur, f"{kn}_sum", s, fecha)
+
+
+# ---------------- lectura ----------------
+def totals(db):
+    return dict(db.fetchall("SELECT clave, valor FROM stats_totales"))
+
+def day(db, fecha):
+    return dict(db.fetchall("SELECT clave, valor FROM stats_diarias WHERE fecha=?", (fecha,)))
+
+
+# ---------------- reconstrucción / verificación ----------------
+def _compute(cur):
+    tot, daily = {}, {}
+    tot["usuarios"] = cur.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0]
+    for fecha, estado, n, s in cur.execute(
+            "SELECT fecha_inversion, estado, COUNT(*), COALESCE(SUM(monto), 0) FROM inversiones GROUP BY fecha_inversion, estado"):
+        k = _key(estado)
+        for clave, v in ((f"{k}_n", n), (f"{k}_sum", s)):
+            tot[clave] = tot.get(clave, 0) + v
+            if fecha:
+                daily[(fecha, clave)] = daily.get((fecha, clave), 0) + v
+    return tot, daily
+
+def verify(db):
+    """
+    Compara contadores guardados con los recalculados.
+    Devuelve {clave: (guardado, real)} solo con las diferencias; las claves
+    diarias aparecen como "fecha/clave".
+    """
+    with db.transaction(immediate=False) as cur:   # misma instantánea para ambos lados
+        tot, daily = _compute(cur)
+        stored_tot = dict(cur.execute("SELECT clave, valor FROM stats_totales").fetchall())
+        stored_daily = {(f, k): v for f, k, v in cur.execute("SELECT fecha, clave, valor FROM stats_diarias")}
+    drift = {}
+    for k in set(tot) | set(stored_tot):
+        if tot.get(k, 0) != stored_tot.get(k, 0):
+            drift[k] = (stored_tot.get(k, 0), tot.get(k, 0))
+    for fk in set(daily) | set(stored_daily):
+        if daily.get(fk, 0) != stored_daily.get(fk, 0):
+            drift[f"{fk[0]}/{fk[1]}"] = (stored_daily.get(fk, 0), daily.get(fk, 0))
+    return drift
+
+def rebuild(db=None, cur=None):
+    """Recalcula todo desde usuarios/inversiones (con un cursor dado, dentro de su transacción)."""
+    if cur is None:
+        with db.transaction() as cur:
+            return rebuild(cur=cur)
+    tot, daily = _compute(cur)
+    cur.execute("DELETE FROM stats_totales")
+    cur.execute("DELETE FROM stats_diarias")
+    cur.executemany("INSERT INTO stats_totales (clave, valor) VALUES (?, ?)", tot.items())
+    cur.executemany("INSERT INTO stats_diarias (fecha, clave, valor) VALUES (?, ?, ?)",
+                    ((f, k, v) for (f, k), v in daily.items()))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# storage.py
+# Almacenamiento de comprobantes direccionado por contenido + caché de OCR:
+# - Cada archivo se guarda como <raíz>/ab/cd/<sha256>.<ext>: directorios pequeños
+#   y el mismo archivo subido dos veces se guarda una sola vez
+# - ocr_cache (migración 7) guarda el texto OCR por sha256; un reenvío idéntico
+#   no vuelve a pasar por tesseract
+# - dHash de 64 bits partido en 4 bandas de 16 bits indexadas: cualquier imagen
+#   a distancia de Hamming <= 3 comparte al menos una banda, así los casi
+#   duplicados (recomprimidos, reescalados) se encuentran con una consulta indexada
+# - Un dHash de 9x8 no ve el texto (dos comprobantes con montos distintos
+#   pueden dar el mismo hash): un parecido solo sirve para avisar al admin de un
+#   posible duplicado, nunca para reutilizar el OCR de otra imagen
+
+import hashlib
+import os
+import tempfile
+
+import ocr   # ocr._load(): Pillow se importa la primera vez que se usa
+
+MAX_PHASH_DISTANCE = 3
+
+
+class ReceiptStore:
+    def __init__(self, root):
+        self.root = root   # los directorios se crean en put()
+
+    def path_for(self, sha, ext):
+        return os.path.join(self.root, sha[:2], sha[2:4], f"{sha}{ext}")
+
+    def put(self, data, ext=".jpg"):
+        """Guarda data si no existe. Devuelve (ruta, sha256, es_nuevo)."""
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.path_for(sha, ext)
+        if os.path.exists(path):
+            return path, sha, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # temporal propio de cada llamada: dos hilos con el mismo archivo no se pisan;
+        # el segundo os.replace deja el mismo contenido
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        return path, sha, True
+
+
+# ---------------- hash perceptual ----------------
+def image_dhash(path):
+    """dHash de 64 bits (entero sin signo) o None si no se puede calcular."""
+    if not ocr.available():
+        return None
+    Image = ocr.Image
+    try:
+        img = Image.open(path)
+        img.draft("L", (64, 64))   # JPEG: decodifica ya reducido, mucho más rápido
+        px = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    except Exception:
+        return None
+    h = 0
+    for row in range(8):
+        for col in range(8):
+            h = (h << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return h
+
+def _bands(h):
+    return [(h >> (16 * i)) & 0xFFFF for i in range(4)]
+
+def _to_signed(h):
+    # SQLite guarda enteros de 64 bits con signo
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+def _to_unsigned(h):
+    return h + (1 << 64) if h < 0 else h
+
+
+# ---------------- caché de OCR ----------------
+class OcrCache:
+    def __init__(self, db, max_distance=MAX_PHASH_DISTANCE):
+        self.db = db
+        self.max_distance = max_distance
+        self.hits_exact = 0
+        self.similar = 0
+        self.misses = 0
+
+    def get(self, sha):
+        """Texto OCR del mismo archivo (sha256), o None."""
+        row = self.db.fetchone("SELECT ocr_text FROM ocr_cache WHERE sha256=?", (sha,))
+        if row:
+            self.hits_exact += 1
+            return row[0]
+        self.misses += 1
+        return None
+
+    def find_similar(self, phash, exclude_sha=None):
+        """
+        (sha256, distancia) de la imagen guardada más parecida a distancia <=
+        max_distance, o None. Solo para avisar: el OCR de esa imagen no vale para esta.
+        """
+        if phash is None:
+            return None
+        b = _bands(phash)
+        rows = self.db.fetchall(
+            "SELECT sha256, phash FROM ocr_cache WHERE b0=? OR b1=? OR b2=? OR b3=?", tuple(b))
+        best = None
+        for sha, ph in rows:
+            if sha == exclude_sha:
+                continue
+            d = bin(_to_unsigned(ph) ^ phash).count("1")
+            if d <= self.max_distance and (best is None or d < best[1]):
+                best = (sha, d)
+        if best:
+            self.similar += 1
+        return best
+
+    def put(self, sha, phash, text):
+        b = _bands(phash) if phash is not None else [None] * 4
+        self.db.execute(
+            "INSERT OR REPLACE INTO ocr_cache (sha256, phash, b0, b1, b2, b3, ocr_text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (sha, _to_signed(phash) if phash is not None else None, *b, text))
+
+    def stats(self):
+        return {"exact": self.hits_exact, "similar": self.similar, "miss": self.misses}
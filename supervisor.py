@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# supervisor.py
+# Supervisor por latidos (reemplaza a watchdog y self_ping):
+# - Cada componente (polling, workers de handlers, pool de OCR, backup) llama a
+#   beat(nombre) cuando avanza; latir cuesta una asignación, sin lock
+# - Un componente está atascado si no late en `timeout` segundos mientras tiene
+#   trabajo (busy) o si su hilo murió; solo ese componente se reinicia
+# - Tope de reinicios por ventana: si no se recupera queda "failed" (readiness
+#   en rojo) y se avisa, en lugar de reiniciar en bucle
+# - status() / ready() para /health
+#
+# Uso:
+#   sup = Supervisor(interval=5, on_event=avisar)
+#   sup.register("ocr", timeout=180, restart=pipeline.restart, busy=lambda: pipeline.depth() > 0)
+#   sup.beat("ocr")
+#   sup.start()
+
+import functools
+import threading
+import time
+import traceback
+
+
+class Component:
+    __slots__ = ("name", "timeout", "restart", "busy", "thread", "critical", "info",
+                 "last", "busy_since", "restarts", "history", "failed", "stalled")
+
+    def __init__(self, name, timeout, restart=None, busy=None, thread=None, critical=True, info=None):
+        self.name = name
+        self.timeout = float(timeout)
+        self.restart = restart
+        self.busy = busy          # () -> bool; sin busy se espera un latido continuo
+        self.thread = thread      # () -> Thread o None; si el hilo murió cuenta como atascado
+        self.critical = critical  # los no críticos no ponen readiness en rojo
+        self.info = info          # () -> dict extra para status()
+        self.last = time.monotonic()
+        self.busy_since = None
+        self.restarts = 0
+        self.history = []         # instantes de los últimos reinicios
+        self.failed = False
+        self.stalled = False
+
+
+class Supervisor:
+    def __init__(self, interval=5.0, max_restarts=5, window=600.0, on_event=None):
+        self.interval = float(interval)
+        self.max_restarts = max_restarts
+        self.window = float(window)
+        # on_event(nombre, evento, detalle): "restarted", "stalled", "failed", "recovered"
+        self.on_event = on_event
+        self._components = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._last_loop = None
+
+    # ---------------- API ----------------
+    def register(self, name, timeout, restart=None, busy=None, thread=None, critical=True, info=None):
+        with self._lock:
+            self._components[name] = Component(name, timeout, restart, busy, thread, critical, info)
+
+    def beat(self, name):
+        c = self._components.get(name)
+        if c is not None:
+            c.last = time.monotonic()
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._loop, name="supervisor", daemon=True).start()
+
+    def alive(self):
+        """Liveness: el propio bucle del supervisor sigue corriendo."""
+        return self._last_loop is not None and time.monotonic() - self._last_loop < 3 * self.interval + 1
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            comps = list(self._components.values())
+        out = {}
+        for c in comps:
+            s = {"ok": not (c.stalled or c.failed), "age_s": round(now - c.last, 1), "timeout_s": c.timeout,
+                 "restarts": c.restarts, "failed": c.failed, "critical": c.critical}
+            if c.info is not None:
+                try:
+                    s.update(c.info())
+                except Exception:
+                    pass
+            out[c.name] = s
+        return out
+
+    def ready(self):
+        """(listo, status): listo si ningún componente crítico está atascado o caído."""
+        st = self.status()
+        return all(s["ok"] for s in st.values() if s["critical"]), st
+
+    # ---------------- comprobación ----------------
+    def _is_stalled(self, c, now):
+        if c.thread is not None:
+            t = c.thread()
+            if t is not None and not t.is_alive():
+                return "hilo terminado"
+        if c.busy is not None:
+            try:
+                busy = c.busy()
+            except Exception:
+                busy = False
+            if not busy:
+                c.busy_since = None
+                return None
+            if c.busy_since is None:
+                c.busy_since = now
+            since = max(c.last, c.busy_since)
+        else:
+            since = c.last
+        if now - since > c.timeout:
+            return f"sin latido hace {now - since:.0f}s"
+        return None
+
+    def check(self, now=None):
+        """Una pasada: reinicia lo atascado. Devuelve [(nombre, motivo)] reiniciados."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            comps = list(self._components.values())
+        restarted = []
+        for c in comps:
+            reason = self._is_stalled(c, now)
+            if reason is None:
+                if c.stalled or c.failed:
+                    c.stalled = c.failed = False
+                    self._event(c.name, "recovered", "")
+                continue
+            was_stalled, c.stalled = c.stalled, True
+            if c.restart is None:
+                # sin forma de reiniciarlo (p. ej. un hilo bloqueado): solo avisar
+                if not was_stalled:
+                    self._event(c.name, "stalled", reason)
+                continue
+            if c.failed:
+                continue
+            c.history = [t for t in c.history if now - t < self.window]
+            if len(c.history) >= self.max_restarts:
+                c.failed = True
+                self._event(c.name, "failed", f"{reason}; {len(c.history)} reinicios en {self.window:.0f}s")
+                continue
+            try:
+                done = c.restart()
+            except Exception:
+                traceback.print_exc()
+                done = None
+            if done is False:
+                # restart() no pudo hacer nada (p. ej. el hilo sigue vivo pero bloqueado)
+                if not was_stalled:
+                    self._event(c.name, "stalled", reason)
+                continue
+            c.history.append(now)
+            c.restarts += 1
+            c.last = now            # margen para que el componente reiniciado vuelva a latir
+            c.busy_since = None
+            restarted.append((c.name, reason))
+            self._event(c.name, "restarted", reason)
+        return restarted
+
+    def _event(self, name, event, detail):
+        print(f"🩺 Supervisor: {name} {event} {detail}".rstrip())
+        if self.on_event is not None:
+            try:
+                self.on_event(name, event, detail)
+            except Exception:
+                traceback.print_exc()
+
+    def _loop(self):
+        while True:
+            self._last_loop = time.monotonic()
+            try:
+                self.check()
+            except Exception:
+                traceback.print_exc()
+            time.sleep(self.interval)
+
+
+class HandlerTracker:
+    """
+    Envuelve los handlers del bot: cuenta los que están en curso y late al
+    terminar cada uno. Con busy=tracker.in_flight el supervisor detecta
+    workers que dejaron de avanzar. Cada entrada lleva la generación del pool:
+    tras restart_with(...)() las de hilos abandonados dejan de contar.
+    """
+
+    def __init__(self, supervisor, name="handlers"):
+        self.supervisor = supervisor
+        self.name = name
+        self._gen = 0
+        self._running = {}    # ident del hilo -> (generación, inicio monotonic)
+
+    def wrap(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = threading.get_ident()
+            self._running[key] = (self._gen, time.monotonic())
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._running.pop(key, None)
+                self.supervisor.beat(self.name)
+        wrapper.__tracked__ = True
+        return wrapper
+
+    def install(self, bot):
+        """Envuelve los handlers ya registrados (message y callback_query)."""
+        for handlers in (bot.message_handlers, bot.callback_query_handlers):
+            for h in handlers:
+                if not getattr(h["function"], "__tracked__", False):
+                    h["function"] = self.wrap(h["function"])
+
+    def restart_with(self, restart):
+        """
+        restart del pool de workers para el supervisor. Los handlers que siguen
+        en curso quedan en hilos abandonados: se olvidan, si no in_flight() no
+        vuelve a 0 y el supervisor reiniciaría el pool nuevo en cada pasada.
+        """
+        def wrapped():
+            done = restart()
+            self._gen += 1
+            for key, (gen, _) in list(self._running.items()):
+                if gen != self._gen:
+                    self._running.pop(key, None)
+            return done
+        return wrapped
+
+    def in_flight(self):
+        return len(self._running)
+
+    def oldest(self):
+        """Segundos del handler en curso más antiguo (0 si no hay)."""
+        starts = [start for _, start in list(self._running.values())]
+        return time.monotonic() - min(starts) if starts else 0.0
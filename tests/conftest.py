@@ -0,0 +1,23 @@
+# tests/conftest.py
+# Fixtures comunes: base SQLite temporal con todas las migraciones.
+#
+# Uso (desde la raíz del repo):
+#   python -m pytest -q
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+from database import ConnectionPool  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"))
+    migrations.migrate(pool, verbose=False)
+    yield pool
+    pool.close_all()
@@ -0,0 +1,82 @@
+# tests/test_backup.py
+# backup.BackupStore: backup + restauración, trozos concurrentes y prune()
+# mientras otro run() todavía no guardó su manifiesto.
+
+import sqlite3
+import threading
+
+from backup import BackupStore
+
+
+def _make_db(path, rows=2000):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO t (v) VALUES (?)", ((f"fila {i}" * 10,) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def test_run_y_restore(tmp_path):
+    db = str(tmp_path / "app.db")
+    _make_db(db)
+    store = BackupStore(str(tmp_path / "backups"))
+    man = store.run(db)
+    assert man["verified"]
+    again = store.run(db)
+    assert again["metrics"]["chunks_new"] == 0          # nada cambió: todo reutilizado
+    dest = str(tmp_path / "restaurada.db")
+    store.restore_db(store.load(man["id"]), dest)
+    assert sqlite3.connect(dest).execute("SELECT COUNT(*) FROM t").fetchone()[0] == 2000
+
+def test_put_chunk_concurrente(tmp_path):
+    store = BackupStore(str(tmp_path))
+    data = b"x" * 100000
+    barrier = threading.Barrier(8)
+    errors = []
+    def worker():
+        barrier.wait()
+        try:
+            store.put_chunk(data)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    h = store.put_chunk(data)[0]
+    assert store.get_chunk(h) == data
+
+def test_prune_espera_al_run_en_curso(tmp_path):
+    db = str(tmp_path / "app.db")
+    _make_db(db)
+    files = tmp_path / "comprobantes"
+    files.mkdir()
+    (files / "a.jpg").write_bytes(b"imagen" * 1000)
+
+    in_run, release = threading.Event(), threading.Event()
+
+    class SlowStore(BackupStore):
+        def _backup_files(self, files_dir, m):
+            # trozos de la base ya escritos, manifiesto todavía sin guardar
+            in_run.set()
+            release.wait(10)
+            return super()._backup_files(files_dir, m)
+
+    root = str(tmp_path / "backups")
+    store = SlowStore(root)
+    out = {}
+    runner = threading.Thread(target=lambda: out.setdefault("man", store.run(db, str(files))))
+    runner.start()
+    assert in_run.wait(10)
+    pruner = threading.Thread(target=lambda: out.setdefault("prune", BackupStore(root).prune()))
+    pruner.start()
+    pruner.join(0.3)
+    assert pruner.is_alive()          # bloqueado por el lock del almacén
+    release.set()
+    runner.join(10)
+    pruner.join(10)
+    assert out["prune"] == (0, 0)
+    assert out["man"]["verified"]
+    assert BackupStore(root).verify(out["man"])
@@ -0,0 +1,86 @@
+# tests/test_can_invest.py
+# CAN_INVEST_SQL (y MemoryRepository.can_invest) frente a la lógica original de
+# can_user_invest: mismas respuestas en casos a mano y en una base aleatoria.
+
+import datetime
+import random
+
+import pytest
+
+from repository import MemoryRepository, SqliteRepository
+
+
+def can_invest_baseline(db, user_id):
+    # can_user_invest original (N+1 consultas), sin get_conn()
+    cur = db.connection().cursor()
+    cur.execute("SELECT COUNT(*), MAX(fecha_inversion) FROM inversiones WHERE user_id=?", (user_id,))
+    count, last_date = cur.fetchone()
+    if count == 0:
+        return True
+    cur.execute("SELECT user_id FROM usuarios WHERE referido_por=?", (user_id,))
+    referidos = [r[0] for r in cur.fetchall()]
+    last_dt = datetime.date.fromisoformat(last_date) if last_date else None
+    for rid in referidos:
+        cur.execute("SELECT MIN(fecha_inversion) FROM inversiones WHERE user_id=?", (rid,))
+        first_inv_date = cur.fetchone()[0]
+        if not first_inv_date:
+            continue
+        first_dt = datetime.date.fromisoformat(first_inv_date)
+        if last_dt and first_dt <= last_dt:
+            continue
+        cur.execute("SELECT COUNT(*) FROM inversiones WHERE user_id=? AND estado IN ('Pendiente','Aprobado')", (rid,))
+        if cur.fetchone()[0] > 0:
+            return True
+    return False
+
+
+def _insert(db, users, invs):
+    with db.transaction() as cur:
+        cur.executemany("INSERT INTO usuarios (user_id, nombre, referido_por) VALUES (?, ?, ?)", users)
+        cur.executemany(
+            "INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado) VALUES (?, 100000, ?, '', ?)",
+            invs)
+
+def _check(db, uids):
+    sql = SqliteRepository(db)
+    mem = MemoryRepository()
+    mem.load(db)
+    for uid in uids:
+        esperado = can_invest_baseline(db, uid)
+        assert sql.can_invest(uid) == esperado, uid
+        assert mem.can_invest(uid) == esperado, uid
+
+
+@pytest.mark.parametrize("users, invs, uid, esperado", [
+    # sin inversiones: primera permitida
+    ([(1, "a", None)], [], 1, True),
+    # ya invirtió y no tiene referidos
+    ([(1, "a", None)], [(1, "2025-01-10", "Aprobado")], 1, False),
+    # referido que invirtió después de su última inversión
+    ([(1, "a", None), (2, "b", 1)], [(1, "2025-01-10", "Aprobado"), (2, "2025-01-11", "Pendiente")], 1, True),
+    # referido que invirtió el mismo día o antes: no cuenta
+    ([(1, "a", None), (2, "b", 1)], [(1, "2025-01-10", "Aprobado"), (2, "2025-01-10", "Pendiente")], 1, False),
+    # referido cuya única inversión fue rechazada
+    ([(1, "a", None), (2, "b", 1)], [(1, "2025-01-10", "Aprobado"), (2, "2025-01-11", "Rechazado")], 1, False),
+    # la primera inversión del referido es anterior aunque tenga otra posterior
+    ([(1, "a", None), (2, "b", 1)],
+     [(1, "2025-01-10", "Aprobado"), (2, "2025-01-05", "Rechazado"), (2, "2025-01-20", "Aprobado")], 1, False),
+    # referido de otro usuario
+    ([(1, "a", None), (3, "c", None), (2, "b", 3)], [(1, "2025-01-10", "Aprobado"), (2, "2025-01-11", "Aprobado")],
+     1, False),
+])
+def test_casos(db, users, invs, uid, esperado):
+    _insert(db, users, invs)
+    assert can_invest_baseline(db, uid) == esperado
+    _check(db, [uid])
+
+def test_base_aleatoria(db):
+    rnd = random.Random(7)
+    n_users = 300
+    start = datetime.date(2025, 1, 1)
+    users = [(u, f"u{u}", rnd.randint(1, u - 1) if u > 1 and rnd.random() < 0.7 else None)
+             for u in range(1, n_users + 1)]
+    invs = [(rnd.randint(1, n_users), (start + datetime.timedelta(days=rnd.randint(0, 60))).isoformat(),
+             rnd.choice(("Pendiente", "Aprobado", "Rechazado"))) for _ in range(600)]
+    _insert(db, users, invs)
+    _check(db, range(1, n_users + 1))
@@ -0,0 +1,109 @@
+# tests/test_database.py
+# database.ConnectionPool: conexión por hilo, pragmas WAL, reintento de
+# BEGIN IMMEDIATE con la base bloqueada y transacciones anidadas.
+
+import sqlite3
+import threading
+
+import pytest
+
+import database
+from database import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    p = ConnectionPool(str(tmp_path / "pool.db"))
+    p.execute("CREATE TABLE t (x INTEGER)")
+    yield p
+    p.close_all()
+
+def _in_thread(fn):
+    out = []
+    t = threading.Thread(target=lambda: out.append(fn()))
+    t.start()
+    t.join()
+    return out[0]
+
+
+def test_conexion_por_hilo(pool):
+    conn = pool.connection()
+    assert pool.connection() is conn
+    otra = _in_thread(pool.connection)
+    assert otra is not conn
+    assert pool.open_connections() == 2
+    # la del hilo que ya terminó se cierra cuando llega un hilo nuevo
+    _in_thread(pool.connection)
+    assert pool.open_connections() == 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        otra.execute("SELECT 1")
+
+def test_pragmas(tmp_path):
+    p = ConnectionPool(str(tmp_path / "pragmas.db"), busy_timeout_ms=1234, cache_kb=2048)
+    conn = p.connection()
+    pragma = lambda name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+    assert pragma("journal_mode") == "wal"
+    assert pragma("synchronous") == 1          # NORMAL
+    assert pragma("cache_size") == -2048
+    assert pragma("busy_timeout") == 1234
+    assert pragma("temp_store") == 2           # MEMORY
+    p.close_all()
+
+def test_begin_immediate_reintenta(tmp_path):
+    path = str(tmp_path / "lock.db")
+    p = ConnectionPool(path, busy_timeout_ms=0)
+    p.execute("CREATE TABLE t (x INTEGER)")
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    # se libera durante los reintentos (0.05 + 0.1 + ... s)
+    timer = threading.Timer(0.1, lambda: other.execute("COMMIT"))
+    timer.start()
+    try:
+        with p.transaction() as cur:
+            cur.execute("INSERT INTO t VALUES (1)")
+    finally:
+        timer.join()
+        other.close()
+    assert p.scalar("SELECT COUNT(*) FROM t") == 1
+    p.close_all()
+
+def test_begin_immediate_agota_reintentos(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "LOCK_RETRIES", 2)
+    path = str(tmp_path / "lock.db")
+    p = ConnectionPool(path, busy_timeout_ms=0)
+    p.execute("CREATE TABLE t (x INTEGER)")
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            with p.transaction() as cur:
+                cur.execute("INSERT INTO t VALUES (1)")
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    assert not p.connection().in_transaction
+    p.close_all()
+
+def test_anidada_se_une_a_la_exterior(pool):
+    with pool.transaction() as cur:
+        cur.execute("INSERT INTO t VALUES (1)")
+        with pool.transaction() as inner:
+            inner.execute("INSERT INTO t VALUES (2)")
+        # la interior no hizo COMMIT: otra conexión todavía no ve nada
+        assert _in_thread(lambda: pool.scalar("SELECT COUNT(*) FROM t")) == 0
+    assert pool.scalar("SELECT COUNT(*) FROM t") == 2
+
+def test_error_en_la_anidada_deshace_todo(pool):
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as cur:
+            cur.execute("INSERT INTO t VALUES (1)")
+            with pool.transaction() as inner:
+                inner.execute("INSERT INTO t VALUES (2)")
+                raise RuntimeError("falla")
+    assert pool.scalar("SELECT COUNT(*) FROM t") == 0
+    assert not pool.connection().in_transaction
+
+def test_execute_devuelve_rowcount_y_lastrowid(pool):
+    assert pool.execute("INSERT INTO t VALUES (5)") == (1, 1)
+    assert pool.fetchall("SELECT x FROM t") == [(5,)]
+    assert pool.scalar("SELECT x FROM t WHERE x = 6", default=-1) == -1
@@ -0,0 +1,43 @@
+# tests/test_ocr_cache.py
+# storage.OcrCache: acierto por sha exacto, fallo, contadores y find_similar
+# (que solo avisa: nunca devuelve el texto de otra imagen).
+
+from storage import OcrCache
+
+SHA_A, SHA_B, SHA_C = "a" * 64, "b" * 64, "c" * 64
+PHASH = 0x8080808080800000
+
+
+def test_hit_y_miss(db):
+    cache = OcrCache(db)
+    assert cache.get(SHA_A) is None
+    cache.put(SHA_A, PHASH, "texto A")
+    assert cache.get(SHA_A) == "texto A"
+    assert cache.get(SHA_B) is None
+    assert cache.stats() == {"exact": 1, "similar": 0, "miss": 2}
+
+def test_put_reemplaza(db):
+    cache = OcrCache(db)
+    cache.put(SHA_A, PHASH, "viejo")
+    cache.put(SHA_A, PHASH, "nuevo")
+    assert cache.get(SHA_A) == "nuevo"
+
+def test_sin_phash(db):
+    cache = OcrCache(db)
+    cache.put(SHA_A, None, "texto A")
+    assert cache.get(SHA_A) == "texto A"
+    assert cache.find_similar(None) is None
+
+def test_find_similar(db):
+    cache = OcrCache(db, max_distance=4)
+    cache.put(SHA_A, PHASH, "texto A")
+    cache.put(SHA_B, PHASH ^ 0b111, "texto B")               # distancia 3
+    assert cache.find_similar(PHASH, exclude_sha=SHA_C) == (SHA_A, 0)
+    # la propia imagen no cuenta como parecida
+    assert cache.find_similar(PHASH, exclude_sha=SHA_A) == (SHA_B, 3)
+    assert cache.find_similar(PHASH ^ 0xFF, exclude_sha=SHA_C) is None   # distancia 5 y 8
+    # bit alto (entero con signo en SQLite)
+    cache.put(SHA_C, PHASH | (1 << 63), "texto C")
+    assert cache.find_similar(PHASH | (1 << 63), exclude_sha=SHA_A) == (SHA_C, 0)
+    assert cache.stats()["similar"] == 3
+    assert cache.stats()["exact"] == 0
@@ -0,0 +1,52 @@
+# tests/test_ocr_result.py
+# main.on_ocr_result: un comprobante repetido (mismo sha o imagen casi idéntica)
+# que pasa verify_receipt queda fuera de "/aprobar ocr" (pending_ids(ocr_ok=True)).
+
+import pytest
+
+pytest.importorskip("telebot")
+
+import main  # noqa: E402
+from repository import MemoryRepository  # noqa: E402
+from storage import OcrCache  # noqa: E402
+
+TEXTO = f"Número Nequi\n{main.NEQUI_DESTINO}\n¿Cuánto?\n$ 100.000,00"
+
+
+@pytest.fixture
+def env(db, monkeypatch):
+    repo = MemoryRepository()
+    sent = []
+    monkeypatch.setattr(main, "repo", repo)
+    monkeypatch.setattr(main, "ocr_cache", OcrCache(db))
+    monkeypatch.setattr(main, "safe_send", lambda chat_id, text, **kw: sent.append((chat_id, text)))
+    return repo, sent
+
+def _job(repo, sha, **extra):
+    inv_id, dup = repo.create_investment(7, 100000, "2025-01-10", "2025-02-10", "/x.jpg", None, "photo", sha)
+    return dict({"inv_id": inv_id, "chat_id": 7, "monto": 100000, "fecha_pago": "2025-02-10",
+                 "first_name": "Ana", "sha": sha, "duplicate_of": dup}, **extra)
+
+
+def test_comprobante_unico_entra_en_aprobar_ocr(env):
+    repo, sent = env
+    job = _job(repo, "a" * 64)
+    main.on_ocr_result(job, TEXTO, None)
+    assert repo.pending_ids(ocr_ok=True) == [job["inv_id"]]
+    assert "OCR OK." in sent[-1][1]
+
+@pytest.mark.parametrize("repetido", ["duplicate_of", "similar_of"])
+def test_comprobante_repetido_queda_para_revision_manual(env, repetido):
+    repo, sent = env
+    first = _job(repo, "a" * 64)
+    main.on_ocr_result(first, TEXTO, None)
+    if repetido == "duplicate_of":
+        job = _job(repo, "a" * 64)              # mismo archivo
+        assert job["duplicate_of"] == first["inv_id"]
+    else:
+        job = _job(repo, "b" * 64, similar_of=first["inv_id"])
+    main.on_ocr_result(job, TEXTO, None)
+    assert repo.pending_ids(ocr_ok=True) == [first["inv_id"]]
+    assert "revisar a mano" in sent[-1][1]
+    # al usuario se le sigue diciendo que el comprobante se verificó
+    assert "verificado preliminarmente" in sent[-2][1]
@@ -0,0 +1,58 @@
+# tests/test_receipt.py
+# receipt.parse_amount / parse_text / verify_receipt sobre texto (sin tesseract).
+
+import pytest
+
+import receipt
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("$ 100.000,00", 100000),
+    ("$100,000.00", 100000),
+    ("100000", 100000),
+    ("$ 1.500.000", 1500000),
+    # O leída por 0 dentro de la cifra
+    ("$ 1OO.OOO,00", 100000),
+    ("5OO.000", 500000),
+    # las o de las etiquetas no son ceros
+    ("del envío $ 100.000", 100000),
+    ("Total a pagar 100000", 100000),
+    ("Monto total $ 300.000", 300000),
+    ("", None),
+    (None, None),
+    ("sin cifras", None),
+])
+def test_parse_amount(texto, esperado):
+    assert receipt.parse_amount(texto) == esperado
+
+def test_parse_text_por_etiquetas():
+    texto = "\n".join([
+        "Nequi", "De", "311 222 3333", "Para", "Número Nequi", "300 123 4567",
+        "¿Cuánto?", "$ 100.000,00", "Fecha", "12 de marzo de 2025 a las 10:15 a. m.",
+        "Referencia", "M12345678", "Saldo disponible", "$ 2.345.678,00",
+    ])
+    assert receipt.parse_text(texto) == {"amount": 100000, "destination": "3001234567",
+                                         "date": "2025-03-12", "reference": "M12345678"}
+
+NEQUI = "3001234567"
+COMPROBANTE = f"Número Nequi\n{NEQUI}\n¿Cuánto?\n$ 100.000,00\nReferencia\nM12345678"
+
+@pytest.mark.parametrize("texto, monto, destino, ok", [
+    (COMPROBANTE, 100000, NEQUI, True),
+    (COMPROBANTE, 101500, NEQUI, True),        # dentro de la tolerancia
+    (COMPROBANTE, 500000, NEQUI, False),       # el usuario declara otro monto
+    (COMPROBANTE, 100000, "3009999999", False),
+    # la referencia larga ya no se toma por monto
+    (f"Referencia\n12345678901\nPara {NEQUI}\nValor $ 300.000", 300000, NEQUI, True),
+    (f"Para {NEQUI}", 100000, NEQUI, False),    # sin monto
+])
+def test_verify_receipt(texto, monto, destino, ok):
+    res, motivo = receipt.verify_receipt(texto, monto, destino)
+    assert res is ok
+    assert (motivo == "") is ok
+
+def test_verify_receipt_con_campos():
+    fields = {"amount": 100000, "destination": NEQUI, "date": None, "reference": None}
+    assert receipt.verify_receipt("", 100000, NEQUI, fields=fields) == (True, "")
+    ok, motivo = receipt.verify_receipt("", 100000, NEQUI, fields=dict(fields, destination="3110000000"))
+    assert not ok and "3110000000" in motivo
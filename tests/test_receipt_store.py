@@ -0,0 +1,39 @@
+# tests/test_receipt_store.py
+# storage.ReceiptStore: archivos por sha256, deduplicados, y put() concurrente
+# del mismo archivo sin errores ni temporales sueltos.
+
+import hashlib
+import os
+import threading
+
+from storage import ReceiptStore
+
+
+def test_put_deduplica(tmp_path):
+    store = ReceiptStore(str(tmp_path))
+    path, sha, new = store.put(b"comprobante", ".jpg")
+    assert sha == hashlib.sha256(b"comprobante").hexdigest()
+    assert path == os.path.join(str(tmp_path), sha[:2], sha[2:4], sha + ".jpg")
+    assert new and open(path, "rb").read() == b"comprobante"
+    assert store.put(b"comprobante", ".jpg") == (path, sha, False)
+
+def test_put_concurrente_mismo_archivo(tmp_path):
+    store = ReceiptStore(str(tmp_path))
+    data = os.urandom(256 * 1024)
+    barrier = threading.Barrier(16)
+    results, errors = [], []
+    def worker():
+        barrier.wait()
+        try:
+            results.append(store.put(data, ".jpg")[0])
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len(set(results)) == 1
+    assert open(results[0], "rb").read() == data
+    assert os.listdir(os.path.dirname(results[0])) == [os.path.basename(results[0])]
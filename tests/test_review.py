@@ -0,0 +1,52 @@
+# tests/test_review.py
+# review.decide: aprobar/rechazar es idempotente (doble clic, lote repetido).
+
+import pytest
+
+import review
+
+
+def _seed(db):
+    with db.transaction() as cur:
+        cur.executemany("INSERT INTO usuarios (user_id, nombre) VALUES (?, ?)", [(1, "a"), (2, "b")])
+        cur.executemany(
+            "INSERT INTO inversiones (user_id, monto, fecha_inversion, fecha_pago, estado) VALUES (?, ?, ?, '', ?)",
+            [(1, 100000, "2025-01-01", "Pendiente"), (1, 300000, "2025-01-02", "Pendiente"),
+             (2, 500000, "2025-01-03", "Pendiente"), (2, 100000, "2025-01-04", "Rechazado")])
+
+def _totales(db):
+    return db.fetchall("SELECT user_id, total_invertido, ganancia_total FROM usuarios ORDER BY user_id")
+
+def _decide(db, ids, estado):
+    with db.transaction() as cur:
+        return review.decide(cur, ids, estado)
+
+
+def test_aprobar_suma_una_sola_vez(db):
+    _seed(db)
+    changed = _decide(db, [1, 2, 3], review.APROBADO)
+    assert [r[0] for r in changed] == [1, 2, 3]
+    esperado = [(1, 400000, review.ganancia(400000)), (2, 500000, review.ganancia(500000))]
+    assert _totales(db) == esperado
+    # mismo lote otra vez (doble clic) y el lote con repetidos: no cambia nada
+    assert _decide(db, [1, 2, 3], review.APROBADO) == []
+    assert _decide(db, [1, 1, 2], review.APROBADO) == []
+    assert _totales(db) == esperado
+
+def test_ya_decididas_no_cambian(db):
+    _seed(db)
+    _decide(db, [1], review.RECHAZADO)
+    # aprobar después de rechazar no suma; la 4 ya estaba rechazada
+    changed = _decide(db, [1, 2, 4], review.APROBADO)
+    assert [r[0] for r in changed] == [2]
+    assert db.scalar("SELECT estado FROM inversiones WHERE id=1") == review.RECHAZADO
+    assert _totales(db)[0] == (1, 300000, review.ganancia(300000))
+
+def test_ids_inexistentes(db):
+    _seed(db)
+    assert _decide(db, [99, 100], review.APROBADO) == []
+
+def test_estado_invalido(db):
+    _seed(db)
+    with pytest.raises(ValueError):
+        _decide(db, [1], review.PENDIENTE)
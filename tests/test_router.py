@@ -0,0 +1,70 @@
+# tests/test_router.py
+# Router: rutas admin para un no-admin -> denied de la ruta, o como si la ruta
+# no existiera (fallback en mensajes, nada en callbacks).
+
+from types import SimpleNamespace
+
+from router import Router
+
+ADMIN = 1
+USER = 2
+
+
+def _msg(uid, text):
+    return SimpleNamespace(from_user=SimpleNamespace(id=uid), chat=SimpleNamespace(id=uid), text=text)
+
+def _cb(uid, data):
+    return SimpleNamespace(from_user=SimpleNamespace(id=uid), id="cb", data=data)
+
+
+def _router(calls):
+    router = Router(is_admin=lambda uid: uid == ADMIN)
+
+    @router.command("ping", admin=True, denied=lambda m: calls.append("ping-denied"))
+    def ping(m):
+        calls.append("ping")
+
+    @router.command("exportar", admin=True)
+    def exportar(m):
+        calls.append("exportar")
+
+    @router.callback("APP|", admin=True, denied=lambda c: calls.append("app-denied"))
+    def app(c):
+        calls.append("app")
+
+    @router.callback("PEN|", admin=True)
+    def pen(c):
+        calls.append("pen")
+
+    @router.default
+    def fallback(m):
+        calls.append("fallback")
+
+    return router
+
+
+def test_admin_pasa():
+    calls = []
+    router = _router(calls)
+    router.dispatch_message(_msg(ADMIN, "/ping"))
+    router.dispatch_message(_msg(ADMIN, "/exportar"))
+    router.dispatch_callback(_cb(ADMIN, "APP|7"))
+    router.dispatch_callback(_cb(ADMIN, "PEN|0"))
+    assert calls == ["ping", "exportar", "app", "pen"]
+
+
+def test_no_admin_usa_denied_de_la_ruta():
+    calls = []
+    router = _router(calls)
+    router.dispatch_message(_msg(USER, "/ping"))
+    router.dispatch_callback(_cb(USER, "APP|7"))
+    assert calls == ["ping-denied", "app-denied"]
+
+
+def test_no_admin_sin_denied_es_como_ruta_inexistente():
+    calls = []
+    router = _router(calls)
+    router.dispatch_message(_msg(USER, "/exportar"))
+    router.dispatch_message(_msg(USER, "/noexiste"))
+    router.dispatch_callback(_cb(USER, "PEN|0"))
+    assert calls == ["fallback", "fallback"]
@@ -0,0 +1,52 @@
+# tests/test_startup.py
+# create_application(start=False) con cada BOT_ENGINE, en un proceso aparte
+# (main.py lee la configuración al importarse) con la base en un directorio
+# temporal: monta base, bot y app Flask sin arrancar hilos.
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("telebot")
+pytest.importorskip("flask")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import main
+bot, app = main.create_application(start=False)
+assert main.bot is bot and main.app is app and main.repo is not None
+assert bot.message_handlers, "sin handlers registrados"
+if main.BOT_ENGINE == "asyncio":
+    assert main.aio is not None and main.abot is not None
+else:
+    assert main.aio is None and main.poller is not None and main.handler_pool is not None
+r = app.test_client().get("/health")
+assert r.status_code == 200, r.status_code
+print("ok", type(bot).__name__)
+"""
+
+
+@pytest.mark.parametrize("engine, clase", [("threads", "TeleBot"), ("asyncio", "SyncBot")])
+def test_create_application(tmp_path, engine, clase):
+    if engine == "asyncio":
+        pytest.importorskip("aiohttp")
+    env = dict(os.environ, BOT_ENGINE=engine, BOT_TOKEN="123:test",
+               PYTHONPATH=os.pathsep.join(p for p in (ROOT, os.environ.get("PYTHONPATH")) if p))
+    proc = subprocess.run([sys.executable, "-c", SCRIPT], cwd=tmp_path, env=env,
+                          capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert f"ok {clase}" in proc.stdout
+    assert (tmp_path / "inversionesct.db").exists()
+
+def test_importar_no_arranca_nada(tmp_path):
+    # importar main no abre la base ni crea el bot
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (ROOT, os.environ.get("PYTHONPATH")) if p))
+    proc = subprocess.run([sys.executable, "-c", "import main, threading; "
+                           "assert main.bot is None and main.app is None; print(threading.active_count())"],
+                          cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert proc.stdout.strip() == "1"
+    assert not (tmp_path / "inversionesct.db").exists()
@@ -0,0 +1,78 @@
+# tests/test_supervisor.py
+# Supervisor + HandlerTracker: un handler colgado provoca un solo reinicio del
+# pool (polling.WorkerPool o el executor de aiobot), no uno por pasada.
+
+import threading
+import time
+
+import pytest
+
+from aiobot import AsyncRuntime
+from polling import WorkerPool
+from supervisor import HandlerTracker, Supervisor
+
+TIMEOUT = 30
+
+
+def _pool_workers():
+    pool = WorkerPool(2, "test-handler")
+    pool.start()
+    return pool.submit, pool.restart
+
+def _aio_executor():
+    rt = AsyncRuntime(workers=2)
+    return (lambda fn, *args: rt.executor.submit(fn, *args)), rt.restart_executor
+
+
+@pytest.mark.parametrize("make_pool", [_pool_workers, _aio_executor], ids=["threads", "asyncio"])
+def test_handler_colgado_un_solo_reinicio(make_pool):
+    sup = Supervisor(max_restarts=3)
+    tracker = HandlerTracker(sup, "handlers")
+    submit, restart = make_pool()
+    sup.register("handlers", TIMEOUT, busy=tracker.in_flight, restart=tracker.restart_with(restart))
+
+    release, started, done = threading.Event(), threading.Event(), threading.Event()
+    def colgado():
+        started.set()
+        release.wait(10)
+    submit(tracker.wrap(colgado))
+    assert started.wait(5)
+    assert tracker.in_flight() == 1
+
+    t0 = time.monotonic()
+    sup.check(now=t0)
+    assert sup.check(now=t0 + TIMEOUT + 1) == [("handlers", f"sin latido hace {TIMEOUT + 1}s")]
+    # el hilo colgado quedó abandonado: no cuenta y las pasadas siguientes no reinician
+    assert tracker.in_flight() == 0
+    for k in range(2, 10):
+        assert sup.check(now=t0 + k * (TIMEOUT + 1)) == []
+    ready, status = sup.ready()
+    assert ready and status["handlers"]["restarts"] == 1
+
+    # el pool nuevo atiende y late
+    submit(tracker.wrap(done.set))
+    assert done.wait(5)
+    release.set()
+
+def test_handler_colgado_en_el_pool_nuevo_reinicia_otra_vez():
+    sup = Supervisor()
+    tracker = HandlerTracker(sup, "handlers")
+    submit, restart = _pool_workers()
+    sup.register("handlers", TIMEOUT, busy=tracker.in_flight, restart=tracker.restart_with(restart))
+    release = threading.Event()
+    started = [threading.Event(), threading.Event()]
+    def colgado(i):
+        started[i].set()
+        release.wait(10)
+    t0 = time.monotonic()
+    submit(tracker.wrap(colgado), 0)
+    assert started[0].wait(5)
+    sup.check(now=t0)
+    assert len(sup.check(now=t0 + TIMEOUT + 1)) == 1
+    submit(tracker.wrap(colgado), 1)
+    assert started[1].wait(5)
+    assert tracker.in_flight() == 1
+    sup.check(now=t0 + TIMEOUT + 2)
+    assert len(sup.check(now=t0 + 2 * TIMEOUT + 4)) == 1
+    assert sup.status()["handlers"]["restarts"] == 2
+    release.set()
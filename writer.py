@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# writer.py
+# Escrituras agrupadas (group commit) sobre database.ConnectionPool:
+# - Los handlers encolan escrituras pequeñas (UPDATE/INSERT/DELETE) y siguen
+# - Un hilo las aplica en lotes: una transacción (un solo COMMIT) por lote, cada
+#   max_delay segundos o cada max_batch escrituras, lo que llegue antes
+# - Durabilidad acotada: lo encolado queda confirmado en ~max_delay; execute()
+#   espera al COMMIT si el llamador necesita el resultado
+# - Orden FIFO: las escrituras se aplican en el orden en que se encolaron
+# - Si una sentencia falla, el lote se repite de una en una: las demás no se pierden
+# - Sin start() (benchmarks, scripts) cada escritura va directa a la base
+#
+# Uso:
+#   writer = GroupCommitWriter(db, max_delay=0.05)
+#   writer.start()
+#   writer.submit("UPDATE inversiones SET ocr_ok=? WHERE id=?", (1, inv_id))
+#   rowcount, lastrowid = writer.execute("INSERT ...", params)   # bloquea hasta el COMMIT
+
+import threading
+import time
+import traceback
+from collections import deque
+
+
+class _Write:
+    __slots__ = ("sql", "params", "on_done", "ts", "event", "result", "error")
+
+    def __init__(self, sql, params, on_done):
+        self.sql = sql
+        self.params = params
+        self.on_done = on_done
+        self.ts = time.monotonic()
+        self.event = None
+        self.result = None
+        self.error = None
+
+
+class GroupCommitWriter:
+    def __init__(self, db, max_delay=0.05, max_batch=500):
+        self.db = db
+        self.max_delay = float(max_delay)
+        self.max_batch = int(max_batch)
+        self._cv = threading.Condition()
+        self._queue = deque()
+        self._in_flight = 0
+        self._started = False
+        self.metrics = {"writes": 0, "batches": 0, "failed": 0, "split": 0, "batch_max": 0, "delay_max": 0.0}
+
+    # ---------------- API ----------------
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._loop, name="db-writer", daemon=True).start()
+
+    def submit(self, sql, params=(), on_done=None):
+        """
+        Encola la escritura y vuelve de inmediato. on_done(error) se llama
+        desde el hilo escritor tras el COMMIT (error None si fue bien).
+        """
+        w = _Write(sql, params, on_done)
+        if not self._started:
+            self._apply_one(w)
+            self._finish([w])
+            return w
+        with self._cv:
+            self._queue.append(w)
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cv.notify()
+        return w
+
+    def execute(self, sql, params=()):
+        """Como db.execute pero dentro del siguiente lote: espera al COMMIT. Devuelve (rowcount, lastrowid)."""
+        w = _Write(sql, params, None)
+        if not self._started:
+            self._apply_one(w)
+        else:
+            w.event = threading.Event()
+            with self._cv:
+                self._queue.append(w)
+                self._cv.notify()
+            w.event.wait()
+        if w.error is not None:
+            raise w.error
+        return w.result
+
+    def depth(self):
+        with self._cv:
+            return len(self._queue)
+
+    def stats(self):
+        with self._cv:
+            m = dict(self.metrics)
+            m["queued"] = len(self._queue)
+        m["batch_avg"] = m["writes"] / m["batches"] if m["batches"] else 0.0
+        return m
+
+    def flush(self, timeout=30):
+        """Espera a que todo lo encolado esté confirmado. True si se vació."""
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            with self._cv:
+                if not self._queue and not self._in_flight:
+                    return True
+            time.sleep(0.005)
+        return False
+
+    # ---------------- hilo escritor ----------------
+    def _next_batch(self):
+        with self._cv:
+            while not self._queue:
+                self._cv.wait()
+            # esperar a que se llene el lote o venza el plazo del más antiguo
+            deadline = self._queue[0].ts + self.max_delay
+            while len(self._queue) < self.max_batch:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                self._cv.wait(wait)
+            n = min(len(self._queue), self.max_batch)
+            batch = [self._queue.popleft() for _ in range(n)]
+            self._in_flight = n
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._apply(batch)
+            except Exception:
+                traceback.print_exc()
+            self._finish(batch)
+            with self._cv:
+                self._in_flight = 0
+
+    def _apply(self, batch):
+        try:
+            with self.db.transaction() as cur:
+                for w in batch:
+                    cur.execute(w.sql, w.params)
+                    w.result = (cur.rowcount, cur.lastrowid)
+            return
+        except Exception:
+            if len(batch) == 1:
+                return self._apply_one(batch[0])
+        # alguna sentencia falló y el lote se deshizo: de una en una
+        with self._cv:
+            self.metrics["split"] += 1
+        for w in batch:
+            self._apply_one(w)
+
+    def _apply_one(self, w):
+        try:
+            w.result = self.db.execute(w.sql, w.params)
+            w.error = None
+        except Exception as e:
+            w.result, w.error = None, e
+
+    def _finish(self, batch):
+        now = time.monotonic()
+        with self._cv:
+            self.metrics["batches"] += 1
+            self.metrics["writes"] += len(batch)
+            self.metrics["batch_max"] = max(self.metrics["batch_max"], len(batch))
+            self.metrics["delay_max"] = max(self.metrics["delay_max"], now - batch[0].ts)
+            self.metrics["failed"] += sum(1 for w in batch if w.error is not None)
+        for w in batch:
+            if w.event is not None:
+                w.event.set()
+            elif w.error is not None and w.on_done is None:
+                print(f"⚠️ Escritura agrupada fallida: {w.error} ({w.sql[:80]})")
+            if w.on_done is not None:
+                try:
+                    w.on_done(w.error)
+                except Exception:
+                    traceback.print_exc()